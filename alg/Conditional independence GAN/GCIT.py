@@ -2,6 +2,7 @@ import tensorflow as tf
 import numpy as np
 import matplotlib.pyplot as plt
 from scipy import stats
+from ci_testing import generate_null_samples, null_statistics
 
 def GCIT(x_train, y_train, z_train, statistic = "corr", lamda = 10, normalize=True, verbose=False, n_iter=1000, debug=False):
 
@@ -272,32 +273,22 @@ def GCIT(x_train, y_train, z_train, statistic = "corr", lamda = 10, normalize=Tr
     #return X_CI, [WD_loss_curr, M_loss_curr]
 
     n_samples = 1000
-    rho = []
-    #y_train = y_train.reshape(len(y_train))
 
-    if statistic == "corr":
-        stat = correlation
-    if statistic == "mmd":
-        stat = mmd_squared
-    if statistic == "kolmogorov":
-        stat = kolmogorov
-    if statistic == "wilcox":
-        stat = wilcox
+    # all null samples in a few batched generator passes, observed and null statistics in one batch
+    def sample_x(z_rep):
+        return sess.run(G_sample, feed_dict={Z: z_rep, V: sample_V(len(z_rep), v_dim)})
 
-    for sample in range(n_samples):
-        x_hat = sess.run([G_sample], feed_dict={X: x_train, Z: z_train, V: sample_V(n, v_dim)})[0]
-        #x_hat = x_hat.reshape(len(x_hat))
+    x_hats = generate_null_samples(sample_x, z_train, n_samples)
+    x_hat = x_hats[-1].reshape(-1, 1)
+    rho_obs, rho = null_statistics(statistic, x_train.reshape(len(x_train)), x_hats, y_train)
 
-        rho.append(stat(x_hat, y_train))
-
-
-    p_value = sum(stat(x_train.reshape(len(x_train)), y_train)>rho)/n_samples
+    p_value = np.sum(rho_obs > rho) / n_samples
 
     if debug:
         print('Statistics of x_hat ', stats.describe(x_hat))
         print('Statistics of x_train ',stats.describe(x_train))
         print('Statistics of generated rho ', stats.describe(rho))
-        print('Observed rho',stat(x_train.reshape(len(x_train)), y_train))
+        print('Observed rho', rho_obs)
 
     if p_value>0.975:
         p_value = 1 - p_value
@@ -0,0 +1,358 @@
+"""
+Parallel orchestrator for the experiments in run.sh.
+
+The training sweeps (seir-loop.py, seir_loop_new.py, ablation_loop.py) are expanded into independent
+(script, country, seed, config) tasks and fitted across a local process pool. Every finished fit is written to a single
+sqlite store indexed by the task key; a task already present in the store is skipped, so an interrupted run can simply
+be restarted. A failed fit (including out-of-memory and CUDA errors) is not marked done: its attempts are counted and it
+is retried, in the same run and in later runs, until it has failed --retries times. The analysis scripts (prediction_*,
+benchmark_*, counterfactuals, model selection) read the legacy Loop{days}/ and AblationLoop{days}/ pickles, so the
+store is exported to that layout before they are run, also in parallel. A script is rerun whenever the set of finished
+fits differs from the one its last run used.
+
+Usage:
+    python orchestrator.py --workers 16                  # fit everything, export, run the analysis scripts
+    python orchestrator.py --stage fit --sweep ablation_loop
+    python orchestrator.py --stage export --prefix trained_models/
+    python orchestrator.py --kernel inducing --n_inducing 200 --time_kernel toeplitz
+"""
+import argparse
+import hashlib
+import os
+import pickle
+import sqlite3
+import subprocess
+import sys
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+COUNTRIES = [
+    'United Kingdom', 'Italy', 'Germany', 'Spain', 'US', 'France', 'Belgium', 'Korea, South', 'Brazil', 'Iran',
+    'Netherlands', 'Canada', 'Turkey', 'Romania', 'Portugal', 'Sweden', 'Switzerland', 'Ireland', 'Hungary', 'Denmark',
+    'Austria', 'Mexico', 'India', 'Ecuador', 'Russia', 'Peru', 'Indonesia', 'Poland', 'Philippines', 'Japan', 'Pakistan'
+]
+
+COUNTRIES_NEW = [c for c in COUNTRIES if c != 'Belgium'] + ['South Africa', 'Egypt', 'Norway']
+
+COUNTRIES_ABLATION = [
+    'United Kingdom', 'Italy', 'Germany', 'Spain', 'US', 'France', 'Korea, South', 'Brazil', 'Iran', 'Netherlands',
+    'Sweden', 'Mexico', 'India', 'Russia', 'Japan', 'South Africa', 'Egypt', 'Norway'
+]
+
+# country=None means that all countries of the sweep are fitted jointly in one task
+SWEEPS = {
+    'seir-loop': dict(countries=COUNTRIES, joint=True, seeds=range(15), days=[14, 28, 42],
+                      out_dir='Loop{days}', model_id='day-{days}-rng-{seed}', rmse=True),
+    # fits on all the data (seir-loop.py --days 0) for UK-counterfactuals.py and France-counterfactuals.py, the
+    # latter selects among 25 seeds; with nothing held out there is no RMSE
+    'seir-loop-day0': dict(countries=COUNTRIES, joint=True, seeds=range(25), days=[0],
+                           out_dir='Loop{days}', model_id='day-{days}-rng-{seed}', rmse=False),
+    'seir_loop_new': dict(countries=COUNTRIES_NEW, joint=True, seeds=range(25), days=[14],
+                          out_dir='Loop{days}', model_id='all-countries-new-day-{days}-rng-{seed}', rmse=True),
+    'ablation_loop': dict(countries=COUNTRIES_ABLATION, joint=False, seeds=range(10), days=[14],
+                          out_dir='AblationLoop{days}', model_id='{country}-ablation-day-{days}-rng-{seed}', rmse=False),
+}
+
+ANALYSIS_SCRIPTS = [
+    'prediction_table1.py', 'benchmark_table1.py',
+    'prediction_day14.py', 'benchmark_day14.py', 'prediction_day30.py', 'benchmark_day30.py',
+    'UK-counterfactuals.py', 'France-counterfactuals.py',
+    'ModelSelection-Ablation-ManyCountries.py', 'ModelSelection-R0.py',
+]
+
+Task = namedtuple('Task', ['script', 'country', 'seed', 'config'])
+
+
+def expand_tasks(sweeps=None, seeds=None, kernel='dense', n_inducing=100, time_kernel='dense'):
+    """
+    Expand the sweeps into (script, country, seed, config) tasks. `config` is a sorted tuple of (key, value). The
+    CGP kernel options only enter `config` when they differ from the dense default, so existing stores stay valid.
+    """
+    kernels = {}
+    if kernel != 'dense':
+        kernels.update(kernel=kernel, n_inducing=n_inducing)
+    if time_kernel != 'dense':
+        kernels.update(time_kernel=time_kernel)
+    tasks = []
+    for script in (sweeps or SWEEPS):
+        spec = SWEEPS[script]
+        for days in spec['days']:
+            config = tuple(sorted(dict(days=days, n_sample=500, niter=2000, pad=24, **kernels).items()))
+            for seed in (spec['seeds'] if seeds is None else seeds):
+                if spec['joint']:
+                    tasks.append(Task(script, None, seed, config))
+                else:
+                    tasks.extend(Task(script, country, seed, config) for country in spec['countries'])
+    return tasks
+
+
+def task_key(task):
+    return task.script, task.country or '', task.seed, repr(task.config)
+
+
+def model_id(task):
+    spec = SWEEPS[task.script]
+    return spec['model_id'].format(country=task.country, seed=task.seed, **dict(task.config))
+
+
+class ResultStore(object):
+    """
+    One sqlite file holding all fitted results. Each row is one (task, name) pair with a pickled value; a row in the
+    `done` table is the completion marker of a task. Failed attempts are counted in the `failures` table, which never
+    marks a task done.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute('CREATE TABLE IF NOT EXISTS results (script TEXT, country TEXT, seed INTEGER, config TEXT, '
+                          'name TEXT, value BLOB, PRIMARY KEY (script, country, seed, config, name))')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS done (script TEXT, country TEXT, seed INTEGER, config TEXT, '
+                          'status TEXT, seconds REAL, PRIMARY KEY (script, country, seed, config))')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS failures (script TEXT, country TEXT, seed INTEGER, config TEXT, '
+                          'attempts INTEGER, error TEXT, PRIMARY KEY (script, country, seed, config))')
+        self.conn.commit()
+
+    def is_done(self, task):
+        # stores written before failures were tracked separately may hold failed tasks in `done`
+        cur = self.conn.execute("SELECT 1 FROM done WHERE script=? AND country=? AND seed=? AND config=? "
+                                "AND status='ok'", task_key(task))
+        return cur.fetchone() is not None
+
+    def put(self, task, results, status='ok', seconds=0.):
+        key = task_key(task)
+        with self.conn:
+            for name, value in results.items():
+                self.conn.execute('INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?)',
+                                  key + (name, sqlite3.Binary(value)))
+            self.conn.execute('INSERT OR REPLACE INTO done VALUES (?, ?, ?, ?, ?, ?)', key + (status, seconds))
+            self.conn.execute('DELETE FROM failures WHERE script=? AND country=? AND seed=? AND config=?', key)
+
+    def attempts(self, task):
+        """Number of failed attempts of a task that is not done yet."""
+        cur = self.conn.execute('SELECT attempts FROM failures WHERE script=? AND country=? AND seed=? AND config=?',
+                                task_key(task))
+        row = cur.fetchone()
+        return 0 if row is None else row[0]
+
+    def put_failure(self, task, error):
+        attempts = self.attempts(task) + 1
+        with self.conn:
+            self.conn.execute('INSERT OR REPLACE INTO failures VALUES (?, ?, ?, ?, ?, ?)',
+                              task_key(task) + (attempts, error))
+        return attempts
+
+    def fingerprint(self, tasks):
+        """Hash of the finished tasks among `tasks`; it changes whenever another fit completes."""
+        done = sorted(repr(task_key(t)) for t in tasks if self.is_done(t))
+        return hashlib.sha1('\n'.join(done).encode()).hexdigest()
+
+    def get(self, task, name):
+        cur = self.conn.execute('SELECT value FROM results WHERE script=? AND country=? AND seed=? AND config=? '
+                                'AND name=?', task_key(task) + (name,))
+        row = cur.fetchone()
+        return None if row is None else pickle.loads(row[0])
+
+    def items(self, task):
+        cur = self.conn.execute('SELECT name, value FROM results WHERE script=? AND country=? AND seed=? AND config=?',
+                                task_key(task))
+        return cur.fetchall()
+
+    def export(self, tasks, prefix=''):
+        """Write the legacy per-task files read by the analysis scripts, e.g. Loop14/day-14-rng-3-samples.pkl."""
+        n = 0
+        for task in tasks:
+            out_dir = prefix + SWEEPS[task.script]['out_dir'].format(**dict(task.config))
+            if not os.path.exists(out_dir):
+                os.makedirs(out_dir)
+            for name, value in self.items(task):
+                path = os.path.join(out_dir, '{}-{}'.format(model_id(task), name))
+                if name == 'rmse.csv':
+                    pickle.loads(value).to_csv(path)
+                else:
+                    # values are stored pickled, i.e. exactly as the training scripts write them
+                    with open(path, 'wb') as f:
+                        f.write(value)
+                n += 1
+        return n
+
+
+def fit_task(task):
+    """Fit one CGP model; returns {file name: pickled value} in the legacy naming of the training scripts."""
+    import pandas as pds
+    import pyro
+    import torch
+    from pyro.ops.stats import quantile
+
+    import data_loader
+    import pyro_model.helper
+    import pyro_model.seir_gp
+    from forecast import Forecaster
+
+    # one BLAS thread per worker, the pool provides the parallelism
+    torch.set_num_threads(1)
+
+    spec = SWEEPS[task.script]
+    config = dict(task.config)
+    days = config['days']
+    countries = spec['countries'] if spec['joint'] else [task.country]
+
+    data_dict = data_loader.get_data_pyro(countries, smart_start=False, pad=config['pad'])
+    data_dict = pyro_model.helper.smooth_daily(data_dict)
+    train_len = data_dict['cum_death'].shape[0] - days
+
+    covariates_notime = pyro_model.helper.get_covariates_intervention(data_dict, train_len, notime=True)
+    Y_train = pyro_model.helper.get_Y(data_dict, train_len)
+    total_len = len(data_dict['date_list'])
+    covariates_full_notime = pyro_model.helper.get_covariates_intervention(data_dict, total_len, notime=True)
+    Y_daily = data_dict['daily_death']
+
+    pyro.set_rng_seed(task.seed)
+    pyro.clear_param_store()
+
+    model = pyro_model.seir_gp.CGP(data_dict, mask_size=14, kernel=config.get('kernel', 'dense'),
+                                   n_inducing=config.get('n_inducing', 100),
+                                   time_kernel=config.get('time_kernel', 'dense'))
+    forecaster = Forecaster(model, Y_train, covariates_notime, learning_rate=0.01, num_steps=config['niter'])
+    results = {'forecaster.csv' if spec['joint'] else 'forecaster.pkl': pickle.dumps(forecaster)}
+
+    samples = forecaster(Y_train, covariates_full_notime, num_samples=config['n_sample'], batch_size=50)
+    samples = samples[:, 0, ...]
+    init = Y_train[-1, :][None, None, :]
+    init = init.repeat(samples.shape[0], 1, 1)
+    samples = torch.cat([init, samples], dim=1)
+
+    if spec['rmse']:
+        daily_s = samples[:, 1:, :] - samples[:, :-1, :]
+        p10, p50, p90 = quantile(daily_s, (0.1, 0.5, 0.9), dim=0).squeeze(-1)
+        rmse = torch.sqrt(torch.mean((p50[-days:, :] - Y_daily[-days:, :]) ** 2, dim=0)).squeeze().numpy()
+        off = (torch.sum(p50[-days:, :], dim=0) - torch.sum(Y_daily[-days:, :], dim=0)).squeeze().numpy()
+        df = pds.DataFrame(data={'countries': countries, 'rmse': rmse, 'total_error': off})
+        results['rmse.csv'] = pickle.dumps(df)
+
+    results['samples.pkl'] = pickle.dumps(samples.detach().numpy())
+    R0low, R0mid, R0high, map_estimates = model.get_R0(forecaster, Y_train, covariates_full_notime,
+                                                       config['n_sample'], 50)
+    results['map.pkl'] = pickle.dumps(map_estimates)
+
+    with torch.no_grad():
+        predictor = pyro.infer.predictive.Predictive(forecaster.model, guide=forecaster.guide, num_samples=100)
+        res = predictor(Y_train, covariates_notime)
+    results['predictive.pkl'] = pickle.dumps(res)
+    return results
+
+
+def _run_fit(task, fit=fit_task):
+    start = time.time()
+    try:
+        results = fit(task)
+        status = 'ok'
+    except Exception as e:
+        # Cholesky, out-of-memory and CUDA errors alike: the task is recorded as a failed attempt and retried
+        results = {}
+        status = 'failed: {}: {}'.format(type(e).__name__, e)
+    return task, results, status, time.time() - start
+
+
+def _run_script(script):
+    start = time.time()
+    env = dict(os.environ, OMP_NUM_THREADS='1', MKL_NUM_THREADS='1')
+    proc = subprocess.run([sys.executable, '-u', script], stdout=subprocess.PIPE, stderr=subprocess.STDOUT, env=env)
+    return script, proc.returncode, proc.stdout, time.time() - start
+
+
+def _pool_fits(todo, workers, fit):
+    """Yield (task, results, status, seconds) as the fits finish; `results` is None for tasks lost to a dead worker."""
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(_run_fit, t, fit): t for t in todo}
+        for future in as_completed(futures):
+            try:
+                yield future.result()
+            except BrokenProcessPool as e:
+                # a worker was killed (e.g. by the OOM killer); every task still in the pool fails with it
+                yield futures[future], None, 'failed: {!r}'.format(e), 0.
+            except Exception as e:
+                # e.g. the results could not be pickled
+                yield futures[future], {}, 'failed: {!r}'.format(e), 0.
+
+
+def run_fits(store, tasks, workers, retries=3, fit=fit_task):
+    """
+    Fit every task that is not done and has failed fewer than `retries` times. Failed tasks are resubmitted until they
+    run out of attempts. When a worker dies, the tasks lost with its pool are not charged an attempt but rerun one pool
+    each, so that only the task that kills its worker is counted.
+    """
+    pending = [t for t in tasks if not store.is_done(t)]
+    todo = [t for t in pending if store.attempts(t) < retries]
+    print('{} of {} fit tasks already done, {} given up after {} attempts, running {}'.format(
+        len(tasks) - len(pending), len(tasks), len(pending) - len(todo), retries, len(todo)))
+    isolate = False
+    while todo:
+        failed, crashed, n = [], [], 0
+        for group in ([[t] for t in todo] if isolate else [todo]):
+            for task, results, status, seconds in _pool_fits(group, workers, fit):
+                n += 1
+                if status == 'ok':
+                    store.put(task, results, status, seconds)
+                elif results is None and not isolate:
+                    crashed.append(task)
+                    status = '{} (rerun in a separate pool)'.format(status)
+                else:
+                    attempts = store.put_failure(task, status)
+                    status = '{} (attempt {} of {})'.format(status, attempts, retries)
+                    if attempts < retries:
+                        failed.append(task)
+                print('[{}/{}] {} {} seed {} {}: {} ({:.0f}s)'.format(n, len(todo), task.script, task.country or 'all',
+                                                                     task.seed, dict(task.config), status, seconds))
+        todo, isolate = crashed + failed, len(crashed) > 0
+
+
+def run_analysis(store, scripts, workers, fits, log_dir='logs'):
+    """Run the analysis scripts that have not yet succeeded on the current set of finished fits among `fits`."""
+    if not os.path.exists(log_dir):
+        os.makedirs(log_dir)
+    # the completion marker of a script is keyed on the fits it has read
+    config = (('fits', store.fingerprint(fits)),)
+    todo = [s for s in scripts if not store.is_done(Task(s, None, 0, config))]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(_run_script, s): s for s in todo}
+        for future in as_completed(futures):
+            try:
+                script, returncode, output, seconds = future.result()
+                status = 'ok' if returncode == 0 else 'failed: exit code {}'.format(returncode)
+            except Exception as e:
+                script, returncode, output, seconds = futures[future], None, b'', 0.
+                status = 'failed: {!r}'.format(e)
+            with open(os.path.join(log_dir, os.path.basename(script) + '.log'), 'wb') as f:
+                f.write(output)
+            if returncode == 0:
+                store.put(Task(script, None, 0, config), {'log': pickle.dumps(output)}, status, seconds)
+            print('{}: {} ({:.0f}s)'.format(script, status, seconds))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser('CGP orchestrator')
+    parser.add_argument('--stage', type=str, default='all', choices=['all', 'fit', 'export', 'analysis'])
+    parser.add_argument('--sweep', type=str, nargs='*', default=None, choices=sorted(SWEEPS))
+    parser.add_argument('--seeds', type=int, nargs='*', default=None)
+    parser.add_argument('--scripts', type=str, nargs='*', default=ANALYSIS_SCRIPTS)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--retries', type=int, default=3, help='attempts per fit task before it is given up')
+    parser.add_argument('--store', type=str, default='results.db')
+    parser.add_argument('--prefix', type=str, default='trained_models/')
+    parser.add_argument('--kernel', type=str, default='dense', choices=['dense', 'inducing'])
+    parser.add_argument('--n_inducing', type=int, default=100)
+    parser.add_argument('--time_kernel', type=str, default='dense', choices=['dense', 'toeplitz'])
+    args = parser.parse_args()
+
+    store = ResultStore(args.store)
+    tasks = expand_tasks(args.sweep, args.seeds, args.kernel, args.n_inducing, args.time_kernel)
+
+    if args.stage in ('all', 'fit'):
+        run_fits(store, tasks, args.workers, args.retries)
+    if args.stage in ('all', 'export'):
+        print('exported {} files to {}'.format(store.export(tasks, args.prefix), args.prefix or '.'))
+    if args.stage in ('all', 'analysis'):
+        run_analysis(store, args.scripts, args.workers, tasks)
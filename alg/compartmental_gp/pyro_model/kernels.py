@@ -0,0 +1,217 @@
+"""
+Structured RBF kernels for the CGP model.
+
+The dense kernels built by `helper.tensor_RBF` need O(n^2) memory and O(n^3) Cholesky time, where n is the number
+of (country, day) pairs. The classes below keep the kernel in a structured form and only expose the operations the
+model needs: matrix-vector products, solves, log-determinants and a square root for reparameterised sampling.
+
+    ToeplitzRBF         regularly spaced 1-d grid (e.g. days), O(t log t) products, O(t^2) solve / logdet
+    InducingPointRBF    arbitrary covariates, Nystrom approximation with m inducing points, O(n m^2)
+
+ToeplitzMultivariateNormal is the zero-mean Gaussian over a day grid used for the output noise GP of CGP.
+"""
+import math
+
+import pyro.distributions as dist
+import torch
+import torch.fft
+from torch.distributions import constraints
+
+
+def rbf(l, v, x1, x2):
+    # l, v: ..., 1, 1
+    # x1: n, p; x2: m, p
+    x1 = x1 / l
+    x2 = x2 / l
+
+    # ..., n, 1 and ..., 1, m
+    x1_2 = (x1 ** 2).sum(-1, keepdim=True)
+    x2_2 = (x2 ** 2).sum(-1, keepdim=True).transpose(-1, -2)
+
+    # ..., n, m
+    r2 = (x1_2 - 2 * x1 @ x2.transpose(-1, -2) + x2_2).clamp(min=0)
+    return v * torch.exp(-0.5 * r2)
+
+
+class ToeplitzRBF(object):
+    """
+    RBF kernel on the regular grid 0, step, ..., (t - 1) * step plus `jitter` on the diagonal.
+
+    Only the first column of the kernel matrix is stored. `l` and `v` have shape (..., 1); the kernel has batch
+    shape (...).
+    """
+
+    def __init__(self, l, v, t, step=1., jitter=0.):
+        grid = torch.arange(t).to(l) * step
+        # ..., t
+        column = v * torch.exp(-0.5 * (grid / l) ** 2)
+        self.column = torch.cat([column[..., :1] + jitter, column[..., 1:]], dim=-1)
+        self.t = t
+
+    @classmethod
+    def from_column(cls, column):
+        # column: ..., t, the first column of the kernel matrix (jitter included)
+        kernel = cls.__new__(cls)
+        kernel.column = column
+        kernel.t = column.size(-1)
+        return kernel
+
+    def to_dense(self):
+        idx = torch.arange(self.t, device=self.column.device)
+        dist = (idx[:, None] - idx[None, :]).abs()
+        return self.column[..., dist]
+
+    def diag(self):
+        return self.column[..., :1].expand(self.column.shape[:-1] + (self.t,))
+
+    def matmul(self, rhs):
+        # rhs: ..., t, k
+        if self.t == 1:
+            return self.column[..., None] * rhs
+
+        # embed into a circulant matrix of size 2t - 2 and multiply in the Fourier domain
+        n = 2 * self.t - 2
+        circulant = torch.cat([self.column, self.column[..., 1:-1].flip(-1)], dim=-1)
+        f_col = torch.fft.rfft(circulant, n=n)
+        f_rhs = torch.fft.rfft(rhs.transpose(-1, -2), n=n)
+        res = torch.fft.irfft(f_col[..., None, :] * f_rhs, n=n)[..., :self.t]
+        return res.transpose(-1, -2)
+
+    def _levinson(self, rhs=None):
+        # Levinson-Durbin recursion (Golub & Van Loan, Alg. 4.7.2) on the normalised kernel
+        c0 = self.column[..., :1]
+        r = self.column[..., 1:] / c0
+        batch_shape = self.column.shape[:-1]
+
+        logdet = self.t * torch.log(c0[..., 0])
+        beta = torch.ones(batch_shape).to(r)
+        y = -r[..., :1]
+        alpha = -r[..., 0] if self.t > 1 else None
+
+        x = None
+        if rhs is not None:
+            # ..., t, k
+            b = rhs / c0[..., None]
+            x = b[..., :1, :]
+
+        for k in range(1, self.t):
+            beta = (1. - alpha ** 2) * beta
+            logdet = logdet + torch.log(beta)
+            if x is not None:
+                # ..., k
+                r_k = r[..., :k]
+                mu = (b[..., k, :] - (r_k[..., None] * x.flip(-2)).sum(-2)) / beta[..., None]
+                x = torch.cat([x + mu[..., None, :] * y.flip(-1)[..., None], mu[..., None, :]], dim=-2)
+            if k < self.t - 1:
+                alpha = (-r[..., k] - (r[..., :k] * y.flip(-1)).sum(-1)) / beta
+                y = torch.cat([y + alpha[..., None] * y.flip(-1), alpha[..., None]], dim=-1)
+        return x, logdet
+
+    def logdet(self):
+        return self._levinson()[1]
+
+    def solve(self, rhs):
+        return self._levinson(rhs)[0]
+
+
+class InducingPointRBF(object):
+    """
+    Nystrom approximation K ~ K_xu K_uu^-1 K_ux + jitter * I of the RBF kernel over arbitrary covariates.
+
+    `l` and `v` have shape (..., 1, 1) and `x` has shape (n, p). The inducing points are `n_inducing` rows of `x`
+    taken at a regular stride, unless `z` is given explicitly. Only the n x m root R = K_xu L_uu^-T is stored, so
+    memory is O(n m) and every operation costs at most O(n m^2).
+    """
+
+    def __init__(self, l, v, x, n_inducing=100, jitter=1e-3, z=None, eps=1e-6):
+        if z is None:
+            stride = max(x.size(0) // n_inducing, 1)
+            z = x[::stride][:n_inducing]
+        k_uu = rbf(l, v, z, z)
+        k_uu = k_uu + eps * torch.eye(z.size(0)).to(k_uu)
+        l_uu = torch.linalg.cholesky(k_uu)
+        # ..., n, m
+        k_xu = rbf(l, v, x, z)
+        self.root = torch.linalg.solve_triangular(l_uu, k_xu.transpose(-1, -2), upper=False).transpose(-1, -2)
+        self.jitter = jitter
+        self.n = x.size(0)
+        self._svd = None
+
+    def _inner(self):
+        # ..., m, m: jitter * I + R^T R
+        m = self.root.size(-1)
+        return self.jitter * torch.eye(m).to(self.root) + self.root.transpose(-1, -2) @ self.root
+
+    def diag(self):
+        return (self.root ** 2).sum(-1) + self.jitter
+
+    def matmul(self, rhs):
+        return self.root @ (self.root.transpose(-1, -2) @ rhs) + self.jitter * rhs
+
+    def logdet(self):
+        # matrix determinant lemma
+        m = self.root.size(-1)
+        l_inner = torch.linalg.cholesky(self._inner())
+        logdet_inner = 2 * torch.log(torch.diagonal(l_inner, dim1=-2, dim2=-1)).sum(-1)
+        return logdet_inner + (self.n - m) * math.log(self.jitter)
+
+    def solve(self, rhs):
+        # Woodbury identity
+        l_inner = torch.linalg.cholesky(self._inner())
+        tmp = torch.cholesky_solve(self.root.transpose(-1, -2) @ rhs, l_inner)
+        return (rhs - self.root @ tmp) / self.jitter
+
+    def root_matmul(self, rhs):
+        # symmetric square root: sqrt(jitter) * I + U (sqrt(S^2 + jitter) - sqrt(jitter)) U^T, with R = U S V^T,
+        # so that root_matmul(standard normal) has covariance exactly jitter * I + R R^T
+        if self._svd is None:
+            u, s, _ = torch.linalg.svd(self.root, full_matrices=False)
+            self._svd = (u, torch.sqrt(s ** 2 + self.jitter) - math.sqrt(self.jitter))
+        u, s = self._svd
+        return u @ (s[..., None] * (u.transpose(-1, -2) @ rhs)) + math.sqrt(self.jitter) * rhs
+
+    def to_dense(self):
+        return self.root @ self.root.transpose(-1, -2) + self.jitter * torch.eye(self.n).to(self.root)
+
+
+class ToeplitzMultivariateNormal(dist.TorchDistribution):
+    """
+    Zero-mean multivariate normal over a regular grid with a ToeplitzRBF covariance.
+
+    `log_prob` runs the Levinson recursion of the kernel, so the O(t^3) Cholesky factor of the dense distribution is
+    never computed during training. The dense covariance is only formed to draw samples and, through
+    `covariance_matrix`, when forecasting conditions on the observed prefix.
+    """
+    arg_constraints = {}
+    support = constraints.real_vector
+    has_rsample = True
+
+    def __init__(self, kernel, validate_args=None):
+        self.kernel = kernel
+        super().__init__(kernel.column.shape[:-1], (kernel.t,), validate_args=validate_args)
+
+    @property
+    def loc(self):
+        return self.kernel.column.new_zeros(self.batch_shape + self.event_shape)
+
+    @property
+    def covariance_matrix(self):
+        return self.kernel.to_dense().expand(self.batch_shape + self.event_shape + self.event_shape)
+
+    def expand(self, batch_shape, _instance=None):
+        column = self.kernel.column.expand(torch.Size(batch_shape) + self.event_shape)
+        return ToeplitzMultivariateNormal(ToeplitzRBF.from_column(column), validate_args=False)
+
+    def rsample(self, sample_shape=torch.Size()):
+        shape = self._extended_shape(sample_shape)
+        eps = torch.randn(shape + (1,), dtype=self.kernel.column.dtype, device=self.kernel.column.device)
+        scale_tril = torch.linalg.cholesky(self.kernel.to_dense())
+        return (scale_tril @ eps)[..., 0]
+
+    def log_prob(self, value):
+        if self._validate_args:
+            self._validate_sample(value)
+        # ..., t, 1
+        x, logdet = self.kernel._levinson(value[..., None])
+        maha = (value * x[..., 0]).sum(-1)
+        return -0.5 * (maha + logdet + self.kernel.t * math.log(2 * math.pi))
@@ -6,6 +6,7 @@ from pyro.ops.stats import quantile
 
 import forecast
 import pyro_model.helper
+import pyro_model.kernels
 
 
 def gumbel_softmax(logits, dim=-1, temperature=0.1, eps=1e-9):
@@ -20,8 +21,20 @@ def gumbel_softmax(logits, dim=-1, temperature=0.1, eps=1e-9):
 
 class CGP(forecast.ForecastingModel):
 
-    def __init__(self, data_dict, dtype=torch.float, mask_size=14):
+    def __init__(self, data_dict, dtype=torch.float, mask_size=14, kernel='dense', n_inducing=100,
+                 time_kernel='dense'):
+        # kernel: 'dense' builds the full (d x t) x (d x t) covariance of the R0 GP and takes its Cholesky factor;
+        # 'inducing' uses a Nystrom approximation with n_inducing points (see pyro_model.kernels)
+        # time_kernel: 'dense' builds the t x t covariance of the output noise GP and takes its Cholesky factor;
+        # 'toeplitz' keeps its first column only and evaluates the likelihood with the Levinson recursion
         super().__init__()
+        if kernel not in ('dense', 'inducing'):
+            raise ValueError("kernel must be 'dense' or 'inducing', got %s" % kernel)
+        if time_kernel not in ('dense', 'toeplitz'):
+            raise ValueError("time_kernel must be 'dense' or 'toeplitz', got %s" % time_kernel)
+        self.kernel = kernel
+        self.n_inducing = n_inducing
+        self.time_kernel = time_kernel
         self.n_country = len(data_dict['countries'])
         self.t_init = data_dict['t_init'].to(dtype)
         # d, 1
@@ -31,6 +44,53 @@ class CGP(forecast.ForecastingModel):
         self.log_softmax = torch.nn.LogSoftmax(dim=-1)
         self.softmax = torch.nn.Softmax(dim=-1)
 
+    def r0_weight(self, lengthscale, kernel_var, gp_covariates, iid_n, jitter):
+        # gp_covariates: dxt, 1, p
+        # iid_n: n, 1, dxt, 1
+        if self.kernel == 'inducing':
+            # N, 1, 1, 1
+            lengthscale = lengthscale.reshape(-1, 1, 1, 1)
+            kernel_var = kernel_var.reshape(-1, 1, 1, 1)
+            var = pyro_model.kernels.InducingPointRBF(lengthscale, kernel_var, gp_covariates[:, 0, :],
+                                                      n_inducing=self.n_inducing, jitter=jitter)
+            return torch.sigmoid(var.root_matmul(iid_n))
+
+        d_times_t = gp_covariates.size(0)
+        var = pyro_model.helper.tensor_RBF(lengthscale, kernel_var, gp_covariates)
+        var = var + torch.eye(var.shape[-1]) * jitter
+        assert var.size(-1) == d_times_t
+        assert var.size(-2) == d_times_t
+        assert var.size(-3) == 1
+
+        # N, 1, dxt, dxt
+        A = torch.cholesky(var)
+        return torch.sigmoid(torch.einsum('abij,abjk->abik', A, iid_n))
+
+    def time_noise(self, lengthscale, kernel_var, data_dim, time_dim):
+        # lengthscale, kernel_var: (n), d, 1
+        # returns the distribution of the output noise with batch shape d and event shape t
+        if self.time_kernel == 'toeplitz':
+            # (n), d, t: the kernel is Toeplitz on the day grid, so is its average over the particles
+            column = pyro_model.kernels.ToeplitzRBF(lengthscale, kernel_var, time_dim, jitter=0.01).column
+            column = column.reshape(-1, data_dim, time_dim).mean(dim=0).to(torch.double)
+            return pyro_model.kernels.ToeplitzMultivariateNormal(pyro_model.kernels.ToeplitzRBF.from_column(column))
+
+        time_x = torch.arange(time_dim) * 1.
+        # t, d, 1
+        time_x = time_x[:, None, None].repeat(1, data_dim, 1)
+        time_var = pyro_model.helper.tensor_RBF(lengthscale, kernel_var, time_x)
+        time_var = time_var + torch.eye(time_var.shape[-1]) * 0.01
+
+        if time_var.shape[0] > 1:
+            time_var = torch.mean(time_var, dim=0)
+        else:
+            time_var = time_var[0, ...]
+
+        time_var = time_var.to(torch.double)
+        mean_zero = torch.zeros(time_dim).to(torch.double)
+
+        return dist.MultivariateNormal(mean_zero, time_var)
+
     def model(self, zero_data, covariates):
         data_dim = zero_data.size(-1)
         time_dim = covariates.size(-2)
@@ -59,15 +119,6 @@ class CGP(forecast.ForecastingModel):
         # dxt, 1, p
         gp_covariates = gp_covariates.reshape(d_times_t, 1, gp_covariates.size(-1))
 
-        var = pyro_model.helper.tensor_RBF(gp1_lengthscale, gp1_var, gp_covariates)
-        var = var + torch.eye(var.shape[-1]) * 0.001
-        assert var.size(-1) == d_times_t
-        assert var.size(-2) == d_times_t
-        assert var.size(-3) == 1
-
-        # N, 1, dxt, dxt
-        A = torch.cholesky(var)
-
         with country_plate:
             with self.time_plate:
                 iid_n = pyro.sample("r0_iid_n", dist.Normal(0, 1))
@@ -81,7 +132,7 @@ class CGP(forecast.ForecastingModel):
         iid_n = iid_n.reshape(iid_n.size(0), 1, d_times_t, 1)
 
         # n, 1, dxt, 1
-        weight = torch.sigmoid(torch.einsum('abij,abjk->abik', A, iid_n))
+        weight = self.r0_weight(gp1_lengthscale, gp1_var, gp_covariates, iid_n, 0.001)
         weight = weight[:, 0, ...]  # get rid of batch dimension
         weight = weight.reshape(weight.size(0), data_dim, time_dim, 1)
         if weight.size(0) == 1:
@@ -172,22 +223,7 @@ class CGP(forecast.ForecastingModel):
             gp2_lengthscale = pyro.sample('gp2_lengthscale', dist.Normal(14, 1))
             gp2_var = pyro.sample('gp2_var', dist.Normal(10, 1))
 
-        time_x = torch.arange(time_dim) * 1.
-        # t, d, 1
-        time_x = time_x[:, None, None].repeat(1, data_dim, 1)
-        time_var = pyro_model.helper.tensor_RBF(gp2_lengthscale, gp2_var, time_x)
-        time_var = time_var + torch.eye(time_var.shape[-1]) * 0.01
-
-        if time_var.shape[0] > 1:
-            time_var = torch.mean(time_var, dim=0)
-        else:
-            time_var = time_var[0, ...]
-
-        time_var = time_var.to(torch.double)
-        mean_zero = torch.tensor(0)[None].to(torch.double)
-
-        noise_dist = dist.MultivariateNormal(mean_zero, time_var)
-        noise_dist = forecast.util.MVTNormalTime(noise_dist)
+        noise_dist = forecast.util.MVTNormalTime(self.time_noise(gp2_lengthscale, gp2_var, data_dim, time_dim))
 
         self.predict(noise_dist, prediction)
 
@@ -218,16 +254,12 @@ class CGP(forecast.ForecastingModel):
                 # dxt, 1, p
                 covariates_pyro = covariates_pyro.reshape(d_times_t, 1, covariates_pyro.size(-1))
 
-                var = pyro_model.helper.tensor_RBF(kernel_lengthscale, kernel_var, covariates_pyro)
-                var = var + torch.eye(var.shape[-1]) * 0.01
-                A = torch.cholesky(var)
-
                 iid_n = map_estimates['r0_iid_n']
                 iid_n = torch.cat([iid_n, torch.randn(iid_n.size(0), iid_n.size(1), time_dim - iid_n.size(-1))], dim=-1)
                 iid_n = iid_n.unsqueeze(-1)
                 iid_n = iid_n.reshape(iid_n.size(0), 1, d_times_t, 1)
 
-                weight = torch.sigmoid(torch.einsum('abij,abjk->abik', A, iid_n))
+                weight = self.r0_weight(kernel_lengthscale, kernel_var, covariates_pyro, iid_n, 0.01)
                 weight = weight[:, 0, ...]  # get rid of batch dimension
                 weight = weight.reshape(weight.size(0), data_dim, time_dim, 1)
                 R00 = map_estimates['R00']
@@ -249,5 +281,6 @@ class CGP(forecast.ForecastingModel):
 
 
 class ModelGPSEIRConvCountry(CGP):
-    def __init__(self, data_dict, dtype=torch.float, mask_size=14):
-        super().__init__(data_dict, dtype, mask_size)
+    def __init__(self, data_dict, dtype=torch.float, mask_size=14, kernel='dense', n_inducing=100,
+                 time_kernel='dense'):
+        super().__init__(data_dict, dtype, mask_size, kernel, n_inducing, time_kernel)
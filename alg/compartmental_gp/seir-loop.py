@@ -14,6 +14,9 @@ import os
 
 parser = argparse.ArgumentParser('CGP')
 parser.add_argument('--days', type=str, default='14')
+parser.add_argument('--kernel', type=str, default='dense', choices=['dense', 'inducing'])
+parser.add_argument('--n_inducing', type=int, default=100)
+parser.add_argument('--time_kernel', type=str, default='dense', choices=['dense', 'toeplitz'])
 args = parser.parse_args()
 days = int(args.days)
 
@@ -80,7 +83,8 @@ for seed in range(15):
     pyro.set_rng_seed(seed)
     pyro.clear_param_store()
 
-    model = pyro_model.seir_gp.CGP(data_dict, mask_size=14)
+    model = pyro_model.seir_gp.CGP(data_dict, mask_size=14, kernel=args.kernel, n_inducing=args.n_inducing,
+                                   time_kernel=args.time_kernel)
     try:
         forecaster = Forecaster(model, Y_train, covariates_notime, learning_rate=0.01, num_steps=niter)
     except RuntimeError:
@@ -0,0 +1,91 @@
+import math
+import os
+import sys
+
+import pyro.distributions as dist
+import pytest
+import torch
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import pyro_model.kernels as kernels  # noqa: E402
+import pyro_model.seir_gp as seir_gp  # noqa: E402
+
+
+def dense_rbf(l, v, x, jitter):
+    return kernels.rbf(l, v, x, x) + jitter * torch.eye(x.size(0)).to(x)
+
+
+def test_toeplitz_matches_dense() -> None:
+    torch.manual_seed(0)
+    t = 40
+    l = torch.tensor([[7.], [14.]], dtype=torch.double)
+    v = torch.tensor([[1.], [10.]], dtype=torch.double)
+    kernel = kernels.ToeplitzRBF(l, v, t, jitter=0.01)
+    grid = torch.arange(t, dtype=torch.double)[:, None]
+    dense = torch.stack([dense_rbf(l[i], v[i], grid, 0.01) for i in range(2)])
+    assert torch.allclose(kernel.to_dense(), dense)
+
+    rhs = torch.randn(2, t, 3, dtype=torch.double)
+    assert torch.allclose(kernel.matmul(rhs), dense @ rhs, atol=1e-8)
+    assert torch.allclose(kernel.solve(rhs), torch.linalg.solve(dense, rhs), rtol=1e-6, atol=1e-6)
+    assert torch.allclose(kernel.logdet(), torch.logdet(dense), rtol=1e-8)
+
+
+def test_toeplitz_log_prob_matches_dense() -> None:
+    torch.manual_seed(0)
+    t = 30
+    l = torch.tensor([[5.], [14.], [20.]], dtype=torch.double)
+    v = torch.tensor([[2.], [10.], [9.]], dtype=torch.double)
+    kernel = kernels.ToeplitzRBF(l, v, t, jitter=0.01)
+    toeplitz = kernels.ToeplitzMultivariateNormal(kernel)
+    dense = dist.MultivariateNormal(torch.zeros(t, dtype=torch.double), kernel.to_dense())
+
+    value = torch.randn(4, 3, t, dtype=torch.double)
+    assert toeplitz.batch_shape == dense.batch_shape
+    assert toeplitz.event_shape == dense.event_shape
+    assert torch.allclose(toeplitz.log_prob(value), dense.log_prob(value), rtol=1e-8)
+    assert toeplitz.rsample((5,)).shape == (5, 3, t)
+
+
+def test_inducing_matches_dense() -> None:
+    torch.manual_seed(0)
+    x = torch.randn(60, 2, dtype=torch.double)
+    l = torch.tensor([[1.5]], dtype=torch.double)
+    v = torch.tensor([[2.]], dtype=torch.double)
+    # with every point inducing, the Nystrom approximation is the exact kernel
+    kernel = kernels.InducingPointRBF(l, v, x, n_inducing=60, jitter=0.1, eps=1e-10)
+    dense = dense_rbf(l, v, x, 0.1)
+    assert torch.allclose(kernel.to_dense(), dense, atol=1e-6)
+
+    rhs = torch.randn(60, 3, dtype=torch.double)
+    assert torch.allclose(kernel.matmul(rhs), dense @ rhs, atol=1e-6)
+    assert torch.allclose(kernel.solve(rhs), torch.linalg.solve(dense, rhs), rtol=1e-4, atol=1e-4)
+    assert torch.allclose(kernel.logdet(), torch.logdet(dense), rtol=1e-5)
+    root = kernel.root_matmul(torch.eye(60, dtype=torch.double))
+    assert torch.allclose(root @ root.T, dense, atol=1e-6)
+
+    approx = kernels.InducingPointRBF(l, v, x, n_inducing=10, jitter=0.1)
+    log_prob = dist.MultivariateNormal(torch.zeros(60, dtype=torch.double), approx.to_dense()).log_prob(rhs.T)
+    maha = (rhs * approx.solve(rhs)).sum(0)
+    assert torch.allclose(-0.5 * (maha + approx.logdet() + 60 * math.log(2 * math.pi)), log_prob, rtol=1e-6)
+
+
+@pytest.mark.parametrize('particles', [False, True])
+def test_cgp_time_noise(particles: bool) -> None:
+    torch.manual_seed(0)
+    data_dict = {'countries': ['a', 'b'], 't_init': torch.zeros(2, 1), 'population': [1., 1.]}
+    shape = (3, 2, 1) if particles else (2, 1)
+    lengthscale = 14 + torch.randn(shape)
+    kernel_var = 10 + torch.randn(shape)
+    value = torch.randn(2, 25, dtype=torch.double)
+
+    log_probs = []
+    for time_kernel in ('dense', 'toeplitz'):
+        model = seir_gp.CGP(data_dict, time_kernel=time_kernel)
+        log_probs.append(model.time_noise(lengthscale, kernel_var, 2, 25).log_prob(value))
+    # both kernels are built in single precision before the likelihood is evaluated in double
+    assert torch.allclose(log_probs[0], log_probs[1], rtol=1e-4)
+
+    with pytest.raises(ValueError):
+        seir_gp.CGP(data_dict, time_kernel='kronecker')
@@ -0,0 +1,83 @@
+import os
+import pickle
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import orchestrator  # noqa: E402
+
+
+def _count(path):
+    return len(open(path).read()) if os.path.exists(path) else 0
+
+
+def fake_fit(task):
+    # config carries a scratch directory; every call appends one character to its log file
+    config = dict(task.config)
+    with open(os.path.join(config['dir'], 'calls-{}'.format(task.seed)), 'a') as f:
+        f.write('x')
+    calls = _count(os.path.join(config['dir'], 'calls-{}'.format(task.seed)))
+    if task.seed == 1 and calls == 1:
+        raise MemoryError('out of memory')
+    if task.seed == 2:
+        raise RuntimeError('cholesky failed')
+    if task.seed == 3:
+        # the worker process dies, so future.result() raises BrokenProcessPool
+        os._exit(1)
+    return {'samples.pkl': pickle.dumps(task.seed)}
+
+
+def make_tasks(tmp_path, seeds):
+    config = (('days', 14), ('dir', str(tmp_path)))
+    return [orchestrator.Task('seir-loop', None, seed, config) for seed in seeds]
+
+
+def test_resume_and_retry(tmp_path) -> None:
+    store = orchestrator.ResultStore(str(tmp_path / 'results.db'))
+    tasks = make_tasks(tmp_path, [0, 1, 2])
+    orchestrator.run_fits(store, tasks, workers=1, retries=3, fit=fake_fit)
+
+    # seed 1 recovered on its second attempt, seed 2 is given up after three attempts but never marked done
+    assert [store.is_done(t) for t in tasks] == [True, True, False]
+    assert store.get(tasks[1], 'samples.pkl') == 1
+    assert [store.attempts(t) for t in tasks] == [0, 0, 3]
+    assert [_count(str(tmp_path / 'calls-{}'.format(s))) for s in range(3)] == [1, 2, 3]
+
+    # a restart skips finished tasks and those out of attempts
+    orchestrator.run_fits(store, tasks, workers=1, retries=3, fit=fake_fit)
+    assert [_count(str(tmp_path / 'calls-{}'.format(s))) for s in range(3)] == [1, 2, 3]
+
+    # raising the number of retries retries the failed task again
+    orchestrator.run_fits(store, tasks, workers=1, retries=4, fit=fake_fit)
+    assert _count(str(tmp_path / 'calls-2')) == 4
+    assert store.attempts(tasks[2]) == 4
+    assert not store.is_done(tasks[2])
+
+
+def test_failed_worker_does_not_drop_results(tmp_path) -> None:
+    store = orchestrator.ResultStore(str(tmp_path / 'results.db'))
+    tasks = make_tasks(tmp_path, [3, 0, 4])
+    orchestrator.run_fits(store, tasks, workers=1, retries=2, fit=fake_fit)
+
+    assert [store.is_done(t) for t in tasks] == [False, True, True]
+    assert store.attempts(tasks[0]) == 2
+    assert store.get(tasks[2], 'samples.pkl') == 4
+
+
+def test_analysis_reruns_after_new_fits(tmp_path) -> None:
+    store = orchestrator.ResultStore(str(tmp_path / 'results.db'))
+    runs = tmp_path / 'runs'
+    script = tmp_path / 'analysis.py'
+    script.write_text("open({!r}, 'a').write('x')\n".format(str(runs)))
+    log_dir = str(tmp_path / 'logs')
+    tasks = make_tasks(tmp_path, [0, 4])
+
+    orchestrator.run_fits(store, tasks[:1], workers=1, fit=fake_fit)
+    orchestrator.run_analysis(store, [str(script)], 1, tasks, log_dir)
+    orchestrator.run_analysis(store, [str(script)], 1, tasks, log_dir)
+    assert _count(str(runs)) == 1
+
+    orchestrator.run_fits(store, tasks, workers=1, fit=fake_fit)
+    orchestrator.run_analysis(store, [str(script)], 1, tasks, log_dir)
+    assert _count(str(runs)) == 2
+    assert os.path.exists(os.path.join(log_dir, 'analysis.py.log'))
@@ -14,6 +14,11 @@ class BaseAgent:
     ) -> np.ndarray:
         raise NotImplementedError
 
+    def select_actions(self,
+        states : np.ndarray,
+    ) -> np.ndarray:
+        return np.array([self.select_action(state) for state in states])
+
     def perform_action(self,
         action : np.ndarray,
     ) -> Tuple[np.ndarray, np.float64, bool]:
@@ -45,6 +45,13 @@ class OABaselineAgent(SerializableAgent):
 
         return lifted_action[0]
 
+    def select_actions(self,
+        states : np.ndarray,
+    ) -> np.ndarray:
+        actions, _, _, _ = self.lifted_policy.step(states)
+
+        return actions
+
     def train(self):
         self.lifted_policy, _ = oabase.train(self.args, {})
 
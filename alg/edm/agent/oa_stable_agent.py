@@ -41,6 +41,14 @@ class OAStableAgent(BaseAgent):
 
         return action
 
+    def select_actions(self,
+        states : np.ndarray,
+    ) -> np.ndarray:
+        actions, _ = self.model.predict(states, state = None, \
+            deterministic = self.deterministic)
+
+        return actions
+
     def load_pretrained(self):
         oastable.set_global_seeds(self.args.seed)
 
@@ -1,3 +1,7 @@
+import multiprocessing as mp
 import numpy as np
+import os
+import shutil
+import tempfile
 
-from typing import Dict
+from typing import Dict, List, Tuple
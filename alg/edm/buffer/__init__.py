@@ -1,2 +1,3 @@
-from .base_buffer   import *
-from .replay_buffer import *
+from .base_buffer      import *
+from .replay_buffer    import *
+from .trajectory_store import *
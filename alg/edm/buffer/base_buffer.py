@@ -1,22 +1,53 @@
 from .__head__ import *
 
+def _zeros(
+    shape  : List[int],
+    shared : bool     ,
+    dtype  : type = np.float32,
+) -> np.ndarray:
+    if not shared:
+        return np.zeros(shape, dtype = dtype)
+
+    # anonymous shared memory, so that rollout workers started by fork write into the same arrays
+    raw = mp.RawArray(np.ctypeslib.as_ctypes_type(dtype), int(np.prod(shape)))
+
+    return np.frombuffer(raw, dtype = dtype).reshape(shape)
+
+class _NoLock:
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *args):
+        pass
+
 class BaseBuffer:
     def __init__(self,
-        state_dim  : int,
-        total_size : int,
-        batch_size : int,
+        state_dim  : int        ,
+        total_size : int        ,
+        batch_size : int        ,
+        shared     : bool = False,
     ):
-        self.state_buf      = np.zeros([total_size, state_dim], dtype = np.float32)
-        self.action_buf     = np.zeros([total_size           ], dtype = np.float32)
-        self.reward_buf     = np.zeros([total_size           ], dtype = np.float32)
-        self.next_state_buf = np.zeros([total_size, state_dim], dtype = np.float32)
-        self.done_buf       = np.zeros( total_size            , dtype = np.float32)
+        self.state_buf      = _zeros([total_size, state_dim], shared)
+        self.action_buf     = _zeros([total_size           ], shared)
+        self.reward_buf     = _zeros([total_size           ], shared)
+        self.next_state_buf = _zeros([total_size, state_dim], shared)
+        self.done_buf       = _zeros([total_size           ], shared)
 
         self.total_size = total_size
         self.batch_size = batch_size
+        self.shared     = shared
+
+        # ptr and size, shared with the workers and guarded by the lock if the buffer is shared
+        self._cursor = _zeros([2], shared, dtype = np.int64)
+        self._lock   = mp.Lock() if shared else _NoLock()
+
+    @property
+    def ptr(self) -> int:
+        return int(self._cursor[0])
 
-        self.ptr  = 0
-        self.size = 0
+    @property
+    def size(self) -> int:
+        return int(self._cursor[1])
 
     def store(self,
         state      : np.ndarray,
@@ -25,20 +56,49 @@ class BaseBuffer:
         next_state : np.ndarray,
         done       : bool      ,
     ):
-        self.state_buf     [self.ptr] = state
-        self.action_buf    [self.ptr] = action
-        self.reward_buf    [self.ptr] = reward
-        self.next_state_buf[self.ptr] = next_state
-        self.done_buf      [self.ptr] = done
+        self.store_batch(
+            states      = [state     ],
+            actions     = [action    ],
+            rewards     = [reward    ],
+            next_states = [next_state],
+            dones       = [done      ],
+        )
+
+    def store_batch(self,
+        states      : np.ndarray,
+        actions     : np.ndarray,
+        rewards     : np.ndarray,
+        next_states : np.ndarray,
+        dones       : np.ndarray,
+    ):
+        num = len(states)
+
+        # only the slots are reserved under the lock, concurrent writers copy their batches in parallel
+        with self._lock:
+            start = self.ptr
+
+            self._cursor[0] = (start + num) % self.total_size
+            self._cursor[1] = min(self.size + num, self.total_size)
+
+        # of a batch larger than the buffer, only the last total_size transitions are kept
+        keep    = slice(max(num - self.total_size, 0), num)
+        indices = (start + np.arange(num)[keep]) % self.total_size
 
-        self.ptr  = (self.ptr + 1) % self.total_size
-        self.size = min(self.size + 1, self.total_size)
+        for buf, values in (
+            (self.state_buf     , states     ),
+            (self.action_buf    , actions    ),
+            (self.reward_buf    , rewards    ),
+            (self.next_state_buf, next_states),
+            (self.done_buf      , dones      ),
+        ):
+            values = np.asarray(values, dtype = np.float32)
+            buf[indices] = values[keep] if values.ndim > 0 else values
 
     def sample(self) -> Dict[str, np.ndarray]:
         raise NotImplementedError
 
     def sample_all(self) -> Dict[str, np.ndarray]:
-        return self._take_from(slice(None, None, None))
+        return self._take_from(slice(None, self.size, None))
 
     def _take_from(self,
         indices : np.ndarray,
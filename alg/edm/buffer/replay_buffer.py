@@ -2,6 +2,28 @@ from .base_buffer import *
 
 class ReplayBuffer(BaseBuffer):
     def sample(self) -> Dict[str, np.ndarray]:
-        indices = np.random.choice(self.size, size = self.batch_size, replace = False)
+        indices = self._sample_indices(self.batch_size)
 
         return self._take_from(indices)
+
+    def _sample_indices(self,
+        num : int,
+    ) -> np.ndarray:
+        if num > self.size:
+            raise ValueError("Cannot take a larger sample than population when 'replace=False'")
+
+        if 2 * num > self.size:
+            return np.random.permutation(self.size)[:num]
+
+        # draws with replacement and redraws the duplicates, O(num) expected as long as num <= size / 2
+        indices = np.random.randint(self.size, size = num)
+
+        while True:
+            _, first = np.unique(indices, return_index = True)
+
+            if len(first) == num:
+                return indices
+
+            # keep the first occurrences in their drawn order, so that the batch stays shuffled
+            first.sort()
+            indices = np.concatenate([indices[first], np.random.randint(self.size, size = num - len(first))])
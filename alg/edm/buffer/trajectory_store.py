@@ -0,0 +1,113 @@
+from .__head__ import *
+
+class TrajectoryStore:
+    def __init__(self,
+        store_path : str,
+    ):
+        self.store_path = store_path
+
+        # read-only memory maps, so that concurrent students share the pages of one copy
+        self.states  = np.load(os.path.join(store_path, 'states.npy' ), mmap_mode = 'r')
+        self.actions = np.load(os.path.join(store_path, 'actions.npy'), mmap_mode = 'r')
+        self.offsets = np.load(os.path.join(store_path, 'offsets.npy'))
+        self.returns = np.load(os.path.join(store_path, 'returns.npy'))
+
+    @classmethod
+    def load(cls,
+        trajs_path : str,
+    ) -> 'TrajectoryStore':
+        store_root = os.path.splitext(trajs_path)[0] + '_store'
+
+        # one version of the store per state of the source, so that a rewritten source never replaces a store
+        # that other students have open
+        source     = os.stat(trajs_path)
+        store_path = os.path.join(store_root, '%d-%d' % (source.st_mtime_ns, source.st_size))
+
+        if not os.path.isdir(store_path):
+            cls.convert(trajs_path, store_path)
+
+            # versions of older sources; conversions in progress are hidden and left alone
+            for name in os.listdir(store_root):
+                path = os.path.join(store_root, name)
+
+                if name.startswith('.') or path == store_path:
+                    continue
+
+                if os.path.isdir(path):
+                    shutil.rmtree(path, ignore_errors = True)
+                else:
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+
+        return cls(store_path)
+
+    @staticmethod
+    def convert(
+        trajs_path : str       ,
+        store_path : str       ,
+        chunk_size : int = 100 ,
+    ):
+        # a pickle cannot be read in parts, so the conversion itself holds all trajectories in memory once, as
+        # the old loader did; only the loads after it map the columns instead
+        data  = np.load(trajs_path, allow_pickle = True)[()]
+        trajs = data['trajs']
+
+        lengths = np.array([len(traj) for traj in trajs], dtype = np.int64)
+        offsets = np.concatenate([[0], np.cumsum(lengths)])
+
+        state  = np.asarray(trajs[0][0][0])
+        action = np.asarray(trajs[0][0][1])
+
+        # written to a private hidden directory and renamed, so that concurrent conversions never expose a partial store
+        store_root = os.path.dirname(store_path) or '.'
+        os.makedirs(store_root, exist_ok = True)
+
+        temp_path = tempfile.mkdtemp(prefix = '.' + os.path.basename(store_path) + '.', dir = store_root)
+
+        states  = np.lib.format.open_memmap(os.path.join(temp_path, 'states.npy' ), mode = 'w+',
+            dtype = state .dtype, shape = (int(offsets[-1]),) + state .shape)
+        actions = np.lib.format.open_memmap(os.path.join(temp_path, 'actions.npy'), mode = 'w+',
+            dtype = action.dtype, shape = (int(offsets[-1]),) + action.shape)
+
+        for start in range(0, len(trajs), chunk_size):
+            chunk = [pair for traj in trajs[start:start + chunk_size] for pair in traj]
+            rows  = slice(offsets[start], offsets[min(start + chunk_size, len(trajs))])
+
+            states [rows] = np.array([pair[0] for pair in chunk])
+            actions[rows] = np.array([pair[1] for pair in chunk])
+
+        states .flush()
+        actions.flush()
+
+        np.save(os.path.join(temp_path, 'offsets.npy'), offsets)
+        np.save(os.path.join(temp_path, 'returns.npy'), np.asarray(data['returns']))
+
+        # the rename is atomic and fails if a concurrent conversion of the same source got there first
+        try:
+            os.rename(temp_path, store_path)
+        except OSError:
+            shutil.rmtree(temp_path, ignore_errors = True)
+
+            if not os.path.isdir(store_path):
+                raise
+
+    def indices(self,
+        trajs : slice    ,
+        every : int = 1  ,
+    ) -> np.ndarray:
+        traj_indices = range(len(self))[trajs]
+
+        if len(traj_indices) == 0:
+            return np.zeros(0, dtype = np.int64)
+
+        return np.concatenate([np.arange(self.offsets[t], self.offsets[t + 1], every) for t in traj_indices])
+
+    def take(self,
+        indices : np.ndarray,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        return self.states[indices], self.actions[indices]
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
@@ -2,6 +2,7 @@ import os
 import shutil
 import subprocess
 
+import optuna
 import pytest
 
 
@@ -56,3 +57,59 @@ def test_optimize(sampler, pruner, experiment):
 
     return_code = subprocess.call(['python', 'train.py'] + args)
     _assert_eq(return_code, 0)
+
+
+def test_optimize_workers_resume():
+    algo, env_id = experiments['ppo2-CartPole-v1']
+    args = [
+        '-n', str(N_STEPS),
+        '--algo', algo,
+        '--env', env_id,
+        '--log-folder', LOG_FOLDER,
+        '--n-trials', str(2 * N_TRIALS),
+        '--n-workers', '2',
+        '--study-name', 'test-workers',
+        '--sampler', 'random',
+        '--pruner', 'median',
+        '-optimize'
+    ]
+
+    return_code = subprocess.call(['python', 'train.py'] + args)
+    _assert_eq(return_code, 0)
+
+    # The finished study is resumed: no new trial is run
+    return_code = subprocess.call(['python', 'train.py'] + args)
+    _assert_eq(return_code, 0)
+
+    study = optuna.load_study(study_name='test-workers',
+                              storage='sqlite:///{}'.format(os.path.join(LOG_FOLDER, algo, 'studies.db')))
+    _assert_eq(len(study.trials), 2 * N_TRIALS)
+
+
+def test_optimize_new_study_by_default():
+    algo, env_id = experiments['ppo2-CartPole-v1']
+    args = [
+        '-n', str(N_STEPS),
+        '--algo', algo,
+        '--env', env_id,
+        '--log-folder', LOG_FOLDER,
+        '--n-trials', str(N_TRIALS),
+        '--n-workers', '2',
+        '--sampler', 'random',
+        '--pruner', 'median',
+        '-optimize'
+    ]
+
+    storage = 'sqlite:///{}'.format(os.path.join(LOG_FOLDER, algo, 'studies.db'))
+    n_studies = len(optuna.get_all_study_summaries(storage=storage)) \
+        if os.path.exists(os.path.join(LOG_FOLDER, algo, 'studies.db')) else 0
+
+    # Without --study-name, the second run does not resume the first one
+    for _ in range(2):
+        return_code = subprocess.call(['python', 'train.py'] + args)
+        _assert_eq(return_code, 0)
+
+    summaries = optuna.get_all_study_summaries(storage=storage)
+    _assert_eq(len(summaries), n_studies + 2)
+    for summary in summaries[-2:]:
+        _assert_eq(summary.n_trials, N_TRIALS)
@@ -61,6 +61,12 @@ if __name__ == '__main__':
     parser.add_argument('-optimize', '--optimize-hyperparameters', action='store_true', default=False,
                         help='Run hyperparameters search')
     parser.add_argument('--n-jobs', help='Number of parallel jobs when optimizing hyperparameters', type=int, default=1)
+    parser.add_argument('--n-workers', help='Number of worker processes when optimizing hyperparameters', type=int,
+                        default=1)
+    parser.add_argument('--storage', help='Optuna storage URL of the study (default: sqlite database in the log folder)',
+                        type=str, default=None)
+    parser.add_argument('--study-name', help='Name of the study, an existing study of that name is resumed '
+                                             '(default: a new study for every run)', type=str, default=None)
     parser.add_argument('--sampler', help='Sampler to use when optimizing hyperparameters', type=str,
                         default='tpe', choices=['random', 'tpe', 'skopt'])
     parser.add_argument('--pruner', help='Pruner to use when optimizing hyperparameters', type=str,
@@ -365,19 +371,29 @@ if __name__ == '__main__':
             print("Optimizing hyperparameters")
 
 
-        def create_model(*_args, **kwargs):
+        def create_model(*_args, env=None, **kwargs):
             """
             Helper to create a model with different hyperparameters
             """
-            return ALGOS[args.algo](env=create_env(n_envs), tensorboard_log=tensorboard_log,
+            return ALGOS[args.algo](env=create_env(n_envs) if env is None else env, tensorboard_log=tensorboard_log,
                                     verbose=0, **kwargs)
 
 
+        storage = args.storage
+        if storage is None:
+            os.makedirs(os.path.join(args.log_folder, args.algo), exist_ok=True)
+            storage = 'sqlite:///{}'.format(os.path.join(args.log_folder, args.algo, 'studies.db'))
+        study_name = args.study_name
+        if study_name is None:
+            # Only a study named explicitly is resumed
+            study_name = "{}_{}-{}-{}_{}".format(env_id, n_timesteps, args.sampler, args.pruner, uuid.uuid4())
+
         data_frame = hyperparam_optimization(args.algo, create_model, create_env, n_trials=args.n_trials,
                                              n_timesteps=n_timesteps, hyperparams=hyperparams,
                                              n_jobs=args.n_jobs, seed=args.seed,
                                              sampler_method=args.sampler, pruner_method=args.pruner,
-                                             verbose=args.verbose)
+                                             verbose=args.verbose, n_envs=n_envs, n_workers=args.n_workers,
+                                             storage=storage, study_name=study_name)
 
         report_name = "report_{}_{}-trials-{}-{}-{}_{}.csv".format(env_id, args.n_trials, n_timesteps,
                                                                 args.sampler, args.pruner, int(time.time()))
@@ -1,13 +1,16 @@
+import multiprocessing
+import threading
 from copy import deepcopy
 
 import numpy as np
 import optuna
 from optuna.pruners import SuccessiveHalvingPruner, MedianPruner
 from optuna.samplers import RandomSampler, TPESampler
+from optuna.trial import TrialState
 from optuna.integration.skopt import SkoptSampler
 from stable_baselines import SAC, TD3
 from stable_baselines.common.noise import AdaptiveParamNoiseSpec, NormalActionNoise, OrnsteinUhlenbeckActionNoise
-from stable_baselines.common.vec_env import VecNormalize, VecEnv
+from stable_baselines.common.vec_env import VecNormalize, VecFrameStack, VecEnv
 from stable_baselines.her import HERGoalEnvWrapper
 from stable_baselines.common.base_class import _UnvecWrapper
 
@@ -26,21 +29,79 @@ del mpi4py
 from .callbacks import TrialEvalCallback
 
 
+class SharedEnvs(object):
+    """
+    Environments of one worker process, created once and reused by all the trials the worker runs
+    (one set per thread when n_jobs > 1). A new trial gets its environment behind a new VecNormalize,
+    so that it starts from fresh normalization statistics.
+
+    :param env_fn: (func) function that is used to instantiate the env
+    """
+    def __init__(self, env_fn):
+        self.env_fn = env_fn
+        self.envs = {}
+
+    def get(self, n_envs, eval_env=False):
+        key = (threading.get_ident(), n_envs, eval_env)
+        if key not in self.envs:
+            self.envs[key] = self.env_fn(n_envs=n_envs, eval_env=eval_env)
+        else:
+            self.envs[key] = self._renormalize(self.envs[key])
+        return self.envs[key]
+
+    def _renormalize(self, env):
+        """
+        Wrap the environment below a VecNormalize in a new VecNormalize with the same settings.
+
+        :param env: (Union[gym.Env, VecEnv])
+        :return: (Union[gym.Env, VecEnv])
+        """
+        if isinstance(env, VecNormalize):
+            return VecNormalize(env.venv, training=env.training, norm_obs=env.norm_obs,
+                                norm_reward=env.norm_reward, clip_obs=env.clip_obs, clip_reward=env.clip_reward,
+                                gamma=env.gamma, epsilon=env.epsilon)
+        if isinstance(env, VecFrameStack) and isinstance(env.venv, VecNormalize):
+            return VecFrameStack(self._renormalize(env.venv), env.n_stack)
+        return env
+
+    def close(self):
+        for env in self.envs.values():
+            env.close()
+        self.envs = {}
+
+
+def _create_sampler(sampler_method, seed, n_startup_trials):
+    if sampler_method == 'random':
+        return RandomSampler(seed=seed)
+    elif sampler_method == 'tpe':
+        return TPESampler(n_startup_trials=n_startup_trials, seed=seed)
+    elif sampler_method == 'skopt':
+        # cf https://scikit-optimize.github.io/#skopt.Optimizer
+        # GP: gaussian process
+        # Gradient boosted regression: GBRT
+        return SkoptSampler(skopt_kwargs={'base_estimator': "GP", 'acq_func': 'gp_hedge'})
+    raise ValueError('Unknown sampler: {}'.format(sampler_method))
+
+
 def hyperparam_optimization(algo, model_fn, env_fn, n_trials=10, n_timesteps=5000, hyperparams=None,
                             n_jobs=1, sampler_method='random', pruner_method='halving',
-                            seed=0, verbose=1):
+                            seed=0, verbose=1, n_envs=1, n_workers=1, storage=None, study_name=None):
     """
     :param algo: (str)
-    :param model_fn: (func) function that is used to instantiate the model
+    :param model_fn: (func) function that is used to instantiate the model, the env is passed as `env`
     :param env_fn: (func) function that is used to instantiate the env
     :param n_trials: (int) maximum number of trials for finding the best hyperparams
     :param n_timesteps: (int) maximum number of timesteps per trial
     :param hyperparams: (dict)
-    :param n_jobs: (int) number of parallel jobs
+    :param n_jobs: (int) number of parallel jobs (threads) per worker
     :param sampler_method: (str)
     :param pruner_method: (str)
     :param seed: (int)
     :param verbose: (int)
+    :param n_envs: (int) number of environments of the training env
+    :param n_workers: (int) number of worker processes, they share the study through the storage
+    :param storage: (str) optuna storage URL (e.g. sqlite:///study.db), the study is resumed if it exists
+    :param study_name: (str)
     :return: (pd.Dataframe) detailed result of the optimization
     """
     # TODO: eval each hyperparams several times to account for noisy evaluation
@@ -56,17 +117,7 @@ def hyperparam_optimization(algo, model_fn, env_fn, n_trials=10, n_timesteps=500
     eval_freq = int(n_timesteps / n_evaluations)
 
     # n_warmup_steps: Disable pruner until the trial reaches the given number of step.
-    if sampler_method == 'random':
-        sampler = RandomSampler(seed=seed)
-    elif sampler_method == 'tpe':
-        sampler = TPESampler(n_startup_trials=n_startup_trials, seed=seed)
-    elif sampler_method == 'skopt':
-        # cf https://scikit-optimize.github.io/#skopt.Optimizer
-        # GP: gaussian process
-        # Gradient boosted regression: GBRT
-        sampler = SkoptSampler(skopt_kwargs={'base_estimator': "GP", 'acq_func': 'gp_hedge'})
-    else:
-        raise ValueError('Unknown sampler: {}'.format(sampler_method))
+    sampler = _create_sampler(sampler_method, seed, n_startup_trials)
 
     if pruner_method == 'halving':
         pruner = SuccessiveHalvingPruner(min_resource=1, reduction_factor=4, min_early_stopping_rate=0)
@@ -78,12 +129,25 @@ def hyperparam_optimization(algo, model_fn, env_fn, n_trials=10, n_timesteps=500
     else:
         raise ValueError('Unknown pruner: {}'.format(pruner_method))
 
+    if n_workers > 1 and storage is None:
+        raise ValueError('A storage is needed to share the study between {} workers'.format(n_workers))
+
     if verbose > 0:
         print("Sampler: {} - Pruner: {}".format(sampler_method, pruner_method))
 
-    study = optuna.create_study(sampler=sampler, pruner=pruner)
+    study = optuna.create_study(study_name=study_name, storage=storage, sampler=sampler, pruner=pruner,
+                                load_if_exists=True)
     algo_sampler = HYPERPARAMS_SAMPLER[algo]
 
+    # Resume: finished and pruned trials count towards the budget
+    n_done = len([trial for trial in study.trials if trial.state in (TrialState.COMPLETE, TrialState.PRUNED)])
+    n_remaining = max(n_trials - n_done, 0)
+    if verbose > 0 and n_done > 0:
+        print("Resuming study with {} finished trials".format(n_done))
+
+    # Environments of the current process
+    shared_envs = SharedEnvs(env_fn)
+
     def objective(trial):
 
         kwargs = hyperparams.copy()
@@ -94,12 +158,12 @@ def hyperparam_optimization(algo, model_fn, env_fn, n_trials=10, n_timesteps=500
 
         # Hack to use DDPG/TD3 noise sampler
         if algo in ['ddpg', 'td3'] or trial.model_class in ['ddpg', 'td3']:
-            trial.n_actions = env_fn(n_envs=1).action_space.shape[0]
+            trial.n_actions = shared_envs.get(n_envs=1).action_space.shape[0]
         kwargs.update(algo_sampler(trial))
 
-        model = model_fn(**kwargs)
+        model = model_fn(env=shared_envs.get(n_envs=n_envs), **kwargs)
 
-        eval_env = env_fn(n_envs=1, eval_env=True)
+        eval_env = shared_envs.get(n_envs=1, eval_env=True)
         # Account for parallel envs
         eval_freq_ = eval_freq
         if isinstance(model.get_env(), VecEnv):
@@ -116,18 +180,13 @@ def hyperparam_optimization(algo, model_fn, env_fn, n_trials=10, n_timesteps=500
 
         try:
             model.learn(n_timesteps, callback=eval_callback)
-            # Free memory
-            model.env.close()
-            eval_env.close()
         except AssertionError:
             # Sometimes, random hyperparams can generate NaN
-            # Free memory
-            model.env.close()
-            eval_env.close()
             raise optuna.exceptions.TrialPruned()
         is_pruned = eval_callback.is_pruned
         cost = -1 * eval_callback.last_mean_reward
 
+        # The envs are kept for the next trial of this worker
         del model.env, eval_env
         del model
 
@@ -136,10 +195,36 @@ def hyperparam_optimization(algo, model_fn, env_fn, n_trials=10, n_timesteps=500
 
         return cost
 
-    try:
-        study.optimize(objective, n_trials=n_trials, n_jobs=n_jobs)
-    except KeyboardInterrupt:
-        pass
+    def optimize(worker_id, n_worker_trials):
+        worker_study = study
+        if worker_id > 0:
+            # Distinct seeds, so that the workers do not sample the same hyperparameters
+            worker_study = optuna.load_study(study_name=study.study_name, storage=storage, pruner=pruner,
+                                             sampler=_create_sampler(sampler_method, seed + worker_id,
+                                                                     n_startup_trials))
+        try:
+            worker_study.optimize(objective, n_trials=n_worker_trials, n_jobs=n_jobs)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            shared_envs.close()
+
+    # Worker 0 runs in the current process, the others are forked and get their own environments
+    shares = [len(share) for share in np.array_split(np.arange(n_remaining), max(n_workers, 1))]
+    context = multiprocessing.get_context('fork')
+    workers = [context.Process(target=optimize, args=(worker_id, shares[worker_id]))
+               for worker_id in range(1, len(shares)) if shares[worker_id] > 0]
+
+    for worker in workers:
+        worker.start()
+
+    optimize(0, shares[0])
+
+    for worker in workers:
+        worker.join()
+
+    if n_workers > 1:
+        study = optuna.load_study(study_name=study.study_name, storage=storage, sampler=sampler, pruner=pruner)
 
     print('Number of finished trials: ', len(study.trials))
 
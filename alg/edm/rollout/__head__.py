@@ -0,0 +1,6 @@
+import gym
+import multiprocessing as mp
+import numpy as np
+
+from multiprocessing.connection import Connection
+from typing import Any, Callable, List, Tuple
@@ -0,0 +1 @@
+from .vector_env import *
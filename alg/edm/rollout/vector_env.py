@@ -0,0 +1,117 @@
+from .__head__ import *
+
+def _run(
+    envs    : List[gym.Env],
+    command : str          ,
+    data    : List[Any]    ,
+) -> List[Any]:
+    if command == 'reset':
+        return [envs[i].reset() for i in data]
+
+    if command == 'step':
+        return [envs[i].step(action) for i, action in data]
+
+    if command == 'close':
+        return [env.close() for env in envs]
+
+    raise NotImplementedError
+
+def _work(
+    remote   : Connection           ,
+    env_fn   : Callable[[], gym.Env],
+    num_envs : int                  ,
+):
+    envs = [env_fn() for _ in range(num_envs)]
+
+    while True:
+        command, data = remote.recv()
+        remote.send(_run(envs, command, data))
+
+        if command == 'close':
+            break
+
+    remote.close()
+
+class VectorEnv:
+    # env_fn builds one copy of the environment, wrappers included; with worker processes it is called in the
+    # workers, so it has to be picklable unless processes are forked (e.g. functools.partial(gym.make, env_name))
+    def __init__(self,
+        env_fn      : Callable[[], gym.Env],
+        num_envs    : int                  ,
+        num_workers : int = 0              ,
+    ):
+        self.env_fn      = env_fn
+        self.num_envs    = num_envs
+        self.num_workers = min(num_workers, num_envs)
+
+        # environment i is the local[i]-th copy of group owner[i]
+        groups = np.array_split(np.arange(num_envs), max(self.num_workers, 1))
+
+        self.owner = np.concatenate([np.full(len(group), g) for g, group in enumerate(groups)])
+        self.local = np.concatenate([np.arange(len(group))  for     group in        groups ])
+
+        if self.num_workers == 0:
+            self.envs = [env_fn() for _ in range(num_envs)]
+
+        else:
+            self.remotes, self.processes = [], []
+
+            for group in groups:
+                remote, worker_remote = mp.Pipe()
+                process = mp.Process(target = _work, args = (worker_remote, env_fn, len(group)), daemon = True)
+                process.start()
+                worker_remote.close()
+
+                self.remotes   += [remote ]
+                self.processes += [process]
+
+    def reset(self,
+        indices : np.ndarray,
+    ) -> np.ndarray:
+        return np.array(self._call('reset', indices, [None] * len(indices)))
+
+    def step(self,
+        actions : np.ndarray,
+        indices : np.ndarray,
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        next_states, rewards, dones, _ = zip(*self._call('step', indices, actions))
+
+        return np.array(rewards), np.array(next_states), np.array(dones)
+
+    def close(self):
+        if self.num_workers == 0:
+            _run(self.envs, 'close', None)
+            return
+
+        for remote in self.remotes:
+            remote.send(('close', None))
+            remote.recv()
+
+        for process in self.processes:
+            process.join()
+
+    def _call(self,
+        command : str       ,
+        indices : np.ndarray,
+        data    : List[Any] ,
+    ) -> List[Any]:
+        indices = np.asarray(indices, dtype = int)
+        items   = [(self.local[i], d) if command == 'step' else self.local[i] for i, d in zip(indices, data)]
+
+        if self.num_workers == 0:
+            return _run(self.envs, command, items)
+
+        # every group works on its share of the environments at the same time
+        owners  = self.owner[indices]
+        results = [None] * len(indices)
+
+        for g, remote in enumerate(self.remotes):
+            if np.any(owners == g):
+                remote.send((command, [item for item, owner in zip(items, owners) if owner == g]))
+
+        for g, remote in enumerate(self.remotes):
+            if np.any(owners == g):
+                for k, result in zip(np.flatnonzero(owners == g), remote.recv()):
+                    results[k] = result
+
+        return results
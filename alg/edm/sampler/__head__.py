@@ -0,0 +1,5 @@
+import time
+import torch
+import torch.nn as nn
+
+from typing import List
@@ -0,0 +1 @@
+from .langevin_sampler import *
@@ -0,0 +1,88 @@
+from .__head__ import *
+
+class LangevinChain(nn.Module):
+    def __init__(self,
+        energy_function : nn.Module,
+    ):
+        super(LangevinChain, self).__init__()
+
+        self.energy_function = energy_function
+
+    def forward(self,
+        x          : torch.Tensor,
+        num_steps  : int         ,
+        learn_rate : float       ,
+        noise_coef : float       ,
+    ) -> torch.Tensor:
+        for _ in range(num_steps):
+            x = x.detach().requires_grad_(True)
+
+            grads = torch.autograd.grad([self.energy_function(x).logsumexp(1).sum()], [x])
+            grad  = grads[0]
+            assert grad is not None
+
+            x = x.detach() + learn_rate * grad + noise_coef * torch.randn_like(x)
+
+        return x.detach()
+
+class LangevinSampler:
+    def __init__(self,
+        energy_function : nn.Module   ,
+        state_dim       : int         ,
+        buffer_size     : int         ,
+        batch_size      : int         ,
+        learn_rate      : float       ,
+        noise_coef      : float       ,
+        num_steps       : int         ,
+        reinit_freq     : float       ,
+        device          : torch.device,
+        timed           : bool = False,
+    ):
+        self.state_dim   = state_dim
+        self.batch_size  = batch_size
+        self.learn_rate  = learn_rate
+        self.noise_coef  = noise_coef
+        self.num_steps   = num_steps
+        self.reinit_freq = reinit_freq
+        self.device      = device
+        self.timed       = timed
+
+        # persistent chains, kept contiguous on the device of the energy function
+        self.buffer = self._get_random_states(buffer_size)
+
+        # the scripted chain shares its parameters with energy_function
+        self.chain = torch.jit.script(LangevinChain(energy_function))
+
+        self.step_times : List[float] = []
+
+    def sample(self) -> torch.Tensor:
+        indices = torch.randint(0, len(self.buffer), (self.batch_size,), device = self.device)
+
+        mask    = torch.rand(self.batch_size, 1, device = self.device) < self.reinit_freq
+        samples = torch.where(mask, self._get_random_states(self.batch_size), self.buffer[indices])
+
+        if self.timed:
+            self._synchronize()
+            start = time.perf_counter()
+
+        samples = self.chain(samples, self.num_steps, self.learn_rate, self.noise_coef)
+
+        if self.timed:
+            self._synchronize()
+            self.step_times += [(time.perf_counter() - start) / max(self.num_steps, 1)]
+
+        self.buffer[indices] = samples
+
+        return samples
+
+    def step_time(self) -> float:
+        return sum(self.step_times) / len(self.step_times) if self.step_times else float('nan')
+
+    def _synchronize(self):
+        if self.device.type == 'cuda':
+            torch.cuda.synchronize(self.device)
+
+    def _get_random_states(self,
+        num_states : int,
+    ) -> torch.Tensor:
+        return torch.empty(num_states, self.state_dim, device = self.device).uniform_(-1, 1)
@@ -6,5 +6,5 @@ import torch.optim as optim
 
 import warnings
 
-from typing import Dict, List, Tuple
+from typing import Callable, Dict, List, Tuple
 from tqdm import tqdm
@@ -1,7 +1,8 @@
 from .__head__ import *
 
 from agent  import BaseAgent, SerializableAgent
-from buffer import ReplayBuffer
+from buffer import ReplayBuffer, TrajectoryStore
+from rollout import VectorEnv
 
 class BaseStudent(SerializableAgent):
     def __init__(self,
@@ -31,7 +32,7 @@ class BaseStudent(SerializableAgent):
         state   = samples['state' ]
         action  = samples['action']
 
-        action_hat = np.array([self.select_action(s) for s in state])
+        action_hat = self.select_actions(state)
         match_samp =  np.equal(action, action_hat)
 
         return match_samp
@@ -57,21 +58,62 @@ class BaseStudent(SerializableAgent):
 
         return traj, match, retvrn
 
+    def rollout_batch(self,
+        vector_env : VectorEnv ,
+        indices    : np.ndarray,
+    ) -> Tuple[List[List[Tuple[np.ndarray, np.ndarray]]], List[List[bool]], List[float]]:
+        states = vector_env.reset(indices)
+
+        trajs = [[] for _ in indices]
+        matches = [[] for _ in indices]
+        returns = [0 for _ in indices]
+
+        active = np.arange(len(indices))
+
+        while len(active) > 0:
+            actions = self.select_actions(states)
+            teacher_actions = self.teacher.select_actions(states)
+            rewards, next_states, dones = vector_env.step(actions, indices[active])
+
+            for k, i in enumerate(active):
+                trajs[i] += [(states[k], actions[k])]
+                matches[i] += [actions[k] == teacher_actions[k]]
+                returns[i] += rewards[k]
+
+            active = active[~dones]
+            states = next_states[~dones]
+
+        return trajs, matches, returns
+
     def test(self,
-        num_episodes : int,
+        num_episodes : int                          ,
+        env_fn       : Callable[[], gym.Env] = None ,
+        num_envs     : int                   = 1    ,
+        num_workers  : int                   = 0    ,
     ) -> Tuple[float, float, float]:
         self.test_mode = True
 
+        # without a factory for copies of the environment, the episodes run one by one on self.env
+        if env_fn is None and (num_envs > 1 or num_workers > 0):
+            raise ValueError('env_fn is needed to run episodes on several environments')
+
         trajs = []
         matches = []
         returns = []
 
-        for episode_index in range(num_episodes):
-            traj, match, retvrn = self.rollout()
+        num_envs = min(num_envs, num_episodes)
+        vector_env = VectorEnv(env_fn or (lambda: self.env), num_envs, num_workers)
+
+        for start in range(0, num_episodes, num_envs):
+            indices = np.arange(min(num_envs, num_episodes - start))
+            batch_trajs, batch_matches, batch_returns = self.rollout_batch(vector_env, indices)
 
-            trajs += [traj]
-            matches += match
-            returns += [retvrn]
+            trajs += batch_trajs
+            matches += [m for match in batch_matches for m in match]
+            returns += batch_returns
+
+        if env_fn is not None:
+            vector_env.close()
 
         np.save(self.trajs_path, {'trajs': trajs, 'returns': returns})
 
@@ -84,25 +126,24 @@ class BaseStudent(SerializableAgent):
         raise NotImplementedError
 
     def _fill_buffer(self):
-        trajs = np.load(self.teacher.trajs_path, allow_pickle = True)[()] \
-            ['trajs'][self.run_seed:self.run_seed + self.buffer_size_in_trajs]
+        store = TrajectoryStore.load(self.teacher.trajs_path)
 
-        pairs = [pair for traj in trajs for i, pair in enumerate(traj) if i % 20 == 0]
+        indices = store.indices(slice(self.run_seed, self.run_seed + self.buffer_size_in_trajs), every = 20)
+        states, actions = store.take(indices)
 
-        if len(pairs) < self.batch_size:
-            self.batch_size = len(pairs)
+        if len(indices) < self.batch_size:
+            self.batch_size = len(indices)
 
         self.buffer = ReplayBuffer(
             state_dim  = self.env.observation_space.shape[0],
-            total_size = len(pairs)                         ,
+            total_size = len(indices)                       ,
             batch_size = self.batch_size                    ,
         )
 
-        for pair in pairs:
-            self.buffer.store(
-                state      = pair[0],
-                action     = pair[1],
-                reward     = None   ,
-                next_state = None   ,
-                done       = None   ,
-            )
+        self.buffer.store_batch(
+            states      = states ,
+            actions     = actions,
+            rewards     = None   ,
+            next_states = None   ,
+            dones       = None   ,
+        )
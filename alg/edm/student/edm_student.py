@@ -2,6 +2,7 @@ from .base_student import *
 
 from agent import CUDAAgent
 from network import StudentNetwork
+from sampler import LangevinSampler
 
 
 class EDMStudent(BaseStudent, CUDAAgent):
@@ -21,6 +22,7 @@ class EDMStudent(BaseStudent, CUDAAgent):
                  sgld_noise_coef: float,
                  sgld_num_steps: int,
                  sgld_reinit_freq: float,
+                 sgld_timed: bool = False,
                  ):
         super(EDMStudent, self).__init__(
             env=env,
@@ -41,12 +43,23 @@ class EDMStudent(BaseStudent, CUDAAgent):
                                     betas=self.adam_betas,
                                     )
 
-        self.sgld_buffer = self._get_random_states(sgld_buffer_size)
         self.sgld_learn_rate = sgld_learn_rate
         self.sgld_noise_coef = sgld_noise_coef
         self.sgld_num_steps = sgld_num_steps
         self.sgld_reinit_freq = sgld_reinit_freq
 
+        self.sampler = LangevinSampler(energy_function=self.qvalue_function,
+                                       state_dim=self.env.observation_space.shape[0],
+                                       buffer_size=sgld_buffer_size,
+                                       batch_size=self.batch_size,
+                                       learn_rate=self.sgld_learn_rate,
+                                       noise_coef=self.sgld_noise_coef,
+                                       num_steps=self.sgld_num_steps,
+                                       reinit_freq=self.sgld_reinit_freq,
+                                       device=self.device,
+                                       timed=sgld_timed,
+                                       )
+
     def select_action(self,
                       state: np.ndarray,
                       ) -> np.ndarray:
@@ -55,6 +68,14 @@ class EDMStudent(BaseStudent, CUDAAgent):
 
         return action
 
+    def select_actions(self,
+                       states: np.ndarray,
+                       ) -> np.ndarray:
+        actions = self.qvalue_function(torch.FloatTensor(states).to(self.device)).argmax(1)
+        actions = actions.detach().cpu().numpy()
+
+        return actions
+
     def train(self,
               num_updates: int,
               ):
@@ -67,6 +88,9 @@ class EDMStudent(BaseStudent, CUDAAgent):
             loss.backward()
             self.optimizer.step()
 
+        if self.sampler.timed:
+            print("SGLD time per step: %.3f ms" % (1e3 * self.sampler.step_time()))
+
         self.env.close()
 
     def _compute_loss(self,
@@ -75,7 +99,7 @@ class EDMStudent(BaseStudent, CUDAAgent):
         loss_pi = self._compute_ce_loss(samples)
 
         state_p = torch.FloatTensor(samples['state']).to(self.device)
-        state_q = self._sample_via_sgld()
+        state_q = self.sampler.sample()
 
         logsumexp_f_p = self.qvalue_function(state_p).logsumexp(1).mean()
         logsumexp_f_q = self.qvalue_function(state_q).logsumexp(1).mean()
@@ -86,41 +110,6 @@ class EDMStudent(BaseStudent, CUDAAgent):
 
         return loss
 
-    def _initialize_sgld(self) -> Tuple[torch.Tensor, List[int]]:
-        indices = torch.randint(0,
-                                len(self.sgld_buffer),
-                                (self.batch_size,),
-                                )
-
-        buffer_samples = self.sgld_buffer[indices]
-        random_samples = self._get_random_states(self.batch_size)
-
-        mask = (torch.rand(self.batch_size) < self.sgld_reinit_freq).float()[:, None]
-        samples = (1 - mask) * buffer_samples + mask * random_samples
-
-        return samples.to(self.device), indices
-
-    def _sample_via_sgld(self) -> torch.Tensor:
-        samples, indices = self._initialize_sgld()
-
-        x_t = torch.autograd.Variable(samples, requires_grad=True)
-
-        for t in range(self.sgld_num_steps):
-            grad_logsumexp = torch.autograd.grad(
-                self.qvalue_function(x_t).logsumexp(1).sum(),
-                [x_t], retain_graph=True)[0]
-
-            grad_term = self.sgld_learn_rate * grad_logsumexp
-            rand_term = self.sgld_noise_coef * torch.randn_like(x_t)
-
-            x_t.data += grad_term + rand_term
-
-        samples = x_t.detach()
-
-        self.sgld_buffer[indices] = samples.cpu()
-
-        return samples
-
     def _compute_ce_loss(self,
                          samples: Dict[str, np.ndarray],
                          ) -> torch.Tensor:
@@ -133,13 +122,6 @@ class EDMStudent(BaseStudent, CUDAAgent):
 
         return loss
 
-    def _get_random_states(self,
-                           num_states: int,
-                           ) -> torch.Tensor:
-        state_dim = self.env.observation_space.shape[0]
-
-        return torch.FloatTensor(num_states, state_dim).uniform_(-1, 1)
-
     def serialize(self):
         torch.save(self.qvalue_function.state_dict(), self.model_path)
 
@@ -1,5 +1,6 @@
 import argparse
 import csv
+import functools
 import gym
 import numpy as np
 import os
@@ -67,6 +67,7 @@ def make_student(
     sgld_noise_coef = config['SGLD_NOISE_COEF']
     sgld_num_steps = config['SGLD_NUM_STEPS']
     sgld_reinit_freq = config['SGLD_REINIT_FREQ']
+    sgld_timed = config['SGLD_TIMED']
 
     return EDMStudent(
         env=env,
@@ -84,6 +85,7 @@ def make_student(
         sgld_noise_coef=sgld_noise_coef,
         sgld_num_steps=sgld_num_steps,
         sgld_reinit_freq=sgld_reinit_freq,
+        sgld_timed=sgld_timed,
     )
 
 def init_arg():
@@ -91,6 +93,7 @@ def init_arg():
     parser.add_argument("--env_name", default='CartPole-v1')
     parser.add_argument("--num_trajectories", default=10, type=int)
     parser.add_argument("--trial", default=0, type=int)
+    parser.add_argument("--num_workers", default=0, type=int)
     return parser.parse_args()
 
 if __name__ == '__main__':
@@ -102,6 +105,8 @@ if __name__ == '__main__':
         'NUM_TRAJS_GIVEN': args.num_trajectories,
         'NUM_STEPS_TRAIN': 10000,
         'NUM_TRAJS_VALID': 300,
+        'NUM_ENVS_VALID': 50,
+        'NUM_WORKERS_VALID': args.num_workers,
         'NUM_REPETITIONS': 10,
 
         'BATCH_SIZE': 32,
@@ -114,6 +119,7 @@ if __name__ == '__main__':
         'SGLD_NOISE_COEF': 0.01,
         'SGLD_NUM_STEPS': 20,
         'SGLD_REINIT_FREQ': 0.05,
+        'SGLD_TIMED': False,
     }
 
     config['EXPERT_ALG'] = yaml.load(open('testing/config.yml'), \
@@ -144,7 +150,10 @@ if __name__ == '__main__':
         print ("Run %s out of %s" % (run_seed + 1, config['NUM_REPETITIONS']))
         student = make_student(run_seed, config)
         student.train(num_updates=config['NUM_STEPS_TRAIN'])
-        action_match, return_mean, return_std = student.test(num_episodes=config['NUM_TRAJS_VALID'])
+        action_match, return_mean, return_std = student.test(num_episodes=config['NUM_TRAJS_VALID'],
+                                                             env_fn=functools.partial(gym.make, config['ENV']),
+                                                             num_envs=config['NUM_ENVS_VALID'],
+                                                             num_workers=config['NUM_WORKERS_VALID'])
         result = (action_match, return_mean, return_std)
         print("Reward for run %s: %s" % (run_seed, return_mean))
         save_results(results_file_path, run_seed, action_match, return_mean, return_std)
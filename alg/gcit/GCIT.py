@@ -4,6 +4,7 @@ import numpy as np
 import matplotlib.pyplot as plt
 from scipy import stats
 from utils import *
+from ci_testing import generate_null_samples, null_statistics
 
 
 # %% GCIT Function
@@ -288,34 +289,26 @@ def GCIT(x, y, z, statistic = "rdc", lamda = 10, normalize=True, verbose=False,
     # %% Compute test statistic
     # 1. Number of samples for null computation
     n_samples = 1000
-    rho = []
-
-    # 2. Choice of statistic
-    if statistic == "corr":
-        stat = correlation
-    if statistic == "mmd":
-        stat = mmd_squared
-    if statistic == "kolmogorov":
-        stat = kolmogorov
-    if statistic == "wilcox":
-        stat = wilcox
-    if statistic == "rdc":
-        stat = rdc
-   
-    # 3. Generate and collect samples on testing data
-    for sample in range(n_samples):
-        x_hat = sess.run([G_sample], feed_dict={Z: z_test, V: sample_V(len(z_test[:, 0]), v_dim)})[0]
-        rho.append(stat(x_hat, y_test))
+
+    # 2. Generate all samples on testing data in a few batched generator passes
+    def sample_x(z_rep):
+        return sess.run(G_sample, feed_dict={Z: z_rep, V: sample_V(len(z_rep), v_dim)})
+
+    x_hats = generate_null_samples(sample_x, z_test, n_samples)
+    x_hat = x_hats[-1].reshape(-1, 1)
+
+    # 3. Observed and null statistics computed in one batch (choice of statistic rho)
+    rho_obs, rho = null_statistics(statistic, x_test.reshape(len(x_test)), x_hats, y_test)
 
     # 4. p-value computation as a two-sided test
-    p_value = min(sum(rho < stat(x_test.reshape(len(x_test)), y_test)) / n_samples,
-                  sum(rho > stat(x_test.reshape(len(x_test)), y_test)) / n_samples)
+    p_value = min(np.sum(rho < rho_obs) / n_samples,
+                  np.sum(rho > rho_obs) / n_samples)
 
     
     if debug:
         print('Statistics of x_hat ', stats.describe(x_hat))
         print('Statistics of x_train ',stats.describe(x_test))
         print('Statistics of generated rho ', stats.describe(rho))
-        print('Observed rho',stat(x_test.reshape(len(x_test)), y_test))
+        print('Observed rho', rho_obs)
 
     return(p_value)
@@ -9,6 +9,7 @@ from scipy import stats
 import matplotlib.pyplot as plt
 import os
 import sys
+import argparse
 from pathlib import Path
 import initpath_alg
 initpath_alg.init_sys_path()
@@ -23,6 +24,7 @@ def add_parent_dir_to_sys_path():
 
 add_parent_dir_to_sys_path()
 from GCIT import GCIT
+from screening import GCIT_screen
 
 
 def get_data_file_name(basename):
@@ -111,6 +113,12 @@ def load_ccle(drug_target='PLX4720', feature_type='both', normalize=False):
     return X_drug, y_drug, features
 
 
+parser = argparse.ArgumentParser()
+parser.add_argument('--screen', action='store_true',
+                    help='test all features with one shared generator (screening.GCIT_screen) and BH correction')
+parser.add_argument('--fdr', type=float, default=0.1, help='false discovery rate of the screening')
+args = parser.parse_args()
+
 X_drug, y_drug, features = load_ccle(feature_type='mutation')
 
 def ccle_feature_filter(X, y, threshold=0.1):
@@ -220,4 +228,20 @@ def run_test_ccle(X,Y):
     for idx, top in enumerate(np.argsort(np.abs(pval))):
         print('{}. {}: {:.4f}'.format(idx+1, ccle_features.index[top], pval[top]))
 
-run_test_ccle(X_drug[:,ccle_selected],y_drug)
+def run_screen_ccle(X, Y, fdr=0.1):
+    '''
+    Same tests as run_test_ccle, with one generator shared by all features, parallel
+    per-feature tests and Benjamini-Hochberg correction
+    '''
+    res = GCIT_screen(X, Y, fdr=fdr)
+    ccle_features = features[ccle_selected]
+
+    print('Top by fit (BH-adjusted p-value, selected at fdr={}):'.format(fdr))
+    for idx, top in enumerate(np.argsort(res['p_values'])):
+        print('{}. {}: {:.4f} ({:.4f}){}'.format(idx+1, ccle_features.index[top], res['p_values'][top],
+                                                res['p_adjusted'][top], ' *' if top in res['discoveries'] else ''))
+
+if args.screen:
+    run_screen_ccle(X_drug[:,ccle_selected],y_drug,fdr=args.fdr)
+else:
+    run_test_ccle(X_drug[:,ccle_selected],y_drug)
@@ -0,0 +1,221 @@
+'''
+GCIT screening: tests every column of X for conditional dependence with y given all other columns, with FDR control.
+
+Instead of training one GCIT generator per feature, a single conditional generator is trained for all features
+(amortised over the choice of x): it receives the remaining features with x_j masked out, a one-hot code of j and
+the noise v, and generates x_j. The per-feature null distributions are then drawn from this generator and the test
+statistics are computed in parallel worker processes. The p-values are corrected with Benjamini-Hochberg.
+'''
+
+# %% Necessary Packages
+import tensorflow as tf
+import numpy as np
+import os
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from utils import bh, bh_adjusted
+from ci_testing import generate_null_samples, feature_p_value
+
+
+# %% GCIT screening Function
+'''
+Inputs:
+ - X: (n, p) features, each column is tested in turn
+ - y: (n,) or (n, 1) response
+
+Hyper-parameters (=Default values)
+ - statistic: comparison function between generated and true samples (rho), see ci_testing.BATCH_STATISTICS
+ - lamda: Information network parameter = 10
+ - fdr: target false discovery rate for the BH procedure = 0.1
+ - n_jobs: number of worker processes for the per-feature tests (None: all cores)
+
+Outputs: dict with
+ - p_values: (p,) GCIT p-values
+ - p_adjusted: (p,) BH-adjusted p-values
+ - discoveries: indices of the features selected at the given fdr
+'''
+
+def GCIT_screen(X, y, statistic="rdc", lamda=10, normalize=True, verbose=False, n_iter=2000, n_samples=1000,
+                fdr=0.1, n_jobs=None, seed=0):
+
+    y = y.reshape(len(y))
+    if normalize:
+        X = (X - X.min(axis=0)) / np.clip(X.max(axis=0) - X.min(axis=0), 1e-12, None)
+        y = (y - y.min()) / (y.max() - y.min())
+
+    np.random.seed(seed)
+    tf.reset_default_graph()
+    tf.set_random_seed(seed)
+
+    # %% Parameters
+    # 1. # of samples, training for learning the sampler and testing for computing the statistic (2/3 and 1/3)
+    n = len(X)
+    X_train, X_test = X[:int(2*n/3)], X[int(2*n/3):]
+    y_test = y[int(2*n/3):]
+    n_train = len(X_train)
+
+    # 2. # of features, each one is a target x in turn
+    p = X.shape[1]
+
+    # 3. # of random and hidden dimensions, larger than GCIT since the generator is shared by all features
+    v_dim = 3
+    h_dim = max(20, int(2 * np.sqrt(p)))
+
+    # 4. size of minibatch
+    mb_size = 64
+
+    # 5. WGAN parameters
+    eta = 10
+    lr = 1e-4
+
+    # %% Necessary Functions
+    def xavier_init(size):
+        in_dim = size[0]
+        xavier_stddev = 1. / tf.sqrt(in_dim / 2.)
+        return tf.random.normal(shape=size, stddev=xavier_stddev)
+
+    def sample_V(m, n):
+        return np.random.normal(0., np.sqrt(1. / 3), size=[m, n])
+
+    # masked conditioning set and one-hot code of the target feature for rows `data` and targets `j`
+    def conditioning(data, j):
+        z = data.copy()
+        z[np.arange(len(j)), j] = 0.
+        return np.concatenate([z, np.eye(p)[j]], axis=1), data[np.arange(len(j)), j].reshape(-1, 1)
+
+    def sample_batch():
+        idx = np.random.permutation(n_train)[:mb_size]
+        j = np.random.randint(p, size=len(idx))
+        C_mb, X_mb = conditioning(X_train[idx], j)
+        return C_mb, X_mb, np.random.permutation(X_mb)
+
+    # %% Placeholders
+    X_ph = tf.compat.v1.placeholder(tf.float32, shape=[None, 1])
+    X_hat = tf.compat.v1.placeholder(tf.float32, shape=[None, 1])
+    V = tf.compat.v1.placeholder(tf.float32, shape=[None, v_dim])
+    C = tf.compat.v1.placeholder(tf.float32, shape=[None, 2 * p])
+
+    # %% Network Building
+    # 1. WGAN Discriminator
+    WD_W1 = tf.Variable(xavier_init([1 + 2 * p, h_dim]))
+    WD_b1 = tf.Variable(tf.zeros(shape=[h_dim]))
+    WD_W2 = tf.Variable(xavier_init([h_dim, 1]))
+    WD_b2 = tf.Variable(tf.zeros(shape=[1]))
+    theta_WD = [WD_W1, WD_W2, WD_b1, WD_b2]
+
+    # 2. Generator
+    G_W1 = tf.Variable(xavier_init([2 * p + v_dim, h_dim]))
+    G_b1 = tf.Variable(tf.zeros(shape=[h_dim]))
+    G_W2 = tf.Variable(xavier_init([h_dim, h_dim]))
+    G_b2 = tf.Variable(tf.zeros(shape=[h_dim]))
+    G_W3 = tf.Variable(xavier_init([h_dim, 1]))
+    G_b3 = tf.Variable(tf.zeros(shape=[1]))
+    theta_G = [G_W1, G_W2, G_W3, G_b1, G_b2, G_b3]
+
+    # 3. MINE
+    M_W1A = tf.Variable(xavier_init([1]))
+    M_W1B = tf.Variable(xavier_init([1]))
+    M_b1 = tf.Variable(tf.zeros(shape=[1]))
+    M_W2A = tf.Variable(xavier_init([1]))
+    M_W2B = tf.Variable(xavier_init([1]))
+    M_b2 = tf.Variable(tf.zeros(shape=[1]))
+    M_W3 = tf.Variable(xavier_init([1]))
+    M_b3 = tf.Variable(tf.zeros(shape=[1]))
+    theta_M = [M_W1A, M_W1B, M_W2A, M_W2B, M_W3, M_b1, M_b2, M_b3]
+
+    # %% Functions
+    def generator(c, v):
+        inputs = tf.concat(axis=1, values=[c, v])
+        G_h1 = tf.nn.tanh(tf.matmul(inputs, G_W1) + G_b1)
+        G_h2 = tf.nn.tanh(tf.matmul(G_h1, G_W2) + G_b2)
+        return tf.nn.sigmoid(tf.matmul(G_h2, G_W3) + G_b3)
+
+    def WGAN_discriminator(x, c):
+        inputs = tf.concat(axis=1, values=[x, c])
+        WD_h1 = tf.nn.relu(tf.matmul(inputs, WD_W1) + WD_b1)
+        return tf.matmul(WD_h1, WD_W2) + WD_b2
+
+    def MINE(x, x_hat):
+        M_h1 = tf.nn.tanh(M_W1A * x + M_W1B * x_hat + M_b1)
+        M_h2 = tf.nn.tanh(M_W2A * x + M_W2B * x_hat + M_b2)
+        M_out = (M_W3 * (M_h1 + M_h2) + M_b3)
+        return M_out, tf.exp(M_out)
+
+    # %% Combination across the networks
+    G_sample = generator(C, V)
+
+    WD_real = WGAN_discriminator(X_ph, C)
+    WD_fake = WGAN_discriminator(G_sample, C)
+
+    M_out, _ = MINE(X_ph, G_sample)
+    _, Exp_M_out = MINE(X_hat, G_sample)
+
+    eps = tf.random.uniform([mb_size, 1], minval=0., maxval=1.)
+    X_inter = eps * X_ph + (1. - eps) * G_sample
+    grad = tf.gradients(WGAN_discriminator(X_inter, C), [X_inter])[0]
+    grad_norm = tf.sqrt(tf.reduce_sum((grad) ** 2 + 1e-8, axis=1))
+    grad_pen = eta * tf.reduce_mean((grad_norm - 1) ** 2)
+
+    # %% Loss function
+    WD_loss = tf.reduce_mean(WD_fake) - tf.reduce_mean(WD_real) + grad_pen
+    M_loss = lamda * (tf.reduce_sum(tf.reduce_mean(M_out, axis=0) -
+                                    tf.math.log(tf.reduce_mean(Exp_M_out, axis=0))))
+    G_loss = -tf.reduce_mean(WD_fake) + lamda * M_loss
+
+    WD_solver = tf.compat.v1.train.AdamOptimizer(learning_rate=lr, beta1=0.5).minimize(WD_loss, var_list=theta_WD)
+    G_solver = tf.compat.v1.train.AdamOptimizer(learning_rate=lr, beta1=0.5).minimize(G_loss, var_list=theta_G)
+    M_solver = tf.compat.v1.train.AdamOptimizer(learning_rate=lr, beta1=0.5).minimize(-M_loss, var_list=theta_M)
+
+    # %% Sessions
+    sess = tf.compat.v1.Session()
+    sess.run(tf.global_variables_initializer())
+
+    # %% Iterations
+    for it in range(n_iter):
+
+        for _ in range(5):
+            C_mb, X_mb, X_perm_mb = sample_batch()
+            feed = {X_ph: X_mb, C: C_mb, V: sample_V(len(X_mb), v_dim), X_hat: X_perm_mb}
+            _, WD_loss_curr = sess.run([WD_solver, WD_loss], feed_dict=feed)
+            _, M_loss_curr = sess.run([M_solver, M_loss], feed_dict=feed)
+
+        C_mb, X_mb, X_perm_mb = sample_batch()
+        feed = {X_ph: X_mb, C: C_mb, V: sample_V(len(X_mb), v_dim), X_hat: X_perm_mb}
+        _, G_loss_curr = sess.run([G_solver, G_loss], feed_dict=feed)
+
+        if verbose and it % 500 == 0:
+            print('Iter: {}, Generator_loss: {:.4}, WD_loss: {:.4}, M_loss: {:.4}'.format(
+                it, G_loss_curr, WD_loss_curr, M_loss_curr))
+
+    # %% Per-feature tests: null samples from the shared generator, statistics in worker processes
+    def sample_x(c_rep):
+        return sess.run(G_sample, feed_dict={C: c_rep, V: sample_V(len(c_rep), v_dim)})
+
+    def tasks():
+        for j in range(p):
+            C_test, x_obs = conditioning(X_test, np.full(len(X_test), j))
+            x_hats = generate_null_samples(sample_x, C_test, n_samples)
+            yield j, statistic, x_obs.reshape(-1), x_hats, y_test, seed + j
+
+    # at most 2 pending features per worker, so that memory stays bounded for many features
+    n_jobs = n_jobs or os.cpu_count()
+    p_values = np.ones(p)
+    with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+        pending = set()
+        for task in tasks():
+            if len(pending) >= 2 * n_jobs:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    j, p_values[j] = future.result()
+            pending.add(pool.submit(feature_p_value, task))
+        for future in wait(pending)[0]:
+            j, p_values[j] = future.result()
+
+    if verbose:
+        for j in np.argsort(p_values):
+            print('feature {}: p-value {:.4f}'.format(j, p_values[j]))
+
+    sess.close()
+
+    return {'p_values': p_values,
+            'p_adjusted': bh_adjusted(p_values),
+            'discoveries': bh(p_values, fdr)}
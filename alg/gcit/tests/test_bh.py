@@ -0,0 +1,44 @@
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from utils import bh, bh_adjusted  # noqa: E402
+
+
+def test_bh_adjusted_known_example():
+    # p.adjust(c(0.01, 0.04, 0.03, 0.005, 0.2), method="BH") in R
+    p = np.array([0.01, 0.04, 0.03, 0.005, 0.2])
+    np.testing.assert_allclose(bh_adjusted(p), [0.025, 0.05, 0.05, 0.025, 0.2])
+
+
+def test_bh_adjusted_monotone_and_bounded():
+    rng = np.random.RandomState(0)
+    p = np.concatenate([rng.uniform(0, 0.01, size=20), rng.uniform(0, 1, size=200), np.ones(5)])
+    rng.shuffle(p)
+    adjusted = bh_adjusted(p)
+
+    order = np.argsort(p, kind='stable')
+    assert np.all(np.diff(adjusted[order]) >= 0)
+    assert np.all(adjusted >= p)
+    assert np.all(adjusted <= 1)
+    assert np.all(bh_adjusted(np.ones(10)) == 1)
+
+
+def test_bh_discoveries_match_adjusted():
+    rng = np.random.RandomState(1)
+    p = np.concatenate([rng.uniform(0, 0.005, size=10), rng.uniform(0, 1, size=90)])
+    adjusted = bh_adjusted(p)
+    for fdr in [0.01, 0.05, 0.1, 0.2]:
+        np.testing.assert_array_equal(np.sort(bh(p, fdr)), np.flatnonzero(adjusted <= fdr))
+
+
+def test_bh_steps_up_past_a_p_value_above_its_threshold():
+    # 0.035 is above its threshold 2 / 4 * 0.05, but 0.036 is below 3 / 4 * 0.05, so the first three are
+    # discoveries; stopping at the first p-value above its threshold would only select the first one
+    p = np.array([0.036, 0.01, 0.9, 0.035])
+    np.testing.assert_allclose(bh_adjusted(p), [0.048, 0.04, 0.9, 0.048])
+    np.testing.assert_array_equal(np.sort(bh(p, 0.05)), [0, 1, 3])
+    np.testing.assert_array_equal(bh(p, 0.005), [])
@@ -180,16 +180,29 @@ def false_positives(truth, pred, axis=None):
 def bh(p, fdr):
     """ From vector of p-values and desired false positive rate,
     returns significant p-values with Benjamini-Hochberg correction
+    (step-up: all hypotheses up to the largest k with p_(k) <= k / m * fdr)
     """
-    p_orders = np.argsort(p)
-    discoveries = []
+    p = np.asarray(p, dtype=float)
+    p_orders = np.argsort(p, kind='stable')
     m = float(len(p_orders))
-    for k, s in enumerate(p_orders):
-        if p[s] <= (k+1) / m * fdr:
-            discoveries.append(s)
-        else:
-            break
-    return np.array(discoveries, dtype=int)
+    below = np.flatnonzero(p[p_orders] <= np.arange(1, len(p_orders) + 1) / m * fdr)
+    if len(below) == 0:
+        return np.array([], dtype=int)
+    return np.array(p_orders[:below[-1] + 1], dtype=int)
+
+def bh_adjusted(p):
+    """ Benjamini-Hochberg (step-up) adjusted p-values: the smallest fdr level
+    at which each hypothesis is rejected by the BH procedure, so the discoveries
+    of bh(p, fdr) are the hypotheses with bh_adjusted(p) <= fdr
+    """
+    p = np.asarray(p, dtype=float)
+    m = len(p)
+    p_orders = np.argsort(p)
+    adjusted = p[p_orders] * m / np.arange(1, m + 1)
+    adjusted = np.minimum.accumulate(adjusted[::-1])[::-1].clip(0, 1)
+    out = np.empty(m)
+    out[p_orders] = adjusted
+    return out
 
 
 
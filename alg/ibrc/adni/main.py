@@ -5,9 +5,12 @@ import jax.numpy as np
 
 from constants import *
 from functions import *
+from sampler import *
 
 parser = argparse.ArgumentParser()
 parser.add_argument('--tag', default='')
+parser.add_argument('--chains', type=int, default=4)
+parser.add_argument('--warm-iter', type=int, default=50)
 args = parser.parse_args()
 
 key = jax.random.PRNGKey(0)
@@ -25,46 +28,21 @@ _likelihood_aux1 = jax.vmap(_likelihood_aux1, in_axes=(0,0,None,None))
 likelihood = lambda pi, xi: _likelihood_aux1(data['u'], data['x1'], pi, xi).sum()
 likelihood = jax.jit(likelihood)
 
-def _sample(arg0, arg1):
-    (params, like, step, rate), key = arg0, arg1
-    keys = jax.random.split(key, 2)
-
-    _params = params + step * jax.random.normal(keys[0], shape=params.shape)
-    _alpha, _beta, _eta = np.exp(_params)
-    *_, _pi, _xi = solve(tilde_pi, tilde_xi, upsilon, (gamma, _alpha, _beta, _eta), 100)
-    _like = likelihood(_pi, _xi)
-
-    cond = _like - like > np.log(jax.random.uniform(keys[1]))
-    params = jax.lax.select(cond, _params, params)
-    like = jax.lax.select(cond, _like, like)
-    rate = rate + cond
-
-    return (params, like, step, rate), params
-
-def sample(params, key, step, count):
-
+def _log_density(params, state, iter):
     alpha, beta, eta = np.exp(params)
-    *_, pi, xi = solve(tilde_pi, tilde_xi, upsilon, (gamma, alpha, beta, eta), 100)
-    like = likelihood(pi, xi)
-
-    (params, _, _, rate), hypers = jax.lax.scan(_sample, (params, like, step, 0.), jax.random.split(key, count))
-    rate = rate / count
-    hypers = np.exp(hypers)
-
-    return rate, params, hypers
+    lmbda, nu, kappa, pi, xi = solve(tilde_pi, tilde_xi, upsilon, (gamma, alpha, beta, eta), iter, state)
+    return likelihood(pi, xi), (lmbda, nu, kappa)
 
-sample = jax.jit(sample, static_argnums=[2,3])
+init, sample = metropolis(lambda params: _log_density(params, None, 100), lambda params, state: _log_density(params, state, args.warm_iter))
 
 ###
-hypers = np.zeros((0,3))
-params = np.zeros(3)
-for iter in range(110):
-    key, subkey = jax.random.split(key)
-    rate, params, _hypers = sample(params, subkey, 0.1, 100)
-    hypers = np.concatenate((hypers, _hypers))
-    print('iter = {} (x100), rate = {}'.format(iter, rate))
+key, subkey = jax.random.split(key)
+params = init_chains(subkey, np.zeros(3), args.chains)
+hypers = np.exp(run_chains(init, sample, params, key, 0.1, 100, 110))
 
-hypers = hypers[1000::10,...]
+hypers = hypers[:,1000::10,...]
+print('rhat = {}, ess = {}'.format(rhat(hypers), ess(hypers)))
+hypers = hypers.reshape((-1,3))
 print(hypers.mean(axis=0))
 
 with open('adni/res/res{}{}.obj'.format('-' if args.tag else '', args.tag), 'wb') as f:
@@ -102,10 +102,14 @@ def _solve(arg0, arg1):
     kappa = operator_kappa(lmbda, hyper)
     return (lmbda, nu, kappa, pi, xi, tilde_pi, tilde_xi, upsilon, hyper), None
 
-def solve(tilde_pi, tilde_xi, upsilon, hyper, iter):
-    lmbda = np.zeros((dim_s, dim_z))
-    nu = np.zeros((dim_s, dim_z, dim_u))
-    kappa = np.zeros((dim_s, dim_z, dim_u, dim_xi))
+# init = (lmbda, nu, kappa) warm-starts the iterations, e.g. from the solution for nearby hyper-parameters
+def solve(tilde_pi, tilde_xi, upsilon, hyper, iter, init=None):
+    if init is None:
+        lmbda = np.zeros((dim_s, dim_z))
+        nu = np.zeros((dim_s, dim_z, dim_u))
+        kappa = np.zeros((dim_s, dim_z, dim_u, dim_xi))
+    else:
+        lmbda, nu, kappa = init
     pi = np.zeros((dim_z, dim_u))
     xi = np.zeros((dim_z, dim_u, dim_xi))
     (lmbda, nu, kappa, pi, xi, *_), _ = jax.lax.scan(_solve,
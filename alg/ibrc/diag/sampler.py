@@ -0,0 +1,88 @@
+import jax
+import jax.numpy as np
+import numpy as onp
+
+# Random walk Metropolis over many chains at once. Chains are vectorised with vmap inside a single jitted scan,
+# and every chain carries the state its current log-likelihood was computed with (e.g. the fixed point returned by
+# solve), so that the likelihood of a nearby proposal can be computed warm-started from it.
+#
+# init_density(params) -> like, state: computes the log-likelihood of params from scratch
+# log_density(params, state) -> like, state: computes the log-likelihood of params warm-started from state
+#
+# On CPU, the interpolations in the likelihood vectorise poorly, so by default chains are vmapped on accelerators
+# only and mapped over sequentially (still inside the same jitted step) on CPU.
+
+def metropolis(init_density, log_density, vectorise=None):
+    if vectorise is None:
+        vectorise = jax.devices()[0].platform != 'cpu'
+    batch = jax.vmap if vectorise else lambda f: lambda *args: jax.lax.map(lambda arg: f(*arg), args)
+
+    def _sample(arg0, arg1):
+        (params, like, state, step, rate), key = arg0, arg1
+        keys = jax.random.split(key, 2)
+
+        _params = params + step * jax.random.normal(keys[0], shape=params.shape)
+        _like, _state = log_density(_params, state)
+
+        cond = _like - like > np.log(jax.random.uniform(keys[1]))
+        params = jax.lax.select(cond, _params, params)
+        like = jax.lax.select(cond, _like, like)
+        state = tuple(jax.lax.select(cond, _x, x) for _x, x in zip(_state, state))
+        rate = rate + cond
+
+        return (params, like, state, step, rate), params
+
+    def sample(params, like, state, keys, step, count):
+        _chain = lambda params, like, state, key: jax.lax.scan(_sample, (params, like, state, step, 0.), jax.random.split(key, count))
+        (params, like, state, _, rate), trace = batch(_chain)(params, like, state, keys)
+        rate = rate / count
+        return rate, params, like, state, trace
+
+    init = jax.jit(batch(init_density))
+    sample = jax.jit(sample, static_argnums=[4,5])
+
+    return init, sample
+
+def init_chains(key, params, chains, scale=.5):
+    # the first chain starts at params, the others are overdispersed around it
+    noise = scale * jax.random.normal(key, shape=(chains-1,) + params.shape)
+    return np.concatenate((params[None,...], params[None,...] + noise))
+
+def run_chains(init, sample, params, key, step, count, iters):
+    like, state = init(params)
+    traces = []
+    for iter in range(iters):
+        key, subkey = jax.random.split(key)
+        rate, params, like, state, trace = sample(params, like, state, jax.random.split(subkey, params.shape[0]), step, count)
+        traces.append(trace)
+        print('iter = {} (x{}), rate = {}'.format(iter, count, rate.mean()))
+    return np.concatenate(traces, axis=1)
+
+###
+
+def rhat(samples):
+    # split R-hat of samples with shape (chains, draws, ...)
+    samples = onp.asarray(samples)
+    half = samples.shape[1] // 2
+    samples = onp.concatenate((samples[:,:half], samples[:,half:2*half]))
+    W = samples.var(axis=1, ddof=1).mean(axis=0)
+    B = half * samples.mean(axis=1).var(axis=0, ddof=1)
+    var = (half-1) / half * W + B / half
+    return onp.sqrt(var / W)
+
+def ess(samples):
+    # effective sample size of samples with shape (chains, draws, ...), truncated at the first negative pair of
+    # autocorrelations (Geyer's initial positive sequence)
+    samples = onp.asarray(samples)
+    chains, draws = samples.shape[:2]
+    x = samples.reshape((chains, draws, -1))
+    x = x - x.mean(axis=1, keepdims=True)
+    f = onp.fft.rfft(x, n=2*draws, axis=1)
+    acov = onp.fft.irfft(f * onp.conj(f), axis=1)[:,:draws] / draws
+    W = acov[:,0].mean(axis=0) * draws / (draws-1)
+    B = samples.reshape((chains, draws, -1)).mean(axis=1).var(axis=0, ddof=1) if chains > 1 else 0.
+    var = (draws-1) / draws * W + B
+    rho = 1 - (W - acov.mean(axis=0)) / var
+    pairs = rho[:2*(draws//2)].reshape((draws//2, 2, -1)).sum(axis=1)
+    tau = -1 + 2 * (pairs * onp.cumprod(pairs > 0, axis=0)).sum(axis=0)
+    return (chains * draws / onp.maximum(tau, 1. / onp.log10(chains * draws))).reshape(samples.shape[2:])
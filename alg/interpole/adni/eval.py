@@ -1,5 +1,6 @@
 import dill
 import jax
+import jax.numpy as np1
 import numpy as np
 import sklearn.metrics as metrics
 
@@ -12,45 +13,87 @@ Z = 12
 with open('data/adni.obj', 'rb') as f:
     data0 = dill.load(f)
 
+# policies are evaluated for a batch of beliefs b (n,S) at once
+
 def log_pi_il(mu, eta, b):
-    res = -eta * np.sum((mu - b[None,...])**2, axis=-1)
-    return res - np.log(np.sum(np.exp(res)))
+    res = -eta * np1.sum((mu - b[:,None,:])**2, axis=-1)
+    return res - np1.log(np1.sum(np1.exp(res), axis=-1, keepdims=True))
 
 def log_pi_irl(alp, bet, b):
-    res = np.zeros(A)
+    res = list()
     for a in range(A):
         if alp[a].size == 0:
-            res[a] = -1e6
+            res.append(-1e6 * np1.ones(b.shape[0]))
         else:
-            res[a] = bet * np.amax(alp[a] @ b)
-    return res - np.log(np.sum(np.exp(res)))
+            res.append(bet * np1.amax(b @ alp[a].T, axis=-1))
+    res = np1.stack(res, axis=-1)
+    return res - np1.log(np1.sum(np1.exp(res), axis=-1, keepdims=True))
+
+# recurrent policies step(params, carry, a, z) -> carry, probabilities of a1 = 1, for a batch of trajectories
+
+def belief_step(log_pi):
+    def step(params, b, a, z):
+        T, O, tht = params
+        b1 = O[a,:,z] * np1.einsum('ns,snj->nj', b, T[:,a,:])
+        b1 = b1 / b1.sum(axis=-1, keepdims=True)
+        b1 = np1.where(a[:,None] >= 0, b1, b)
+        return b1, np1.exp(log_pi(tht, 1, b1)[:,1])
+    return step
+
+step_il = belief_step(log_pi_il)
+step_irl = belief_step(log_pi_irl)
+
+def step_rbc(params, h_c, a, z):
+    h, c = h_c
+    x = np1.concatenate((jax.nn.one_hot(a, A), jax.nn.one_hot(z, Z)), axis=-1)
+    f = jax.nn.sigmoid(x @ params['W_f'].T + h @ params['U_f'].T + params['b_f'])
+    i = jax.nn.sigmoid(x @ params['W_i'].T + h @ params['U_i'].T + params['b_i'])
+    o = jax.nn.sigmoid(x @ params['W_o'].T + h @ params['U_o'].T + params['b_o'])
+    c = f * c + i * np1.tanh(x @ params['W_c'].T + h @ params['U_c'].T + params['b_c'])
+    h = o * np1.tanh(c)
+    l = np1.tanh(h @ params['W_l'].T + params['b_l'])
+    return (h, c), jax.nn.softmax(l @ params['W_y'].T + params['b_y'], axis=-1)[:,1]
+
+def scores(step, params, carry, data_a, data_z):
+    # scans the policy over the padded trajectories, y[i,t] is the score of a[i,t+1] given the history up to t
+    _step = lambda carry, a_z: step(params, carry, *a_z)
+    _, y = jax.lax.scan(_step, carry, (data_a[:,:-1].T, data_z[:,:-1].T))
+    return y.T
+scores = jax.jit(scores, static_argnums=0)
+
+def evaluate(alg, y_true, y_score):
+    alg['m1'].append(metrics.brier_score_loss(y_true, y_score))
+    alg['m2'].append(metrics.roc_auc_score(y_true, y_score))
+    pre, rec, _ = metrics.precision_recall_curve(y_true, y_score)
+    alg['m3'].append(metrics.auc(rec, pre))
 
-algs = [dict() for _ in range(4)]
+algs = [dict() for _ in range(5)]
 for alg in algs:
     alg['m1'] = list()
     alg['m2'] = list()
     alg['m3'] = list()
-m1_rbc = list()
-m2_rbc = list()
-m3_rbc = list()
+
+# interpole, pombil, and rbc are trained together by runner.py, with the fold as the leading axis
+with open('res/adni/res.obj', 'rb') as f:
+    res_runner = dill.load(f)
+    res_fold = lambda alg, fold: {key: val[fold] if np.ndim(val) > 0 else val for key, val in res_runner[alg].items()}
 
 for fold in range(5):
     data = data0[len(data0)*fold//5:len(data0)*(fold+1)//5]
 
-    with open('res/adni/res{}-interpole.obj'.format(fold), 'rb') as f:
-        res = dill.load(f)
-        algs[0]['name'] = 'interpole'
-        algs[0]['log_pi'] = log_pi_il
-        algs[0]['b0'] = res['b0']
-        algs[0]['T'] = res['T']
-        algs[0]['O'] = res['O']
-        algs[0]['tht'] = res['mu']
+    res = res_fold('interpole', fold)
+    algs[0]['name'] = 'interpole'
+    algs[0]['step'] = step_il
+    algs[0]['b0'] = res['b0']
+    algs[0]['T'] = res['T']
+    algs[0]['O'] = res['O']
+    algs[0]['tht'] = res['mu']
 
     with open('res/adni/res{}-offpoirl.obj'.format(fold), 'rb') as f:
         res = dill.load(f)
         res = res['out'][500::10]
         algs[1]['name'] = 'offpoirl'
-        algs[1]['log_pi'] = log_pi_irl
+        algs[1]['step'] = step_irl
         algs[1]['b0'] = np.zeros(S)
         algs[1]['T'] = np.zeros((S,A,S))
         algs[1]['O'] = np.zeros((A,S,Z))
@@ -70,7 +113,7 @@ for fold in range(5):
         res = dill.load(f)
         res = res['out'][500::10]
         algs[2]['name'] = 'poirl'
-        algs[2]['log_pi'] = log_pi_irl
+        algs[2]['step'] = step_irl
         algs[2]['b0'] = np.zeros(S)
         algs[2]['T'] = np.zeros((S,A,S))
         algs[2]['O'] = np.zeros((A,S,Z))
@@ -86,68 +129,44 @@ for fold in range(5):
         algs[2]['R'] /= len(res)
         algs[2]['tht'] = pomdp.solve(S, A, Z, algs[2]['b0'], algs[2]['T'], algs[2]['O'], algs[2]['R'])
 
-    with open('res/adni/res{}-pombil.obj'.format(fold), 'rb') as f:
-        res = dill.load(f)
-        algs[3]['name'] = 'pombil'
-        algs[3]['log_pi'] = log_pi_il
-        algs[3]['b0'] = res['b0']
-        algs[3]['T'] = res['T']
-        algs[3]['O'] = res['O']
-        algs[3]['tht'] = res['mu']
-
-    with open('res/adni/res{}-rbc.obj'.format(fold), 'rb') as f:
-        alg_rbc = dill.load(f)
-
-    y_true = list()
-    for traj in data:
-        for a1 in traj['a'][1:]:
-            y_true.append(a1)
+    res = res_fold('pombil', fold)
+    algs[3]['name'] = 'pombil'
+    algs[3]['step'] = step_il
+    algs[3]['b0'] = res['b0']
+    algs[3]['T'] = res['T']
+    algs[3]['O'] = res['O']
+    algs[3]['tht'] = res['mu']
+
+    res = res_fold('rbc', fold)
+    algs[4]['name'] = 'rbc'
+    algs[4]['step'] = step_rbc
+    algs[4]['params'] = {key: res[key] for key in res if key[:2] in ('W_', 'U_', 'b_')}
+    algs[4]['carry'] = lambda n, H=res['H']: (np.zeros((n,H)), np.zeros((n,H)))
+
+    # padded trajectories, the scores after the end of each trajectory are masked out
+    n = len(data)
+    tau = max([traj['tau'] for traj in data])
+    data_a = -1 * np.ones((n,tau), 'int')
+    data_z = -1 * np.ones((n,tau), 'int')
+    for i, traj in enumerate(data):
+        data_a[i,:traj['tau']] = traj['a']
+        data_z[i,:traj['tau']] = traj['z']
+    mask = data_a[:,1:] >= 0
+    y_true = data_a[:,1:][mask]
+
+    for alg in algs[:4]:
+        alg['params'] = (alg['T'], alg['O'], alg['tht'])
+        alg['carry'] = lambda n, b0=alg['b0']: np.tile(b0, (n,1))
 
     for alg in algs:
-
-        y_score = list()
-        for traj in data:
-            b = alg['b0']
-            for a, z, a1 in zip(traj['a'], traj['z'], traj['a'][1:]):
-                b = alg['O'][a,:,z] * (alg['T'][:,a,:].T @ b)
-                b /= b.sum()
-                pi = np.exp(alg['log_pi'](alg['tht'], 1, b)[1])
-                y_score.append(pi)
-
-        alg['m1'].append(metrics.brier_score_loss(y_true, y_score))
-        alg['m2'].append(metrics.roc_auc_score(y_true, y_score))
-        pre, rec, _ = metrics.precision_recall_curve(y_true, y_score)
-        alg['m3'].append(metrics.auc(rec, pre))
-
-    y_score = list()
-    for traj in data:
-        h = np.zeros(alg_rbc['H'])
-        c = np.zeros(alg_rbc['H'])
-        for a, z, a1 in zip(traj['a'], traj['z'], traj['a'][1:]):
-            x = np.concatenate((jax.nn.one_hot(a, A), jax.nn.one_hot(z, Z)))
-            f = jax.nn.sigmoid(alg_rbc['W_f'] @ x + alg_rbc['U_f'] @ h + alg_rbc['b_f'])
-            i = jax.nn.sigmoid(alg_rbc['W_i'] @ x + alg_rbc['U_i'] @ h + alg_rbc['b_i'])
-            o = jax.nn.sigmoid(alg_rbc['W_o'] @ x + alg_rbc['U_o'] @ h + alg_rbc['b_o'])
-            c = f * c + i * np.tanh(alg_rbc['W_c'] @ x + alg_rbc['U_c'] @ h + alg_rbc['b_c'])
-            h = o * np.tanh(c)
-            l = np.tanh(alg_rbc['W_l'] @ h + alg_rbc['b_l'])
-            pi = np.array(jax.nn.softmax(alg_rbc['W_y'] @ l + alg_rbc['b_y']))[1]
-            y_score.append(pi)
-
-    m1_rbc.append(metrics.brier_score_loss(y_true, y_score))
-    m2_rbc.append(metrics.roc_auc_score(y_true, y_score))
-    pre, rec, _ = metrics.precision_recall_curve(y_true, y_score)
-    m3_rbc.append(metrics.auc(rec, pre))
+        y_score = np.array(scores(alg['step'], alg['params'], alg['carry'](n), data_a, data_z))[mask]
+        evaluate(alg, y_true, y_score)
 
 for alg in algs:
     alg['m1'] = np.array(alg['m1'])
     alg['m2'] = np.array(alg['m2'])
     alg['m3'] = np.array(alg['m3'])
-m1_rbc = np.array(m1_rbc)
-m2_rbc = np.array(m2_rbc)
-m3_rbc = np.array(m3_rbc)
 
 print('alg: calibration, AU-ROC, AU-PR')
 for alg in algs:
     print('{}: {} ({}), {} ({}), {} ({})'.format(alg['name'], alg['m1'].mean(), alg['m1'].std(), alg['m2'].mean(), alg['m2'].std(), alg['m3'].mean(), alg['m3'].std()))
-print('rbc: {} ({}), {} ({}), {} ({})'.format(m1_rbc.mean(), m1_rbc.std(), m2_rbc.mean(), m2_rbc.std(), m3_rbc.mean(), m3_rbc.std()))
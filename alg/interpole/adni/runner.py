@@ -0,0 +1,368 @@
+import argparse
+import dill
+import numpy as np1
+import jax
+import jax.numpy as np
+
+# Trains interpole, pombil and rbc on all cross-validation folds in a single process. The folds are padded to the
+# same number of trajectories and vmapped, and every optimisation loop (Adam, and EM for pombil) runs inside
+# jitted while-loops of up to --chunk iterations, with the same updates and stopping rules as main-offpoirl.py and
+# main-poirl.py. Fold i is initialised from fold_in(PRNGKey(--seed), i). The results of all algorithms and folds are
+# stored in res/adni/res.obj, with the fold as the leading axis of every array.
+#
+# offpoirl and poirl call the external pomdp-solve at every step, so they still run through main-offpoirl.py and
+# main-poirl.py.
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--silent', action='store_true')
+parser.add_argument('-n', type=int, default=5)
+parser.add_argument('--algs', default='interpole,pombil,rbc')
+parser.add_argument('--chunk', type=int, default=100)
+parser.add_argument('--seed', type=int, default=0)
+args = parser.parse_args()
+
+###
+S = 3
+A = 2
+Z = 12
+H = 64
+L = 64
+with open('data/adni.obj', 'rb') as f:
+    data = dill.load(f)
+    folds = [data[:len(data)*i//args.n] + data[len(data)*(i+1)//args.n:] for i in range(args.n)]
+
+n = max([len(fold) for fold in folds])
+tau = max([d['tau'] for d in data])
+data_a = -1 * np1.ones((args.n,n,tau), 'int')
+data_z = -1 * np1.ones((args.n,n,tau), 'int')
+data_m = np1.zeros((args.n,n))
+for k, fold in enumerate(folds):
+    for i, traj in enumerate(fold):
+        data_a[k,i,:traj['tau']] = traj['a']
+        data_z[k,i,:traj['tau']] = traj['z']
+        data_m[k,i] = 1
+data_a, data_z, data_m = np.array(data_a), np.array(data_z), np.array(data_m)
+
+
+def adam(score, update, max_iter=10000, window=100, tol=1e-6):
+    # Adam ascent on score(params, aux, data), where aux = update(params, aux, data) is refreshed after every step.
+    # Stops when the score improved by less than tol over the last window iterations and keeps the best params.
+    grad_score = jax.grad(score)
+
+    def _init(params, aux, data):
+        state = dict()
+        state['i'] = np.array(0)
+        state['params'] = params
+        state['adam_m'] = {key: np.zeros(params[key].shape) for key in params}
+        state['adam_v'] = {key: np.zeros(params[key].shape) for key in params}
+        state['aux'] = aux
+        state['objectives'] = np.full(window, np.nan).at[0].set(score(params, aux, data))
+        state['max_objective'] = np.array(-np.inf)
+        state['max_params'] = params
+        state['stop'] = np.array(False)
+        return state
+
+    def _cond(state):
+        return (state['i'] < max_iter) & ~state['stop']
+
+    def _body(state, data):
+        i, params, aux = state['i'], state['params'], state['aux']
+        grad = grad_score(params, aux, data)
+        adam_m = {key: .1 * grad[key] + .9 * state['adam_m'][key] for key in params}
+        adam_v = {key: .001 * grad[key]**2 + .999 * state['adam_v'][key] for key in params}
+        params = {key: params[key] + .001 * (adam_m[key] / (1-.9**(i+1))) / (np.sqrt(adam_v[key] / (1-.999**(i+1))) + 1e-8) for key in params}
+        aux = update(params, aux, data)
+
+        objective = score(params, aux, data)
+        better = objective > state['max_objective']
+
+        state = dict(state)
+        state['i'] = i + 1
+        state['params'], state['adam_m'], state['adam_v'], state['aux'] = params, adam_m, adam_v, aux
+        state['max_objective'] = np.where(better, objective, state['max_objective'])
+        state['max_params'] = {key: np.where(better, params[key], state['max_params'][key]) for key in params}
+        state['stop'] = objective - state['objectives'][(i+2) % window] < tol
+        state['objectives'] = state['objectives'].at[(i+1) % window].set(objective)
+        return state
+
+    def _run(state, data, chunk):
+        i0 = state['i']
+        return jax.lax.while_loop(lambda state: _cond(state) & (state['i'] < i0 + chunk), lambda state: _body(state, data), state)
+
+    init = jax.jit(jax.vmap(_init))
+    run = jax.jit(jax.vmap(_run, in_axes=(0,0,None)), static_argnums=2)
+    cond = jax.jit(jax.vmap(_cond))
+    return init, run, cond
+
+def optimize(init, run, cond, params, aux, data, name):
+    state = init(params, aux, data)
+    window = state['objectives'].shape[-1]
+    while cond(state).any():
+        state = run(state, data, args.chunk)
+        if not args.silent:
+            print('alg: {}, i = {}, objective = {}'.format(name, state['i'], state['objectives'][np.arange(args.n),state['i'] % window]))
+    return state
+
+def per_fold(init, key):
+    # initial values of every fold, drawn from the fold's own key and stacked along a leading fold axis
+    values = [init(jax.random.fold_in(key, i)) for i in range(args.n)]
+    return jax.tree_util.tree_map(lambda *x: np.stack(x), *values)
+
+
+def init_pomdp(key):
+    key, *subkey = jax.random.split(key, 4)
+    b0 = np1.array(jax.random.dirichlet(subkey[0], np.ones(S)))
+    T = np1.array(jax.random.dirichlet(subkey[1], np.ones((S,A,S)), shape=(S,A)))
+    O = np1.array(jax.random.dirichlet(subkey[2], np.ones((A,S,Z)), shape=(A,S)))
+
+    ###
+    O[0,:,(1,2,3,5,6,7,9,10,11)] = np1.zeros((S,9)).T
+    O[1,:,(0,4,8)] = np1.zeros((S,3)).T
+    O /= O.sum(axis=-1, keepdims=True)
+
+    return key, np.array(b0), np.array(T), np.array(O)
+
+def init_mu(key):
+    key, subkey = jax.random.split(key)
+    mu = np.ones((A,S))
+    mu += .001 * jax.random.normal(subkey, shape=(A,S))
+    mu /= mu.sum(axis=-1, keepdims=True)
+    return key, mu
+
+def log_pi(mu, eta, b):
+    res = -eta * np.sum((mu - b[None,...])**2, axis=-1)
+    return res - np.log(np.sum(np.exp(res)))
+
+def _messages_alp(alp_T_O, a_z):
+    alp, T, O = alp_T_O
+    a, z = a_z
+    alp1 = jax.lax.select(a >= 0, O[a,:,z] * (T[:,a,:].T @ alp), alp)
+    alp1 = alp1 / alp1.sum()
+    return (alp1, T, O), alp1
+
+def _messages_bet(bet_T_O, a_z):
+    bet, T, O = bet_T_O
+    a, z = a_z
+    bet1 = jax.lax.select(a >= 0, T[:,a,:] @ (O[a,:,z] * bet), bet)
+    bet1 = bet1 / bet1.sum()
+    return (bet1, T, O), bet1
+
+def _messages_xi(T, O, a, z, alp, bet1):
+    xi = jax.lax.select(a >= 0, T[:,a,:] * O[None,a,:,z] * (alp[:,None] @ bet1[None,:]), np.eye(S))
+    xi = xi / xi.sum()
+    return xi
+_messages_xi = jax.vmap(_messages_xi, in_axes=(None,None,0,0,0,0), out_axes=0)
+
+def _beliefs(b0, T, O, traj_a, traj_z):
+    _, alps = jax.lax.scan(_messages_alp, (b0, T, O), (traj_a, traj_z))
+    return np.concatenate((b0[None,...], alps))
+
+def messages(b0, T, O, traj_a, traj_z):
+    alps = _beliefs(b0, T, O, traj_a, traj_z)
+    _, bets = jax.lax.scan(_messages_bet, (np.ones(S), T, O), (traj_a, traj_z), reverse=True)
+    bets = np.concatenate((bets, np.ones(S)[None,...]))
+    gmms = alps * bets
+    gmms = gmms / gmms.sum(axis=-1, keepdims=True)
+    xis = _messages_xi(T, O, traj_a, traj_z, alps[:-1], bets[1:])
+    return gmms, xis
+
+beliefs = jax.vmap(_beliefs, in_axes=(None,None,None,0,0), out_axes=0)
+messages = jax.vmap(messages, in_axes=(None,None,None,0,0), out_axes=0)
+
+def _likelihood0(T, O, mu, eta, a, z, gmm1, xi, b):
+    res = (a >= 0) * np.sum(gmm1 * np.log(O[a,:,z]+1e-6))
+    res += (a >= 0) * np.sum(xi * np.log(T[:,a,:]+1e-6))
+    res += (a >= 0) * log_pi(mu, eta, b)[a]
+    return res
+_likelihood0 = jax.vmap(_likelihood0, in_axes=(None,None,None,None,0,0,0,0,0), out_axes=0)
+
+def likelihood(b0, T, O, mu, eta, traj_a, traj_z, gmms, xis, bs):
+    res = np.sum(gmms[0] * np.log(b0))
+    res = res + _likelihood0(T, O, mu, eta, traj_a, traj_z, gmms[1:], xis, bs[:-1]).sum()
+    return res
+likelihood = jax.vmap(likelihood, in_axes=(None,None,None,None,None,0,0,0,0,0), out_axes=0)
+
+def likelihood_n(mu, eta, a, z, alp):
+    return (a >= 0) * log_pi(mu, eta, alp)[a]
+likelihood_n = jax.vmap(likelihood_n, in_axes=(None,None,0,0,0), out_axes=0)
+likelihood_n = jax.vmap(likelihood_n, in_axes=(None,None,0,0,0), out_axes=0)
+
+def unpack(params):
+    b0 = np.exp(params['b0'])
+    b0 = b0 / b0.sum()
+    T = np.exp(params['T'])
+    T = T / T.sum()
+    O1 = np.exp(params['O1'])
+    O1 = O1 / O1.sum(axis=-1, keepdims=True)
+    O2 = np.exp(params['O2'])
+    O2 = O2 / O2.sum(axis=-1, keepdims=True)
+    O1 = np.zeros((S,Z)).at[:,(0,4,8)].set(O1)
+    O2 = np.zeros((S,Z)).at[:,(1,2,3,5,6,7,9,10,11)].set(O2)
+    O = np.stack((O1, O2))
+    return b0, T, O
+
+def unpack_n(params):
+    mu = params['mu']
+    mu = mu / mu.sum(axis=-1, keepdims=True)
+    eta = 1
+    return mu, eta
+
+###
+def run_interpole(key):
+    def init(key):
+        key, b0, T, O = init_pomdp(key)
+        key, mu = init_mu(key)
+
+        params = dict()
+        params['mu'] = mu
+        params['b0'] = np.log(np.e * b0)
+        params['T'] = np.log(np.e * T)
+        params['O1'] = np.log(np.e * O[0][:,(0,4,8)])
+        params['O2'] = np.log(np.e * O[1][:,(1,2,3,5,6,7,9,10,11)])
+        return params, (b0, T, O)
+
+    params, (b0, T, O) = per_fold(init, key)
+
+    def score(params, GMMS_XIS, data):
+        b0, T, O = unpack(params)
+        mu, eta = unpack_n(params)
+        traj_a, traj_z, traj_m = data
+        BS = beliefs(b0, T, O, traj_a, traj_z)
+        return (traj_m * likelihood(b0, T, O, mu, eta, traj_a, traj_z, *GMMS_XIS, BS)).sum()
+
+    def update(params, GMMS_XIS, data):
+        b0, T, O = unpack(params)
+        return messages(b0, T, O, data[0], data[1])
+
+    GMMS_XIS = jax.vmap(messages)(b0, T, O, data_a, data_z)
+    state = optimize(*adam(score, update), params, GMMS_XIS, (data_a, data_z, data_m), 'interpole')
+
+    res = dict()
+    res['b0'], res['T'], res['O'] = jax.vmap(unpack)(state['max_params'])
+    res['mu'] = jax.vmap(unpack_n)(state['max_params'])[0]
+    res['eta'] = 1
+    res['objective'] = state['max_objective']
+    return res
+
+def em(b0, T, O, traj_a, traj_z, traj_m):
+    # Baum-Welch for the POMDP dynamics, with the expected counts of all trajectories accumulated at once
+    on_a = 1. * (traj_a[...,None] == np.arange(A))
+    on_z = 1. * (traj_z[...,None] == np.arange(Z))
+
+    def body(state):
+        i, b0, T, O, _ = state
+        GMMS, XIS = messages(b0, T, O, traj_a, traj_z)
+
+        _b0 = np.sum(traj_m[:,None] * GMMS[:,0], axis=0)
+        _T = np.einsum('nta,ntij->iaj', on_a, XIS)
+        _O = np.einsum('nta,ntz,nts->asz', on_a, on_z, GMMS[:,1:])
+
+        _b0 /= _b0.sum()
+        _T /= _T.sum(axis=-1, keepdims=True)
+        _O /= _O.sum(axis=-1, keepdims=True)
+
+        diff = np.maximum(np.abs(_b0-b0).max(), np.maximum(np.abs(_T-T).max(), np.abs(_O-O).max()))
+        return i + 1, _b0, _T, _O, diff
+
+    _, b0, T, O, _ = jax.lax.while_loop(lambda state: (state[0] < 1000) & (state[4] >= 1e-6), body, (0, b0, T, O, np.inf))
+    return b0, T, O
+em = jax.jit(jax.vmap(em))
+
+def run_pombil(key):
+    def init(key):
+        key, b0, T, O = init_pomdp(key)
+        key, mu = init_mu(key)
+        return (b0, T, O), {'mu': mu}
+
+    (b0, T, O), params = per_fold(init, key)
+    b0, T, O = em(b0, T, O, data_a, data_z, data_m)
+
+    def score(params, ALPS, data):
+        mu, eta = unpack_n(params)
+        return likelihood_n(mu, eta, data[0], data[1], ALPS).sum()
+
+    ALPS = jax.vmap(beliefs)(b0, T, O, data_a, data_z)[:,:,:-1]
+    state = optimize(*adam(score, lambda params, ALPS, data: ALPS), params, ALPS, (data_a, data_z), 'pombil')
+
+    res = dict()
+    res['b0'], res['T'], res['O'] = b0, T, O
+    res['mu'] = jax.vmap(unpack_n)(state['max_params'])[0]
+    res['eta'] = 1
+    res['objective'] = state['max_objective']
+    return res
+
+def _network(h_c_params, x):
+    h, c, params = h_c_params
+    f = jax.nn.sigmoid(params['W_f'] @ x + params['U_f'] @ h + params['b_f'])
+    i = jax.nn.sigmoid(params['W_i'] @ x + params['U_i'] @ h + params['b_i'])
+    o = jax.nn.sigmoid(params['W_o'] @ x + params['U_o'] @ h + params['b_o'])
+    c1 = f * c + i * np.tanh(params['W_c'] @ x + params['U_c'] @ h + params['b_c'])
+    h1 = o * np.tanh(c1)
+    l = np.tanh(params['W_l'] @ h1 + params['b_l'])
+    y = jax.nn.softmax(params['W_y'] @ l + params['b_y'])
+    return (h1, c1, params), y
+
+def network(params, traj_a, traj_z):
+    traj = np.concatenate((traj_a, traj_z), axis=-1)
+    _, ys = jax.lax.scan(_network, (np.zeros(H), np.zeros(H), params), traj)
+    return ys
+network = jax.vmap(network, in_axes=(None,0,0), out_axes=0)
+
+def init_rbc(key):
+    params = dict()
+    key, *subkey = jax.random.split(key, 17)
+    params['W_f'] = .001 * jax.random.normal(subkey[0], shape=(H,A+Z))
+    params['W_i'] = .001 * jax.random.normal(subkey[1], shape=(H,A+Z))
+    params['W_o'] = .001 * jax.random.normal(subkey[2], shape=(H,A+Z))
+    params['W_c'] = .001 * jax.random.normal(subkey[3], shape=(H,A+Z))
+    params['W_l'] = .001 * jax.random.normal(subkey[4], shape=(L,H))
+    params['W_y'] = .001 * jax.random.normal(subkey[5], shape=(A,L))
+    params['U_f'] = .001 * jax.random.normal(subkey[6], shape=(H,H))
+    params['U_i'] = .001 * jax.random.normal(subkey[7], shape=(H,H))
+    params['U_o'] = .001 * jax.random.normal(subkey[8], shape=(H,H))
+    params['U_c'] = .001 * jax.random.normal(subkey[9], shape=(H,H))
+    params['b_f'] = .001 * jax.random.normal(subkey[10], shape=(H,))
+    params['b_i'] = .001 * jax.random.normal(subkey[11], shape=(H,))
+    params['b_o'] = .001 * jax.random.normal(subkey[12], shape=(H,))
+    params['b_c'] = .001 * jax.random.normal(subkey[13], shape=(H,))
+    params['b_l'] = .001 * jax.random.normal(subkey[14], shape=(L,))
+    params['b_y'] = .001 * jax.random.normal(subkey[15], shape=(A,))
+    return params
+
+def run_rbc(key):
+    params = per_fold(init_rbc, key)
+
+    # one-hot actions and observations, -1 after the end of each trajectory
+    data_a1 = np.where(data_a[...,None] >= 0, jax.nn.one_hot(data_a, A), -1)
+    data_z1 = np.where(data_z[...,None] >= 0, jax.nn.one_hot(data_z, Z), -1)
+
+    # the negative of the cross-entropy objective of rbc, so that it is maximised like the others
+    def score(params, _, data):
+        traj_a, traj_z = data
+        ys = network(params, traj_a[:,:-1,...], traj_z[:,:-1,...])
+        return np.sum((traj_a[:,1:,...] > 0) * np.log(ys))
+
+    state = optimize(*adam(score, lambda params, _, data: _), params, None, (data_a1, data_z1), 'rbc')
+
+    res = dict(state['max_params'])
+    res['H'] = H
+    res['L'] = L
+    res['objective'] = -state['max_objective']
+    return res
+
+###
+runs = {'interpole': run_interpole, 'pombil': run_pombil, 'rbc': run_rbc}
+
+try:
+    with open('res/adni/res.obj', 'rb') as f:
+        res = dill.load(f)
+except FileNotFoundError:
+    res = dict()
+
+for alg in args.algs.split(','):
+    if not args.silent:
+        print('alg: {}'.format(alg))
+    res[alg] = {key: np1.asarray(val) for key, val in runs[alg](jax.random.PRNGKey(args.seed)).items()}
+
+with open('res/adni/res.obj', 'wb') as f:
+    dill.dump(res, f)
@@ -14,38 +14,8 @@ import numpy as np
 import warnings
 warnings.filterwarnings("ignore")
 
-from sklearn.linear_model import LogisticRegression
-
-
-def pate_lamda (x, teacher_models, lamda):
-  '''Returns PATE_lambda(x).
-  
-  Args:
-    - x: feature vector
-    - teacher_models: a list of teacher models
-    - lamda: parameter
-    
-  Returns:
-    - n0, n1: the number of label 0 and 1, respectively
-    - out: label after adding laplace noise.
-  '''
-      
-  y_hat = list()
-        
-  for teacher in teacher_models:            
-    temp_y = teacher.predict(np.reshape(x, [1,-1]))
-    y_hat = y_hat + [temp_y]
-  
-  y_hat = np.asarray(y_hat)
-  n0 = sum(y_hat == 0)
-  n1 = sum(y_hat == 1)
-  
-  lap_noise = np.random.laplace(loc=0.0, scale=lamda)
-  
-  out = (n1+lap_noise) / float(n0+n1)
-  out = int(out>0.5)
-        
-  return n0, n1, out 
+from teachers import TeacherEnsemble, pate_lamda_batch, moments_accountant, \
+                     epsilon_hat as compute_epsilon_hat
 
 
 def pategan(x_train, parameters):
@@ -180,71 +150,45 @@ def pategan(x_train, parameters):
   ## Sessions
   sess = tf.Session()
   sess.run(tf.global_variables_initializer())
+
+  # Teachers are kept across iterations and refit with warm start
+  teachers = TeacherEnsemble(k)
         
   ## Iterations
   while epsilon_hat < epsilon:      
           
-    # 1. Train teacher models
-    teacher_models = list()
-    
-    for _ in range(k):
-                
-      Z_mb = sample_Z(partition_data_no, z_dim)
-      G_mb = sess.run(G_sample, feed_dict = {Z: Z_mb})
-                
-      temp_x = x_partition[i]
-      idx = np.random.permutation(len(temp_x[:, 0]))
-      X_mb = temp_x[idx[:partition_data_no], :]
-                
-      X_comb = np.concatenate((X_mb, G_mb), axis = 0)
-      Y_comb = np.concatenate((np.ones([partition_data_no,]), 
-                               np.zeros([partition_data_no,])), axis = 0)
-                
-      model = LogisticRegression()
-      model.fit(X_comb, Y_comb)
-      teacher_models = teacher_models + [model]
-            
+    # 1. Train teacher models (warm-started from the previous iteration)
+    Z_mb = sample_Z(k * partition_data_no, z_dim)
+    G_mb = sess.run(G_sample, feed_dict = {Z: Z_mb})
+    g_partition = np.split(G_mb, k)
+
+    teachers.fit(x_partition, g_partition)
+
     # 2. Student training
     for _ in range(n_s):
-          
+
       Z_mb = sample_Z(batch_size, z_dim)
       G_mb = sess.run(G_sample, feed_dict = {Z: Z_mb})
-      Y_mb = list()
-            
-      for j in range(batch_size):                
-        n0, n1, r_j = pate_lamda(G_mb[j, :], teacher_models, lamda)
-        Y_mb = Y_mb + [r_j]
-       
-        # Update moments accountant
-        q = np.log(2 + lamda * abs(n0 - n1)) - np.log(4.0) - \
-            (lamda * abs(n0 - n1))
-        q = np.exp(q)
-                
-        # Compute alpha
-        for l in range(L):
-          temp1 = 2 * (lamda**2) * (l+1) * (l+2)
-          temp2 = (1-q) * ( ((1-q)/(1-q*np.exp(2*lamda)))**(l+1) ) + \
-                  q * np.exp(2*lamda * (l+1))
-          alpha[l] = alpha[l] + np.min([temp1, np.log(temp2)])
-        
-      # PATE labels for G_mb  
-      Y_mb = np.reshape(np.asarray(Y_mb), [-1,1])
-                
+
+      # Noisy teacher votes for the whole batch
+      n0, n1, Y_mb = pate_lamda_batch(G_mb, teachers, lamda)
+
+      # Update moments accountant
+      alpha = moments_accountant(alpha, n0, n1, lamda)
+
+      # PATE labels for G_mb
+      Y_mb = np.reshape(Y_mb, [-1,1])
+
       # Update student
-      _, D_loss_curr, _ = sess.run([S_solver, S_loss, clip_S], 
+      _, D_loss_curr, _ = sess.run([S_solver, S_loss, clip_S],
                                    feed_dict = {Z: Z_mb, Y: Y_mb})
-    
+
     # Generator Update        
     Z_mb = sample_Z(batch_size, z_dim)
     _, G_loss_curr = sess.run([G_solver, G_loss], feed_dict = {Z: Z_mb})
         
     # epsilon_hat computation
-    curr_list = list()        
-    for l in range(L):
-      temp_alpha = (alpha[l] + np.log(1/delta)) / float(l+1)
-      curr_list = curr_list + [temp_alpha]
-        
-    epsilon_hat = np.min(curr_list)    
+    epsilon_hat = compute_epsilon_hat(alpha, delta)
 
   ## Outputs
   x_train_hat = sess.run([G_sample], feed_dict = {Z: sample_Z(no, z_dim)})[0]
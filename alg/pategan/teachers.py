@@ -0,0 +1,126 @@
+"""PATE-GAN: Generating Synthetic Data with Differential Privacy Guarantees Codebase.
+
+Reference: James Jordon, Jinsung Yoon, Mihaela van der Schaar,
+"PATE-GAN: Generating Synthetic Data with Differential Privacy Guarantees,"
+International Conference on Learning Representations (ICLR), 2019.
+Paper link: https://openreview.net/forum?id=S1zk9iRqF7
+
+teachers.py
+- Batched teacher ensemble, noisy PATE aggregation and moments accountant
+"""
+
+# Necessary packages
+import numpy as np
+from sklearn.linear_model import LogisticRegression
+
+
+class TeacherEnsemble(object):
+  """k logistic regression teachers scored together with one matrix product.
+
+  The teachers are kept across the outer PATE-GAN iterations and refit with
+  warm_start, so each refit starts from the previous coefficients.
+
+  Args:
+    - k: the number of teachers
+  """
+
+  def __init__(self, k):
+    self.k = k
+    self.models = [LogisticRegression(warm_start = True) for _ in range(k)]
+    self.W = None
+    self.b = None
+
+  def fit(self, x_partition, g_partition):
+    """Refit every teacher on its real data partition vs. generated data.
+
+    Args:
+      - x_partition: list of k real data partitions
+      - g_partition: list of k generated data blocks of the same size
+    """
+    for model, x_real, x_fake in zip(self.models, x_partition, g_partition):
+      X_comb = np.concatenate((x_real, x_fake), axis = 0)
+      Y_comb = np.concatenate((np.ones([len(x_real),]),
+                               np.zeros([len(x_fake),])), axis = 0)
+      model.fit(X_comb, Y_comb)
+
+    # Stack coefficients: W (dim, k), b (k,)
+    self.W = np.stack([model.coef_[0] for model in self.models], axis = 1)
+    self.b = np.asarray([model.intercept_[0] for model in self.models])
+
+  def votes(self, x):
+    """Returns the label votes of all teachers for all samples.
+
+    Args:
+      - x: samples (n, dim)
+
+    Returns:
+      - votes: 0/1 matrix (n, k), identical to teacher.predict for each teacher
+    """
+    return (np.matmul(x, self.W) + self.b > 0).astype(int)
+
+
+def pate_lamda_batch (x, teachers, lamda):
+  """Returns PATE_lambda(x) for a batch of samples.
+
+  Args:
+    - x: samples (n, dim)
+    - teachers: fitted TeacherEnsemble
+    - lamda: parameter
+
+  Returns:
+    - n0, n1: the number of label 0 and 1 for each sample, respectively
+    - out: labels after adding laplace noise
+  """
+  votes = teachers.votes(x)
+  n1 = np.sum(votes, axis = 1)
+  n0 = teachers.k - n1
+
+  lap_noise = np.random.laplace(loc=0.0, scale=lamda, size=len(n1))
+
+  out = (n1 + lap_noise) / float(teachers.k)
+  out = (out > 0.5).astype(int)
+
+  return n0, n1, out
+
+
+def moments_accountant (alpha, n0, n1, lamda):
+  """Update the moments accountant with the votes of a batch of samples.
+
+  Args:
+    - alpha: current moments (L,)
+    - n0, n1: the number of label 0 and 1 for each sample
+    - lamda: parameter
+
+  Returns:
+    - alpha: updated moments (L,)
+  """
+  L = len(alpha)
+  gap = lamda * np.abs(n0 - n1)
+
+  # q for each sample: (n, 1)
+  q = np.exp(np.log(2 + gap) - np.log(4.0) - gap)[:, None]
+
+  # moment orders l+1: (1, L)
+  l = np.arange(1, L + 1)[None, :]
+
+  temp1 = 2 * (lamda**2) * l * (l+1)
+  with np.errstate(divide = 'ignore', invalid = 'ignore'):
+    temp2 = (1-q) * ( ((1-q)/(1-q*np.exp(2*lamda)))**l ) + \
+            q * np.exp(2*lamda * l)
+    bound = np.minimum(temp1, np.log(temp2))
+
+  return alpha + np.sum(bound, axis = 0)
+
+
+def epsilon_hat (alpha, delta):
+  """Returns the privacy cost spent so far.
+
+  Args:
+    - alpha: current moments (L,)
+    - delta: Differential privacy parameter
+
+  Returns:
+    - epsilon_hat: min over moments of (alpha_l + log(1/delta)) / l
+  """
+  l = np.arange(1, len(alpha) + 1)
+  return np.min((alpha + np.log(1/delta)) / l)
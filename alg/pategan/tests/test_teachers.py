@@ -0,0 +1,70 @@
+"""Checks the batched teacher voting and moments accountant of teachers.py
+against the per-sample loops of the original PATE-GAN implementation.
+"""
+
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from teachers import TeacherEnsemble, pate_lamda_batch, moments_accountant, \
+                     epsilon_hat  # noqa: E402
+
+
+def per_sample_accountant(alpha, n0, n1, lamda):
+  # Moments accountant update of the original per-sample loop
+  alpha = np.array(alpha, dtype=float)
+  L = len(alpha)
+  for j in range(len(n0)):
+    q = np.log(2 + lamda * abs(n0[j] - n1[j])) - np.log(4.0) - \
+        (lamda * abs(n0[j] - n1[j]))
+    q = np.exp(q)
+    for l in range(L):
+      temp1 = 2 * (lamda**2) * (l+1) * (l+2)
+      temp2 = (1-q) * ( ((1-q)/(1-q*np.exp(2*lamda)))**(l+1) ) + \
+              q * np.exp(2*lamda * (l+1))
+      alpha[l] = alpha[l] + np.min([temp1, np.log(temp2)])
+  return alpha
+
+
+def test_moments_accountant_matches_per_sample():
+  rng = np.random.RandomState(0)
+  k, L = 10, 20
+  n1 = rng.randint(0, k + 1, size=64)
+  n0 = k - n1
+  for lamda in [0.01, 0.1, 1.0]:
+    alpha = rng.uniform(0, 1, size=L)
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+      expected = per_sample_accountant(alpha, n0, n1, lamda)
+    np.testing.assert_allclose(moments_accountant(alpha, n0, n1, lamda),
+                               expected, rtol=1e-10)
+
+
+def test_epsilon_hat_matches_per_moment():
+  alpha = np.random.RandomState(0).uniform(0, 5, size=20)
+  delta = 1e-5
+  expected = np.min([(alpha[l] + np.log(1/delta)) / float(l+1)
+                     for l in range(len(alpha))])
+  assert epsilon_hat(alpha, delta) == expected
+
+
+def test_votes_match_teacher_predict():
+  rng = np.random.RandomState(0)
+  k, n, dim = 5, 40, 4
+  x_partition = [rng.normal(1, 1, size=(n, dim)) for _ in range(k)]
+  g_partition = [rng.normal(0, 1, size=(n, dim)) for _ in range(k)]
+  teachers = TeacherEnsemble(k)
+  teachers.fit(x_partition, g_partition)
+
+  x = rng.normal(0.5, 1, size=(100, dim))
+  votes = teachers.votes(x)
+  expected = np.stack([model.predict(x) for model in teachers.models], axis=1)
+  np.testing.assert_array_equal(votes, expected)
+
+  # Without noise the aggregated label is the majority vote
+  n0, n1, out = pate_lamda_batch(x, teachers, 0.0)
+  np.testing.assert_array_equal(n1, expected.sum(axis=1))
+  np.testing.assert_array_equal(n0 + n1, k)
+  np.testing.assert_array_equal(out, (n1 / float(k) > 0.5).astype(int))
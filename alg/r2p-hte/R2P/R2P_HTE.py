@@ -1,8 +1,11 @@
+from multiprocessing import Pool
+
 from sklearn.model_selection import train_test_split
 
 from R2P.helper import IcpRegressor_r2p
 from R2P.helper import RegressorNc_r2p
 from R2P.r2p_utils import *
+from R2P.split_search import SplitSearch, candidate_values, init_split_worker, search_split_worker
 from nonconformist.nc import AbsErrorErrFunc
 
 
@@ -11,8 +14,8 @@ class R2P_HTE:
                  max_depth=-1, min_size=10,
                  conformal_mode="SCR", params_qf=None,
                  significance=0.05, weight=0.5, gamma=0.05,
-                 sig_for_split=0.8,
-                 seed=None):
+                 sig_for_split=0.8, split_bins=None,
+                 seed=None, n_jobs=1):
 
         self.root = None
         self.max = -np.inf
@@ -31,7 +34,9 @@ class R2P_HTE:
         self.sig_for_split = 1 - np.sqrt(1 - sig_for_split)
         self.weight = weight
         self.gamma = gamma
+        self.split_bins = split_bins
         self.seed = seed
+        self.n_jobs = n_jobs
         self.eval_func = self.conf_homo
 
         self.tree_depth = 0
@@ -46,6 +51,7 @@ class R2P_HTE:
                      est_control_treat=None, est_control_control=None,
                      conf_pred_treat=None, confl_pred_control=None,
                      cal_scores_treat=None, cal_scores_control=None,
+                     val_idx_treat=None, val_idx_control=None,
                      node_depth=0):
             self.col = col  # the column of the feature used for splitting
             self.value = value  # the value that splits the data
@@ -61,6 +67,10 @@ class R2P_HTE:
             self.cal_scores_treat = cal_scores_treat
             self.cal_scores_control = cal_scores_control
 
+            # validation samples of the node, as indices into the validation samples of the root
+            self.val_idx_treat = val_idx_treat
+            self.val_idx_control = val_idx_control
+
             self.obj = obj
             self.intv_len = intv_len
             self.homogeneity = homogeneity
@@ -154,211 +164,148 @@ class R2P_HTE:
                               est_treat_treat=val_est_treat_treat, est_treat_control=val_est_treat_control,
                               est_control_treat=val_est_control_treat, est_control_control=val_est_control_control,
                               conf_pred_treat=icp_treat, confl_pred_control=icp_control,
-                              cal_scores_treat=cal_scores_treat, cal_scores_control=cal_scores_control, node_depth=0)
+                              cal_scores_treat=cal_scores_treat, cal_scores_control=cal_scores_control,
+                              val_idx_treat=np.arange(total_val_no_treat),
+                              val_idx_control=np.arange(total_val_no_control), node_depth=0)
 
-        self.root = self.fit_r(rows_treat, labels_treat, rows_control, labels_control, curr_depth=0, node=self.root,
-                               val_rows_treat=val_rows_treat, val_labels_treat=val_labels_treat,
-                               val_rows_control=val_rows_control, val_labels_control=val_labels_control,
-                               total_val_no_treat=total_val_no_treat, total_val_no_control=total_val_no_control)
+        self.fit_r(rows_treat, rows_control, val_rows_treat, val_rows_control,
+                   total_val_no_treat=total_val_no_treat, total_val_no_control=total_val_no_control)
 
-    def fit_r(self, rows_treat, labels_treat, rows_control, labels_control, curr_depth=0, node=None,
-              val_rows_treat=None, val_labels_treat=None, val_rows_control=None, val_labels_control=None,
+    def fit_r(self, rows_treat, rows_control, val_rows_treat, val_rows_control,
               total_val_no_treat=None, total_val_no_control=None):
-        if rows_treat.shape[0] == 0:
-            return node
-
-        if curr_depth > self.tree_depth:
-            self.tree_depth = curr_depth
-
-        if self.max_depth == curr_depth:
+        """ Grows the tree from self.root level by level. The splits of all nodes of a level are searched in n_jobs
+            worker processes, which share the validation samples and calibration scores of the root and get each
+            node as index arrays into them.
+        """
+        rows = np.concatenate([rows_treat, rows_control])
+        column_count = rows.shape[1]
+        search = SplitSearch(val_rows_treat, val_rows_control,
+                             self.root.cal_scores_treat[0], self.root.cal_scores_control[0],
+                             self.root.est_treat_treat - self.root.est_treat_control,
+                             self.root.est_control_treat - self.root.est_control_control,
+                             [candidate_values(rows[:, col], self.split_bins) for col in range(column_count)],
+                             total_val_no_treat + total_val_no_control, self.min_size,
+                             self.significance, self.sig_for_split, self.weight)
+
+        pool = Pool(self.n_jobs, initializer=init_split_worker, initargs=(search,)) if self.n_jobs > 1 else None
+        try:
+            frontier = [self.root]
+            while frontier:
+                self.tree_depth = max(self.tree_depth, frontier[0].node_depth)
+                growing = [node for node in frontier if node.node_depth != self.max_depth]
+
+                tasks = [(node.val_idx_treat, node.val_idx_control, node.obj, col)
+                         for node in growing for col in range(column_count)]
+                if pool is not None:
+                    results = pool.map(search_split_worker, tasks)
+                else:
+                    results = [search.best_split(*task) for task in tasks]
+
+                frontier = []
+                for i, node in enumerate(growing):
+                    best_gain = 0.0
+                    best_attribute = None
+                    for col, (gain, value) in enumerate(results[i * column_count:(i + 1) * column_count]):
+                        if gain > best_gain:
+                            best_gain = gain
+                            best_attribute = [col, float(value)]
+
+                    if best_attribute is not None:
+                        col, value = best_attribute
+                        tb_idx_treat = node.val_idx_treat[val_rows_treat[node.val_idx_treat, col] >= value]
+                        fb_idx_treat = node.val_idx_treat[val_rows_treat[node.val_idx_treat, col] < value]
+                        tb_idx_control = node.val_idx_control[val_rows_control[node.val_idx_control, col] >= value]
+                        fb_idx_control = node.val_idx_control[val_rows_control[node.val_idx_control, col] < value]
+
+                        tb = self.get_subgroup(tb_idx_treat, tb_idx_control, val_rows_treat, val_rows_control,
+                                               total_val_no_treat, total_val_no_control, node.node_depth + 1)
+                        fb = self.get_subgroup(fb_idx_treat, fb_idx_control, val_rows_treat, val_rows_control,
+                                               total_val_no_treat, total_val_no_control, node.node_depth + 1)
+
+                        # criterion
+                        best_gain = node.obj - tb.split_obj - fb.split_obj
+
+                    if best_gain > self.gamma * node.obj:
+                        node.col = best_attribute[0]
+                        node.value = best_attribute[1]
+                        node.true_branch = tb
+                        node.false_branch = fb
+                        frontier += [tb, fb]
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+
+        self.number_leaves(self.root)
+
+    def number_leaves(self, node):
+        # depth first, as the leaves are numbered and the objective is updated in the order of the recursive tree
+        if node.true_branch is None:
             # node leaf number
             self.num_leaves += 1
             # add node leaf number to node class
             node.leaf_num = self.num_leaves
             node.leaf = True
-            return node
-
-        best_gain = 0.0
-        best_attribute = None
-
-        best_tb_obj = 0.0
-        best_fb_obj = 0.0
-
-        best_tb_intv_len = 0.0
-        best_fb_intv_len = 0.0
-
-        best_tb_homo = 0.0
-        best_fb_homo = 0.0
+        else:
+            self.curr_leaves = self.curr_leaves + 1
+            self.obj = self.obj - node.obj + node.true_branch.split_obj + node.false_branch.split_obj
+            self.number_leaves(node.true_branch)
+            self.number_leaves(node.false_branch)
+
+    def get_subgroup(self, val_idx_treat, val_idx_control, val_rows_treat, val_rows_control,
+                     total_val_no_treat, total_val_no_control, node_depth):
+        root = self.root
+        cal_scores_treat = {0: root.cal_scores_treat[0][val_idx_treat]}
+        cal_scores_control = {0: root.cal_scores_control[0][val_idx_control]}
+
+        val_set = np.concatenate([val_rows_treat[val_idx_treat], val_rows_control[val_idx_control]])
+        val_set_est_treat_treat = root.est_treat_treat[val_idx_treat]
+        val_set_est_control_treat = root.est_control_treat[val_idx_control]
+        val_set_est_treat = np.concatenate([val_set_est_treat_treat, val_set_est_control_treat])
+        val_set_est_treat_control = root.est_treat_control[val_idx_treat]
+        val_set_est_control_control = root.est_control_control[val_idx_control]
+        val_set_est_control = np.concatenate([val_set_est_treat_control, val_set_est_control_control])
+
+        intv_treat = root.conf_pred_treat.predict_given_scores(val_set,
+                                                               significance=self.significance,
+                                                               cal_scores=cal_scores_treat,
+                                                               est_input=val_set_est_treat)
+        intv_control = root.conf_pred_control.predict_given_scores(val_set,
+                                                                   significance=self.significance,
+                                                                   cal_scores=cal_scores_control,
+                                                                   est_input=val_set_est_control)
+        intv = self.get_TE_CI(intv_treat, intv_control)
+        intv_len = np.mean(intv[:, 1] - intv[:, 0])
 
-        curr_depth += 1
+        intv_treat_split = root.conf_pred_treat.predict_given_scores(val_set,
+                                                                     significance=self.sig_for_split,
+                                                                     cal_scores=cal_scores_treat,
+                                                                     est_input=val_set_est_treat)
+        intv_control_split = root.conf_pred_control.predict_given_scores(val_set,
+                                                                         significance=self.sig_for_split,
+                                                                         cal_scores=cal_scores_control,
+                                                                         est_input=val_set_est_control)
+        intv_split = self.get_TE_CI(intv_treat_split, intv_control_split)
 
-        column_count = rows_treat.shape[1]
-        rows = np.concatenate([rows_treat, rows_control])
-        for col in range(0, column_count):
-            # unique values
-            unique_vals = np.unique(rows[:, col])
-
-            for value in unique_vals:
-                # binary treatment splitting
-                (tb_val_set_treat, fb_val_set_treat,
-                 tb_val_y_treat, fb_val_y_treat,
-                 tb_val_idx_treat, fb_val_idx_treat) = \
-                    divide_set(val_rows_treat, val_labels_treat, col, value)
-                (tb_val_set_control, fb_val_set_control,
-                 tb_val_y_control, fb_val_y_control,
-                 tb_val_idx_control, fb_val_idx_control) = \
-                    divide_set(val_rows_control, val_labels_control, col, value)
-
-                if tb_val_set_treat.shape[0] < self.min_size or tb_val_set_control.shape[0] < self.min_size or \
-                        fb_val_set_treat.shape[0] < self.min_size or fb_val_set_control.shape[0] < self.min_size:
-                    continue
-                if tb_val_set_treat.shape[0] == 0 or tb_val_set_control.shape[0] == 0 \
-                        or fb_val_set_treat.shape[0] == 0 or fb_val_set_control.shape[0] == 0:
-                    continue
-
-                tb_cal_scores_treat = {0: node.cal_scores_treat[0][tb_val_idx_treat]}
-                tb_cal_scores_control = {0: node.cal_scores_control[0][tb_val_idx_control]}
-
-                tb_val_set = np.concatenate([tb_val_set_treat, tb_val_set_control])
-                tb_val_set_est_treat_treat = node.est_treat_treat[tb_val_idx_treat]
-                tb_val_set_est_control_treat = node.est_control_treat[tb_val_idx_control]
-                tb_val_set_est_treat = np.concatenate([tb_val_set_est_treat_treat, tb_val_set_est_control_treat])
-                tb_val_set_est_treat_control = node.est_treat_control[tb_val_idx_treat]
-                tb_val_set_est_control_control = node.est_control_control[tb_val_idx_control]
-                tb_val_set_est_control = np.concatenate([tb_val_set_est_treat_control, tb_val_set_est_control_control])
-                tb_intv_treat = node.conf_pred_treat.predict_given_scores(tb_val_set,
-                                                                          significance=self.significance,
-                                                                          cal_scores=tb_cal_scores_treat,
-                                                                          est_input=tb_val_set_est_treat)
-                tb_intv_control = node.conf_pred_control.predict_given_scores(tb_val_set,
-                                                                              significance=self.significance,
-                                                                              cal_scores=tb_cal_scores_control,
-                                                                              est_input=tb_val_set_est_control)
-                tb_intv = self.get_TE_CI(tb_intv_treat, tb_intv_control)
-                tb_intv_len = np.mean(tb_intv[:, 1] - tb_intv[:, 0])
-
-                tb_intv_treat_split = node.conf_pred_treat.predict_given_scores(tb_val_set,
-                                                                                significance=self.sig_for_split,
-                                                                                cal_scores=tb_cal_scores_treat,
-                                                                                est_input=tb_val_set_est_treat)
-                tb_intv_control_split = node.conf_pred_control.predict_given_scores(tb_val_set,
-                                                                                    significance=self.sig_for_split,
-                                                                                    cal_scores=tb_cal_scores_control,
-                                                                                    est_input=tb_val_set_est_control)
-                tb_intv_split = self.get_TE_CI(tb_intv_treat_split, tb_intv_control_split)
-                tb_intv_len_split = np.mean(tb_intv_split[:, 1] - tb_intv_split[:, 0])
-
-                tb_val_est = tb_val_set_est_treat - tb_val_set_est_control
-                tb_est_mean = float(np.mean(tb_val_est))
-
-                fb_cal_scores_treat = {0: node.cal_scores_treat[0][fb_val_idx_treat]}
-                fb_cal_scores_control = {0: node.cal_scores_control[0][fb_val_idx_control]}
-
-                fb_val_set = np.concatenate([fb_val_set_treat, fb_val_set_control])
-                fb_val_set_est_treat_treat = node.est_treat_treat[fb_val_idx_treat]
-                fb_val_set_est_control_treat = node.est_control_treat[fb_val_idx_control]
-                fb_val_set_est_treat = np.concatenate([fb_val_set_est_treat_treat, fb_val_set_est_control_treat])
-                fb_val_set_est_treat_control = node.est_treat_control[fb_val_idx_treat]
-                fb_val_set_est_control_control = node.est_control_control[fb_val_idx_control]
-                fb_val_set_est_control = np.concatenate([fb_val_set_est_treat_control, fb_val_set_est_control_control])
-
-                fb_intv_treat = node.conf_pred_treat.predict_given_scores(fb_val_set,
-                                                                          significance=self.significance,
-                                                                          cal_scores=fb_cal_scores_treat,
-                                                                          est_input=fb_val_set_est_treat)
-                fb_intv_control = node.conf_pred_control.predict_given_scores(fb_val_set,
-                                                                              significance=self.significance,
-                                                                              cal_scores=fb_cal_scores_control,
-                                                                              est_input=fb_val_set_est_control)
-                fb_intv = self.get_TE_CI(fb_intv_treat, fb_intv_control)
-                fb_intv_len = np.mean(fb_intv[:, 1] - fb_intv[:, 0])
-
-                fb_intv_treat_split = node.conf_pred_treat.predict_given_scores(fb_val_set,
-                                                                                significance=self.sig_for_split,
-                                                                                cal_scores=fb_cal_scores_treat,
-                                                                                est_input=fb_val_set_est_treat)
-                fb_intv_control_split = node.conf_pred_control.predict_given_scores(fb_val_set,
-                                                                                    significance=self.sig_for_split,
-                                                                                    cal_scores=fb_cal_scores_control,
-                                                                                    est_input=fb_val_set_est_control)
-                fb_intv_split = self.get_TE_CI(fb_intv_treat_split, fb_intv_control_split)
-                fb_intv_len_split = np.mean(fb_intv_split[:, 1] - fb_intv_split[:, 0])
-
-                fb_val_est = fb_val_set_est_treat - fb_val_set_est_control
-                fb_est_mean = float(np.mean(fb_val_est))
-
-                tb_obj, tb_intv_measure, tb_homogeneity, tb_obj_real = \
-                    self.eval_func(tb_intv, tb_intv_split, tb_est_mean, total_val_no_treat, total_val_no_control)
-                fb_obj, fb_intv_measure, fb_homogeneity, fb_obj_real = \
-                    self.eval_func(fb_intv, fb_intv_split, fb_est_mean, total_val_no_treat, total_val_no_control)
-
-                # criterion
-                gain = node.obj - tb_obj - fb_obj
-
-                if gain > best_gain:
-                    best_gain = gain
-                    best_attribute = [col, value]
-                    best_tb_obj, best_fb_obj = tb_obj, fb_obj
-                    best_tb_obj_real, best_fb_obj_real = tb_obj_real, fb_obj_real
-                    best_tb_intv_len, best_fb_intv_len = tb_intv_len, fb_intv_len
-                    best_tb_homo, best_fb_homo = tb_homogeneity, fb_homogeneity
-                    best_tb_set_treat, best_fb_set_treat = tb_val_set_treat, fb_val_set_treat
-                    best_tb_y_treat, best_fb_y_treat = tb_val_y_treat, fb_val_y_treat
-                    best_tb_set_control, best_fb_set_control = tb_val_set_control, fb_val_set_control
-                    best_tb_y_control, best_fb_y_control = tb_val_y_control, fb_val_y_control
-                    best_tb_val_est_treat_treat, best_fb_val_est_treat_treat = tb_val_set_est_treat_treat, fb_val_set_est_treat_treat
-                    best_tb_val_est_treat_control, best_fb_val_est_treat_control = tb_val_set_est_treat_control, fb_val_set_est_treat_control
-                    best_tb_val_est_control_treat, best_fb_val_est_control_treat = tb_val_set_est_control_treat, fb_val_set_est_control_treat
-                    best_tb_val_est_control_control, best_fb_val_est_control_control = tb_val_set_est_control_control, fb_val_set_est_control_control
-                    best_tb_cal_scores_treat, best_fb_cal_scores_treat = tb_cal_scores_treat, fb_cal_scores_treat
-                    best_tb_cal_scores_control, best_fb_cal_scores_control = tb_cal_scores_control, fb_cal_scores_control
-
-        if best_gain > self.gamma * node.obj:
-            node.col = best_attribute[0]
-            node.value = best_attribute[1]
+        val_est = val_set_est_treat - val_set_est_control
+        est_mean = float(np.mean(val_est))
 
-            self.curr_leaves = self.curr_leaves + 1
+        obj, intv_measure, homogeneity, obj_real = \
+            self.eval_func(intv, intv_split, est_mean, total_val_no_treat, total_val_no_control)
 
-            self.obj = self.obj - node.obj + best_tb_obj + best_fb_obj
-
-            tb = self.Node(obj=best_tb_obj_real, homogeneity=best_tb_homo, intv_len=best_tb_intv_len,
-                           est_treat_treat=best_tb_val_est_treat_treat, est_treat_control=best_tb_val_est_treat_control,
-                           est_control_treat=best_tb_val_est_control_treat,
-                           est_control_control=best_tb_val_est_control_control,
-                           conf_pred_treat=node.conf_pred_treat,
-                           confl_pred_control=node.conf_pred_control,
-                           cal_scores_treat=best_tb_cal_scores_treat, cal_scores_control=best_tb_cal_scores_control,
-                           node_depth=curr_depth)
-            fb = self.Node(obj=best_fb_obj_real, homogeneity=best_fb_homo, intv_len=best_fb_intv_len,
-                           est_treat_treat=best_fb_val_est_treat_treat, est_treat_control=best_fb_val_est_treat_control,
-                           est_control_treat=best_fb_val_est_control_treat,
-                           est_control_control=best_fb_val_est_control_control,
-                           conf_pred_treat=node.conf_pred_treat,
-                           confl_pred_control=node.conf_pred_control,
-                           cal_scores_treat=best_fb_cal_scores_treat, cal_scores_control=best_fb_cal_scores_control,
-                           node_depth=curr_depth)
-
-            node.true_branch = self.fit_r(rows_treat, labels_treat, rows_control, labels_control,
-                                          curr_depth=curr_depth, node=tb,
-                                          val_rows_treat=best_tb_set_treat, val_labels_treat=best_tb_y_treat,
-                                          val_rows_control=best_tb_set_control, val_labels_control=best_tb_y_control,
-                                          total_val_no_treat=total_val_no_treat,
-                                          total_val_no_control=total_val_no_control)
-            node.false_branch = self.fit_r(rows_treat, labels_treat, rows_control, labels_control,
-                                           curr_depth=curr_depth, node=fb,
-                                           val_rows_treat=best_fb_set_treat, val_labels_treat=best_fb_y_treat,
-                                           val_rows_control=best_fb_set_control, val_labels_control=best_fb_y_control,
-                                           total_val_no_treat=total_val_no_treat,
-                                           total_val_no_control=total_val_no_control)
-
-            return node
-        else:
-            # node leaf number
-            self.num_leaves += 1
-            # add node leaf number to node class
-            node.leaf_num = self.num_leaves
-            node.leaf = True
-            return node
+        subgroup = self.Node(obj=obj_real, homogeneity=homogeneity, intv_len=intv_len,
+                             est_treat_treat=val_set_est_treat_treat, est_treat_control=val_set_est_treat_control,
+                             est_control_treat=val_set_est_control_treat,
+                             est_control_control=val_set_est_control_control,
+                             conf_pred_treat=root.conf_pred_treat,
+                             confl_pred_control=root.conf_pred_control,
+                             cal_scores_treat=cal_scores_treat, cal_scores_control=cal_scores_control,
+                             val_idx_treat=val_idx_treat, val_idx_control=val_idx_control,
+                             node_depth=node_depth)
+        # objective of the subgroup in the splitting criterion, weighted by its share of the validation samples
+        subgroup.split_obj = obj
+
+        return subgroup
 
     def conf_homo(self, intv, intv_homo, est_mean, total_val_no_treat, total_val_no_control):
         num_samples = intv.shape[0]
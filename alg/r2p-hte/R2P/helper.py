@@ -62,7 +62,7 @@ class RegressorNc_r2p(RegressorNc):
         if significance:
             intervals = np.zeros((x.shape[0], 2))
             err_dist = self.err_func.apply_inverse(nc, significance)
-            err_dist = np.hstack([err_dist] * n_test)
+            err_dist = np.tile(err_dist, (1, n_test))
             if prediction.ndim > 1:  # CQR
                 intervals[:, 0] = prediction[:, 0] - err_dist[0, :]
                 intervals[:, 1] = prediction[:, -1] + err_dist[1, :]
@@ -78,7 +78,7 @@ class RegressorNc_r2p(RegressorNc):
 
             for i, s in enumerate(significance):
                 err_dist = self.err_func.apply_inverse(nc, s)
-                err_dist = np.hstack([err_dist] * n_test)
+                err_dist = np.tile(err_dist, (1, n_test))
                 err_dist *= norm
 
                 intervals[:, 0, i] = prediction - err_dist[0, :]
@@ -88,6 +88,13 @@ class RegressorNc_r2p(RegressorNc):
 
 
 class IcpRegressor_r2p(IcpRegressor):
+    def get_condition_map(self, x):
+        # all samples share the calibration scores of category 0 unless a condition is given
+        if not self.conditional:
+            return np.zeros(x.shape[0], dtype=int)
+        return np.array([self.condition((x[i, :], None))
+                         for i in range(x.shape[0])])
+
     def predict(self, x, significance=None, est_input=None):
         n_significance = (99 if significance is None
                           else np.array(significance).size)
@@ -97,8 +104,7 @@ class IcpRegressor_r2p(IcpRegressor):
         else:
             prediction = np.zeros((x.shape[0], 2))
 
-        condition_map = np.array([self.condition((x[i, :], None))
-                                  for i in range(x.shape[0])])
+        condition_map = self.get_condition_map(x)
 
         for condition in self.categories:
             idx = condition_map == condition
@@ -123,8 +129,7 @@ class IcpRegressor_r2p(IcpRegressor):
         else:
             prediction = np.zeros((x.shape[0], 2))
 
-        condition_map = np.array([self.condition((x[i, :], None))
-                                  for i in range(x.shape[0])])
+        condition_map = self.get_condition_map(x)
 
         for condition in self.categories:
             idx = condition_map == condition
@@ -0,0 +1,198 @@
+import numpy as np
+
+
+class PrefixOrderTree:
+    """ Merge-sort tree over values in a fixed order. For many prefixes at once, it counts and sums the values of
+        the first c entries above a threshold and finds their k-th largest value, with one vectorised search per
+        tree level.
+    """
+
+    def __init__(self, values):
+        self.n = values.shape[0]
+        order = np.argsort(values, kind='stable')
+        self.sorted_values = values[order]
+        self.sorted_sums = np.concatenate([[0.0], np.cumsum(self.sorted_values)])
+        ranks = np.empty(self.n, dtype=np.int64)
+        ranks[order] = np.arange(self.n)
+
+        # level l sorts every aligned block of 2 ** l entries by rank
+        self.levels = []
+        positions = np.arange(self.n)
+        level = 0
+        while (1 << level) <= self.n:
+            keys = (positions >> level) * self.n + ranks
+            key_order = np.argsort(keys, kind='stable')
+            self.levels.append((keys[key_order], np.concatenate([[0.0], np.cumsum(values[key_order])])))
+            level += 1
+
+    def count_sum_ge_rank(self, c, rank):
+        """ Number and sum of the values of rank >= rank among the first c entries.
+        """
+        c = np.asarray(c, dtype=np.int64)
+        rank = np.broadcast_to(np.asarray(rank, dtype=np.int64), c.shape)
+        count = np.zeros(c.shape, dtype=np.int64)
+        total = np.zeros(c.shape)
+        for level, (keys, sums) in enumerate(self.levels):
+            used = ((c >> level) & 1) == 1
+            if not np.any(used):
+                continue
+            block = c[used] >> (level + 1) << 1
+            end = np.minimum((block + 1) << level, self.n)
+            start = np.searchsorted(keys, block * self.n + rank[used], side='left')
+            count[used] += end - start
+            total[used] += sums[end] - sums[start]
+        return count, total
+
+    def count_sum_greater(self, c, threshold):
+        """ Number and sum of the values > threshold among the first c entries.
+        """
+        return self.count_sum_ge_rank(c, np.searchsorted(self.sorted_values, threshold, side='right'))
+
+    def count_sum_less(self, c, threshold):
+        """ Number and sum of the values < threshold among the first c entries.
+        """
+        count, total = self.count_sum_ge_rank(c, np.searchsorted(self.sorted_values, threshold, side='left'))
+        return c - count, self.prefix_sums(c) - total
+
+    def prefix_sums(self, c):
+        return self.count_sum_ge_rank(c, 0)[1]
+
+    def kth_largest(self, c, k, complement=False):
+        """ k-th largest value among the first c entries, or among the last n - c entries if complement.
+        """
+        c = np.asarray(c, dtype=np.int64)
+        low = np.zeros(c.shape, dtype=np.int64)
+        high = np.full(c.shape, self.n, dtype=np.int64)
+        # largest rank r with at least k values of rank >= r
+        while np.any(high - low > 1):
+            middle = (low + high) >> 1
+            count = self.count_sum_ge_rank(c, middle)[0]
+            if complement:
+                count = self.n - middle - count
+            enough = count >= k
+            low = np.where(enough, middle, low)
+            high = np.where(enough, high, middle)
+        return self.sorted_values[low]
+
+
+def conformal_rank(n, significance):
+    """ Rank (from the largest) of the calibration score returned by AbsErrorErrFunc.apply_inverse for n scores.
+    """
+    border = np.floor(significance * (n + 1)).astype(np.int64) - 1
+    return np.clip(border, 0, n - 1) + 1
+
+
+def candidate_values(column, split_bins=None):
+    """ Split thresholds of a column: its unique values, or at most split_bins of its quantiles.
+    """
+    values = np.unique(column)
+    if split_bins is not None and values.shape[0] > split_bins:
+        column = np.sort(column)
+        values = np.unique(column[(np.arange(split_bins) * column.shape[0]) // split_bins])
+    return values
+
+
+def split_gains(values, x_treat, x_control, cal_scores_treat, cal_scores_control, est_treat, est_control,
+                node_obj, total_val_no, min_size, significance, sig_for_split, weight):
+    """ Gain of the splits x >= value of one column, for every value, from one sort of the node's validation rows.
+
+        est_treat and est_control are the CATE estimates of the treated and control validation rows. Mirrors
+        the conformal intervals of IcpRegressor_r2p.predict_given_scores with AbsErrorErrFunc and R2P_HTE.conf_homo,
+        for which the width of the CATE interval is constant on a subgroup. Splits with a subgroup smaller than
+        min_size have gain -inf.
+    """
+    order_treat = np.argsort(-x_treat, kind='stable')
+    order_control = np.argsort(-x_control, kind='stable')
+    order = np.argsort(-np.concatenate([x_treat, x_control]), kind='stable')
+
+    n_treat, n_control = x_treat.shape[0], x_control.shape[0]
+    tb_treat = n_treat - np.searchsorted(np.sort(x_treat), values, side='left')
+    tb_control = n_control - np.searchsorted(np.sort(x_control), values, side='left')
+    fb_treat, fb_control = n_treat - tb_treat, n_control - tb_control
+
+    gains = np.full(values.shape[0], -np.inf)
+    valid = np.minimum(np.minimum(tb_treat, tb_control), np.minimum(fb_treat, fb_control)) >= max(min_size, 1)
+    if not np.any(valid):
+        return gains
+    tb_treat, tb_control, fb_treat, fb_control = tb_treat[valid], tb_control[valid], fb_treat[valid], fb_control[valid]
+
+    scores_treat = PrefixOrderTree(cal_scores_treat[order_treat])
+    scores_control = PrefixOrderTree(cal_scores_control[order_control])
+    tau = PrefixOrderTree(np.concatenate([est_treat, est_control])[order])
+    tau_sum, tau_count = tau.sorted_sums[-1], tau.n
+
+    def objective(c_treat, c_control, complement):
+        def score_quantile(tree, c, sig):
+            n = tree.n - c if complement else c
+            return tree.kth_largest(c, conformal_rank(n, sig), complement)
+
+        width = 2 * (score_quantile(scores_treat, c_treat, significance) +
+                     score_quantile(scores_control, c_control, significance))
+        half_width_split = score_quantile(scores_treat, c_treat, sig_for_split) + \
+            score_quantile(scores_control, c_control, sig_for_split)
+
+        c = c_treat + c_control
+        count = tau_count - c if complement else c
+        est_mean = (tau_sum - tau.prefix_sums(c) if complement else tau.prefix_sums(c)) / count
+
+        # sum of the CATE estimates outside [est_mean - half_width_split, est_mean + half_width_split]
+        upper = est_mean + half_width_split
+        lower = est_mean - half_width_split
+        count_upper, sum_upper = tau.count_sum_greater(c, upper)
+        count_lower, sum_lower = tau.count_sum_less(c, lower)
+        if complement:
+            all_upper = tau_count - np.searchsorted(tau.sorted_values, upper, side='right')
+            all_lower = np.searchsorted(tau.sorted_values, lower, side='left')
+            count_upper, sum_upper = all_upper - count_upper, tau_sum - tau.sorted_sums[tau_count - all_upper] - sum_upper
+            count_lower, sum_lower = all_lower - count_lower, tau.sorted_sums[all_lower] - sum_lower
+        homogeneity = (sum_upper - count_upper * upper + count_lower * lower - sum_lower) / total_val_no
+
+        return weight * count * width / total_val_no + (1 - weight) * homogeneity
+
+    gains[valid] = node_obj - objective(tb_treat, tb_control, False) - objective(tb_treat, tb_control, True)
+    return gains
+
+
+class SplitSearch:
+    """ Validation samples, calibration scores and CATE estimates of the root, shared by all nodes of the tree.
+        A node is given by the indices of its treated and control validation samples.
+    """
+
+    def __init__(self, x_treat, x_control, cal_scores_treat, cal_scores_control, est_treat, est_control,
+                 candidates, total_val_no, min_size, significance, sig_for_split, weight):
+        self.x_treat = x_treat
+        self.x_control = x_control
+        self.cal_scores_treat = cal_scores_treat
+        self.cal_scores_control = cal_scores_control
+        self.est_treat = est_treat
+        self.est_control = est_control
+        self.candidates = candidates
+        self.total_val_no = total_val_no
+        self.min_size = min_size
+        self.significance = significance
+        self.sig_for_split = sig_for_split
+        self.weight = weight
+
+    def best_split(self, idx_treat, idx_control, node_obj, col):
+        """ Largest gain of the splits of the node on column col (the first threshold if tied) and its threshold.
+        """
+        values = self.candidates[col]
+        gains = split_gains(values, self.x_treat[idx_treat, col], self.x_control[idx_control, col],
+                            self.cal_scores_treat[idx_treat], self.cal_scores_control[idx_control],
+                            self.est_treat[idx_treat], self.est_control[idx_control],
+                            node_obj, self.total_val_no, self.min_size,
+                            self.significance, self.sig_for_split, self.weight)
+        best = int(np.argmax(gains))
+        return gains[best], values[best]
+
+
+_split_search = None
+
+
+def init_split_worker(split_search):
+    global _split_search
+    _split_search = split_search
+
+
+def search_split_worker(task):
+    return _split_search.best_split(*task)
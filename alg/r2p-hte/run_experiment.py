@@ -21,6 +21,10 @@ def get_parser():
     parser.add_argument('--miscoverage', required=False, type=float, default=0.05, help='target miscoverage rate')
     parser.add_argument('--weight', required=False, type=float, default=0.5, help='weight parameter (lambda)')
     parser.add_argument('--gamma', required=False, type=float, default=0.05, help='weight parameter (lambda)')
+    parser.add_argument('--split_bins', required=False, type=int, default=None,
+                        help='number of quantile thresholds per feature for splitting (default: all unique values)')
+    parser.add_argument('--n_jobs', required=False, type=int, default=1,
+                        help='number of worker processes searching the splits of the partition')
 
     return parser
 
@@ -54,7 +58,9 @@ def main(args=None):
                                max_depth=args.max_depth,
                                significance=args.miscoverage,
                                weight=args.weight,
-                               gamma=args.gamma)
+                               gamma=args.gamma,
+                               split_bins=args.split_bins,
+                               n_jobs=args.n_jobs)
                 util.update_output_dict(output, R2P, r2p_predict, name="R2P")
                 util.update_output_dict(output, R2P_Root, r2p_predict_root, name="R2P-Root")
 
@@ -112,37 +112,44 @@ class avril():
     def train(self,iters=1000,batch_size=64,l_rate=1e-4):
 
         init_fun, update_fun, get_params = optimizers.adam(l_rate)
-        update_fun = jit(update_fun)
-        get_params = jit(get_params)
 
-        params = self.params
+        # the dataset stays on the device, every epoch is shuffled and run in a single compiled scan
+        inputs = np.asarray(self.inputs)
+        targets = np.asarray(self.targets)
 
-        param_state = init_fun(params)
+        len_x = len(inputs)
+        num_batches = int(onp.ceil(len_x / batch_size))
+        num_tiles = int(onp.ceil(num_batches * batch_size / len_x))
 
-        loss_grad = jit(value_and_grad(self.elbo))
+        loss_grad = value_and_grad(self.elbo)
 
-        len_x = len(self.inputs[:,0,:])
-        num_batches = np.ceil(len_x / batch_size)
+        def step(carry,indxes):
+            param_state,itr,key = carry
+            lik,g_params = loss_grad(get_params(param_state),key,inputs[indxes],targets[indxes])
+            param_state = update_fun(itr,g_params,param_state)
+            return (param_state,itr+1,key),lik
+
+        def epoch(param_state,itr,key,num_steps):
+            # the last batch is filled up with the first indices of the permutation
+            indx_list_shuffle = np.tile(random.permutation(key,len_x),num_tiles)[:num_batches*batch_size]
+            batches = indx_list_shuffle.reshape((num_batches,batch_size))[:num_steps]
+            (param_state,itr,_),liks = jax.lax.scan(step,(param_state,itr,key),batches)
+            return param_state,itr,liks
+
+        epoch = jit(epoch,static_argnums=3)
 
-        indx_list = np.array(range(len_x))
+        param_state = init_fun(self.params)
+        itr = 0
 
         key = self.key
 
-        for itr in tqdm(range(iters)):
-    
-            if itr%num_batches == 0:
-                indx_list_shuffle = jax.random.permutation(key,indx_list)
-    
-            indx = int((itr%num_batches)*batch_size)
-            indxes = indx_list_shuffle[indx:(batch_size+indx)]
-            
+        for ep in tqdm(range(int(onp.ceil(iters / num_batches)))):
+
             key,subkey = random.split(key)
 
-            lik,g_params = loss_grad(params,key,inputs[indxes],targets[indxes])
-    
-            param_state = update_fun(itr,g_params,param_state)
-    
-            params = get_params(param_state)
+            param_state,itr,liks = epoch(param_state,itr,subkey,min(num_batches,iters-ep*num_batches))
+
+        params = get_params(param_state)
 
         self.e_params = params[0]
         self.q_params = params[1]
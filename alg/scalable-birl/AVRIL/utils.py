@@ -14,27 +14,15 @@ def load_data(env,num_trajs=None):
     if num_trajs is not None:
         data_trajs = data_trajs[:num_trajs]
 
-    state_next_state = []
-    action_next_action = []
-
+    # (state, next_state) and (action, next_action) pairs are the shifted trajectories
     s_dim = data_trajs[0][0][0].shape[1]
-    for traj in data_trajs:
-
-        for t in range(len(traj)-1):
-            s_n_s = onp.zeros((2,s_dim))
-            s_n_s[0,:] = traj[t][0]
-            s_n_s[1,:] = traj[t+1][0]
-            state_next_state.append(s_n_s)
-        
-            a_n_a = onp.zeros((2,1))
-            a_n_a[0] = traj[t][1]
-            a_n_a[1] = traj[t+1][1]
-            action_next_action.append(a_n_a)
-        
-    state_next_state = onp.array(state_next_state)
+    states = [onp.array([step[0] for step in traj]).reshape((len(traj),s_dim)) for traj in data_trajs]
+    actions = [onp.array([step[1] for step in traj]).reshape((len(traj),1)) for traj in data_trajs]
+
+    state_next_state = onp.concatenate([onp.stack((s[:-1],s[1:]),axis=1) for s in states])
     state_next_state = np.array(state_next_state)
 
-    action_next_action = onp.array(action_next_action)
+    action_next_action = onp.concatenate([onp.stack((a[:-1],a[1:]),axis=1) for a in actions]).astype(float)
     action_next_action = np.array(action_next_action)
 
     a_dim = (action_next_action.max() + 1).astype(np.int32)
@@ -0,0 +1,267 @@
+# Copyright (c) 2019, Ahmed M. Alaa
+# Licensed under the BSD 3-clause license (see LICENSE.txt)
+
+"""
+Vectorised objective and gradients for the Kolmogorov-style Symbolic_Metamodel.
+
+The metamodel is f(X) = s / (s + exp(-sum_v g_v(X_v))), where every inner function g_v is the Taylor polynomial
+sum_j t_j(theta_v) (X_v - midpoint)^j of a Meijer G-function. Only the Taylor coefficients depend on the parameters,
+so the loss and its gradient are computed over the whole batch with matrix products: the coefficients and their
+parameter derivatives dt/dtheta_v are obtained once per parameter vector from the vectorised Meijer-G backend,
+and the powers (X_v - midpoint)^j are computed once per batch. The chain rule through the Taylor polynomial and the
+loss is exact; dt/dtheta_v itself is a central difference, as the derivatives of a Meijer G-function with respect to
+its poles and zeros have no closed form in general.
+
+Gradients of a final symbolic expression with respect to its inputs are derived once with sympy and compiled
+to numpy functions of the whole input array.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import numpy as np
+from scipy.optimize import minimize
+from concurrent.futures import ProcessPoolExecutor
+
+from sympy import diff, lambdify, re, hyper, meijerg
+
+from pysymbolic.models.special_functions import MeijerG
+
+
+def taylor_coefficients(theta, order, approximation_order=15, midpoint=0.5):
+
+    """
+    Taylor coefficients of the Meijer G-function with parameters theta, or NaN if they cannot be evaluated.
+    """
+
+    G = MeijerG(theta=list(theta), order=order, approximation_order=approximation_order)
+
+    try:
+
+        return np.real(G.taylor_coefficients(midpoint))
+
+    except Exception:
+
+        return np.full(approximation_order + 1, np.nan)
+
+
+def finite_difference_taylor_jacobian(theta, order, approximation_order=15, midpoint=0.5, h=1e-4):
+
+    """
+    Returns the Taylor coefficients t (K + 1,) of the Meijer G-function with parameters theta and their derivatives
+    dt/dtheta (K + 1, len(theta)), by central differences of the float64 coefficients. As in eval_one_dimension,
+    a function that cannot be evaluated is replaced by zero.
+    """
+
+    theta  = np.asarray(theta, dtype=float)
+    coeffs = taylor_coefficients(theta, order, approximation_order, midpoint)
+
+    if not np.all(np.isfinite(coeffs)):
+
+        return np.zeros(approximation_order + 1), np.zeros((approximation_order + 1, len(theta)))
+
+    shifts = np.eye(len(theta)) * h
+    jac    = np.array([taylor_coefficients(theta + shift, order, approximation_order, midpoint) -
+                       taylor_coefficients(theta - shift, order, approximation_order, midpoint) for shift in shifts]).T / (2 * h)
+
+    return coeffs, np.where(np.isfinite(jac), jac, 0)
+
+
+class KolmogorovObjective:
+
+    """
+    Loss of the Kolmogorov metamodel on a fixed batch (X, f_true) and its gradient with respect to the flat
+    parameter vector theta = [theta_1, ..., theta_d, theta_out], laid out as in get_theta_parameters. The outer
+    function does not enter the metamodel (see combine_inner_outer), so its gradient is zero.
+    """
+
+    def __init__(self, X, f_true, Orders_in, Orders_out, init_scale, loss_type='mean_square_error',
+                 approximation_order=15, midpoint=0.5):
+
+        self.X                   = X
+        self.f_true              = None if f_true is None else np.asarray(f_true).reshape((-1,))
+        self.Orders_in           = Orders_in
+        self.Orders_out          = Orders_out
+        self.init_scale          = float(np.asarray(init_scale).reshape((-1,))[0])
+        self.loss_type           = loss_type
+        self.approximation_order = approximation_order
+        self.midpoint            = midpoint
+
+        sizes                    = [Orders_in[k][2] + Orders_in[k][3] + 1 for k in range(X.shape[1])]
+        self.offsets             = np.cumsum([0] + sizes)
+        self.num_params          = self.offsets[-1] + Orders_out[0][2] + Orders_out[0][3] + 1
+
+        # (X_v - midpoint)^j for every sample, input and power: n, d, K + 1
+        self.powers              = (X[:, :, np.newaxis] - midpoint) ** np.arange(approximation_order + 1)
+
+    def inner_index(self, v):
+
+        return np.arange(self.offsets[v], self.offsets[v + 1])
+
+    def inner_term(self, theta_v, v, jacobian=True):
+
+        """
+        Values g_v (n,) of the v-th inner function and, if jacobian, their derivatives (n, len(theta_v)).
+        """
+
+        if jacobian:
+
+            coeffs, jac = finite_difference_taylor_jacobian(theta_v, self.Orders_in[v], self.approximation_order, self.midpoint)
+
+            return np.dot(self.powers[:, v, :], coeffs), np.dot(self.powers[:, v, :], jac)
+
+        coeffs = taylor_coefficients(theta_v, self.Orders_in[v], self.approximation_order, self.midpoint)
+        coeffs = coeffs if np.all(np.isfinite(coeffs)) else np.zeros(self.approximation_order + 1)
+
+        return np.dot(self.powers[:, v, :], coeffs)
+
+    def predict_from_inner(self, g_sum):
+
+        return self.init_scale / (self.init_scale + np.exp(-1 * g_sum))
+
+    def loss_from_inner(self, g_sum):
+
+        """
+        Returns the loss and its derivative with respect to each sample's sum of inner functions.
+        """
+
+        f_est  = self.predict_from_inner(g_sum)
+        df_dg  = f_est * (1 - f_est)
+
+        if self.loss_type == 'mean_square_error':
+
+            loss_  = np.mean((self.f_true - f_est)**2)
+            dloss  = -1 * 2 * (self.f_true - f_est) * df_dg
+
+        elif self.loss_type == 'cross_entropy':
+
+            loss_  = np.mean(-1 * (self.f_true * np.log(f_est) + (1 - self.f_true) * np.log(1 - f_est)))
+            dloss  = -1 * (self.f_true - f_est) / ((1 - f_est) * f_est) * df_dg
+
+        return loss_, dloss / len(g_sum)
+
+    def inner_sum(self, theta):
+
+        theta = np.asarray(theta, dtype=float).reshape((-1,))
+
+        return sum([self.inner_term(theta[self.inner_index(v)], v, jacobian=False) for v in range(self.X.shape[1])])
+
+    def predict(self, theta):
+
+        return self.predict_from_inner(self.inner_sum(theta)).reshape((-1, 1))
+
+    def loss(self, theta):
+
+        return self.loss_from_inner(self.inner_sum(theta))[0]
+
+    def loss_and_grad(self, theta):
+
+        theta  = np.asarray(theta, dtype=float).reshape((-1,))
+        terms  = [self.inner_term(theta[self.inner_index(v)], v) for v in range(self.X.shape[1])]
+
+        loss_, dloss = self.loss_from_inner(sum([g_v for g_v, _ in terms]))
+        grad         = np.zeros(self.num_params)
+
+        for v, (_, dg_v) in enumerate(terms):
+
+            grad[self.inner_index(v)] = np.dot(dloss, dg_v)
+
+        return loss_, grad
+
+
+def _fit_single_term(args):
+
+    objective, theta, g_rest, v, maxiter = args
+    idx                                   = objective.inner_index(v)
+
+    def fun(theta_v):
+
+        g_v, dg_v    = objective.inner_term(theta_v, v)
+        loss_, dloss = objective.loss_from_inner(g_rest + g_v)
+
+        return loss_, np.dot(dloss, dg_v)
+
+    opt = minimize(fun, theta[idx], jac=True, method='CG', options={'maxiter': maxiter})
+
+    return v, opt.x, opt.fun
+
+
+def fit_univariate_terms(objective, theta, dims=None, maxiter=5, n_jobs=1):
+
+    """
+    One backfitting sweep: every inner function g_v is fitted with CG while the other inner functions are kept
+    fixed. The univariate fits are independent and run in n_jobs processes. The updates are applied jointly if
+    they decrease the loss, otherwise only the best single-term update is kept.
+
+    Returns the new parameters and loss.
+    """
+
+    theta = np.asarray(theta, dtype=float).reshape((-1,)).copy()
+    dims  = list(range(objective.X.shape[1])) if dims is None else list(dims)
+
+    g     = np.array([objective.inner_term(theta[objective.inner_index(v)], v, jacobian=False)
+                      for v in range(objective.X.shape[1])])
+    g_sum = np.sum(g, axis=0)
+    loss_ = objective.loss_from_inner(g_sum)[0]
+    tasks = [(objective, theta, g_sum - g[v], v, maxiter) for v in dims]
+
+    if n_jobs == 1:
+
+        results = list(map(_fit_single_term, tasks))
+
+    else:
+
+        with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+
+            results = list(pool.map(_fit_single_term, tasks))
+
+    theta_joint = theta.copy()
+
+    for v, theta_v, _ in results:
+
+        theta_joint[objective.inner_index(v)] = theta_v
+
+    loss_joint = objective.loss(theta_joint)
+
+    if loss_joint <= loss_:
+
+        return theta_joint, loss_joint
+
+    v, theta_v, loss_v = min(results, key=lambda result: result[2])
+
+    if loss_v < loss_:
+
+        theta[objective.inner_index(v)] = theta_v
+        loss_                           = loss_v
+
+    return theta, loss_
+
+
+def compile_input_gradients(expr, dims_):
+
+    """
+    Derives the gradient of a symbolic expression with respect to the symbols dims_ once and compiles it.
+    The returned function maps an (n, d) array to the (n, d) array of gradients.
+    """
+
+    # the inputs are real, so re(.) commutes with differentiation and is applied to the result instead
+    expr       = expr.replace(re, lambda arg: arg)
+    gradients_ = [diff(expr, dim_) for dim_ in dims_]
+
+    if not expr.has(hyper, meijerg):
+
+        evaluator = lambdify(list(dims_), gradients_, modules=['numpy'])
+
+    else:
+
+        # hypergeometric functions have no numpy counterpart and are evaluated element-wise with mpmath
+        evaluator_mp = lambdify(list(dims_), gradients_, modules=['mpmath'])
+        evaluator    = np.vectorize(lambda *x: tuple([complex(grad_) for grad_ in evaluator_mp(*x)]),
+                                    otypes=[complex] * len(gradients_))
+
+    def gradient(X):
+
+        grads = evaluator(*[X[:, k] for k in range(X.shape[1])])
+
+        return np.real(np.array([np.broadcast_to(grad_, (X.shape[0],)) for grad_ in grads], dtype=complex)).T
+
+    return gradient
@@ -0,0 +1,91 @@
+# Copyright (c) 2019, Ahmed M. Alaa
+# Licensed under the BSD 3-clause license (see LICENSE.txt)
+
+"""
+Point-batched evaluation of candidate symbolic expressions.
+
+Instead of substituting one data point at a time into a sympy expression, every candidate is compiled once
+into a numpy function of all its input columns and evaluated on the whole data set in one call. Compiled
+functions are cached by the structure of the expression (its srepr), so structurally identical candidates
+are compiled and scored only once.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import numpy as np
+
+from sympy import lambdify, srepr, sympify
+
+from pysymbolic.utilities.performance import compute_Rsquared
+
+
+class ExpressionEvaluator:
+
+    """
+    Compiles and evaluates sympy expressions in the variables symbols_ over arrays of shape (n, len(symbols_)).
+    """
+
+    def __init__(self, symbols_, modules=['numpy']):
+
+        self.symbols_  = list(symbols_)
+        self.modules   = modules
+        self._compiled = {}
+
+    def compile(self, expr):
+
+        key = srepr(sympify(expr))
+
+        if key not in self._compiled:
+
+            self._compiled[key] = lambdify(self.symbols_, sympify(expr), modules=self.modules)
+
+        return self._compiled[key]
+
+    def evaluate(self, expr, X):
+
+        X = np.asarray(X, dtype=float).reshape((len(X), -1))
+
+        with np.errstate(all='ignore'):
+
+            Y = self.compile(expr)(*[X[:, k] for k in range(X.shape[1])])
+
+        # constant expressions return a scalar
+        return np.real(np.broadcast_to(Y, (X.shape[0],))).astype(float)
+
+    def unique(self, exprs):
+
+        """
+        Returns the structurally distinct expressions and, for every input expression, the index of its
+        representative among them.
+        """
+
+        keys     = [srepr(sympify(expr)) for expr in exprs]
+        first_   = {}
+
+        for k, key in enumerate(keys):
+
+            first_.setdefault(key, k)
+
+        uniques_ = [exprs[k] for k in first_.values()]
+        index_   = list(first_.keys())
+
+        return uniques_, [index_.index(key) for key in keys]
+
+    def score(self, exprs, X, y, metric=compute_Rsquared):
+
+        """
+        Scores every expression on (X, y), evaluating each distinct expression once. Non-finite predictions
+        get a score of -inf.
+        """
+
+        uniques_, index_ = self.unique(exprs)
+        y                = np.asarray(y, dtype=float).reshape((-1,))
+        scores_          = []
+
+        for expr in uniques_:
+
+            Y_est = self.evaluate(expr, X)
+
+            scores_.append(metric(y, Y_est) if np.all(np.isfinite(Y_est)) else -np.inf)
+
+        return np.array([scores_[k] for k in index_])
@@ -4,6 +4,7 @@
 
 
 from pysymbolic.algorithms.instancewise_feature_selection import *
+import time
 import numpy as np
 from copy import deepcopy
 from sklearn.preprocessing import PolynomialFeatures
@@ -11,6 +12,7 @@ from pysymbolic.algorithms.keras_predictive_models import *
 from pysymbolic.benchmarks.synthetic_datasets import *
 from pysymbolic.utilities.instancewise_metrics import *
 from pysymbolic.models.special_functions import MeijerG
+from pysymbolic.algorithms.differentiation import KolmogorovObjective, fit_univariate_terms, compile_input_gradients
 from mpmath import *
 from sympy import *
 from sympy.functions import re
@@ -27,7 +29,7 @@ def eval_one_dimension(Gmodel, X, midpoint=0.5):
     """ 
     try:
     
-        Gmodel.Taylor_poly_ = taylor(Gmodel.math_expr, midpoint, Gmodel.approximation_order)
+        Gmodel.Taylor_poly_ = list(Gmodel.taylor_coefficients(midpoint))
         coeffp              = Gmodel.Taylor_poly_[::-1]
     
         approx_expr         = [coeffp[k] * ((X - midpoint)**(Gmodel.approximation_order - k)) for k in range(Gmodel.approximation_order)]
@@ -43,8 +45,8 @@ def eval_one_dimension(Gmodel, X, midpoint=0.5):
 
 def eval_one_dimension_(Meijer_G_func, dim_name, vals):
 
-    evaluated = [simplify(sympify(str(re(Meijer_G_func.approx_expression()))).subs(dim_name, vals[k])).evalf() for k in range(vals.shape[0])]
-    evaluated = np.array(evaluated)
+    # the Taylor polynomial of approx_expression, evaluated for all values at once
+    evaluated = np.real(Meijer_G_func.evaluate(np.asarray(vals, dtype=float)))
     
     return evaluated 
 
@@ -157,9 +159,9 @@ def get_theta_parameters(Thetas, Orders_in, Orders_out, n_dim):
 
 
 
-def Optimize(Loss, theta_0):
+def Optimize(Loss, theta_0, jac=None):
     
-    opt       = minimize(Loss, theta_0, method='CG',  
+    opt       = minimize(Loss, theta_0, method='CG', jac=jac, 
                          options={'xtol': 1e-2, 'maxiter':1, 'eps': 0.5, 'disp': True})
     Loss_     = opt.fun
     theta_opt = opt.x
@@ -281,6 +283,8 @@ class Symbolic_Metamodel:
                  num_iter=30,
                  learning_rate= 1e-3,
                  feature_types=None,
+                 optimizer='SGD',
+                 n_jobs=1,
                  **kwargs):
         
         self.n_dim         = n_dim
@@ -290,6 +294,12 @@ class Symbolic_Metamodel:
         self.exact_grad    = False
         self.epsilon       = 1e-6
         self.feature_types = feature_types
+        self.optimizer     = optimizer
+        self.n_jobs        = n_jobs
+
+        if optimizer not in ['SGD', 'CG', 'backfitting']:
+            
+            raise ValueError("optimizer must be one of 'SGD', 'CG' or 'backfitting'")
 
         
     def fit(self, pred_model, x_train):
@@ -300,11 +310,17 @@ class Symbolic_Metamodel:
         
         self.initialize_thetas()
         
-        thetas_sgd, Losses_   = self.SGD_optimizer()
+        optimizers_           = {'SGD': self.SGD_optimizer, 
+                                 'CG': self.CG_optimizer, 
+                                 'backfitting': self.Backfitting_optimizer}
+        
+        thetas_sgd, Losses_   = optimizers_[self.optimizer]()
         self.thetas_opt       = thetas_sgd[-1]
         
         self.metamodel, dims_ = self.get_exact_Kolmogorov_expression(self.thetas_opt)
+        self.dims_            = dims_
         self.exact_pred_expr  = pred_model 
+        self.input_gradients  = None
         
     
     def get_exact_Kolmogorov_expression(self, theta):
@@ -444,25 +460,82 @@ class Symbolic_Metamodel:
             thetas_opt.append(theta_)
         
         return thetas_opt, losses_    
+    
+    
+    def CG_optimizer(self):
         
+        # a fixed batch, so that CG sees a deterministic objective with its exact gradient
+        objective_ = self.get_objective(self.get_batch())
+        losses_    = []
+        thetas_opt = []
+        
+        for _ in range(self.num_iter):
+            
+            start_time    = time.time()
+            theta_, loss_ = Optimize(objective_.loss_and_grad, 
+                                     self.theta_0 if _ == 0 else thetas_opt[-1].reshape((-1,)), jac=True)
+            
+            print("-- Search epoch: %s --- Loss: %0.5f --- Run time: %0.2f seconds ---" % (_, loss_, time.time() - start_time)) 
+            
+            losses_.append(loss_)
+            thetas_opt.append(theta_.reshape((-1,1)))
+        
+        return thetas_opt, losses_
     
-    def Loss_grad(self, theta):
-
+    
+    def Backfitting_optimizer(self):
+        
+        # every epoch fits the univariate terms g_v in parallel, each with the others kept fixed
+        objective_ = self.get_objective(self.get_batch())
+        theta_     = self.theta_0
+        dims_      = [v for v in range(self.n_dim) if v not in self.zero_locs]
+        losses_    = []
+        thetas_opt = []
+        
+        for _ in range(self.num_iter):
+            
+            start_time    = time.time()
+            theta_, loss_ = fit_univariate_terms(objective_, theta_, dims=dims_, n_jobs=self.n_jobs)
+            
+            print("-- Search epoch: %s --- Loss: %0.5f --- Run time: %0.2f seconds ---" % (_, loss_, time.time() - start_time)) 
+            
+            losses_.append(loss_)
+            thetas_opt.append(theta_.reshape((-1,1)))
+        
+        return thetas_opt, losses_
+    
+    
+    def get_batch(self):
+        
         subsamples_    = np.random.choice(list(range(self.x_train.shape[0])), 
                                           size=self.batch_size, 
                                           replace=False)
         
+        return subsamples_
+    
+    
+    def get_objective(self, subsamples_, loss_type='mean_square_error'):
+        
         x_             = self.x_train[subsamples_, :]
         x_original     = self.origin_x_train[subsamples_, :]
         
-        f_est, f_grad  = eval_Kolmogorov_gradient_only(self.init_scale,
-                                                       x_, 
-                                                       theta.reshape((-1,)),
-                                                       self.Orders_in,
-                                                       self.Orders_out,
-                                                       h=0.01)
+        if hasattr(self.pred_model, "predict_proba"):
+            
+            f_true = self.pred_model.predict_proba(x_original)[:,1].reshape((-1,1))
+            
+        else:
+            
+            f_true = self.pred_model.predict(x_original)[:,1].reshape((-1,1))
+        
+        return KolmogorovObjective(x_, f_true, self.Orders_in, self.Orders_out, self.init_scale, loss_type=loss_type)
+        
+    
+    def Loss_grad(self, theta):
+
+        subsamples_    = self.get_batch()
         
-        f_est          = f_est.reshape((-1,1))
+        x_             = self.x_train[subsamples_, :]
+        x_original     = self.origin_x_train[subsamples_, :]
         
         if hasattr(self.pred_model, "predict_proba"):
             
@@ -477,17 +550,11 @@ class Symbolic_Metamodel:
         
         loss_type = 'mean_square_error'
         
-        if loss_type == 'mean_square_error':
-            
-            loss_per_param = np.tile(-1 * 2 * (f_true - f_est), [1, f_grad.shape[1]])
-            loss_grad      = np.mean(loss_per_param * f_grad, axis=0).reshape((-1,1))
-            loss_          = np.mean((f_true - f_est)**2)
-            
-        elif loss_type == 'cross_entropy':
-            
-            loss_per_param = np.tile(- (f_true - f_est)/((1 - f_est) * f_est), [1, f_grad.shape[1]])
-            loss_grad      = np.mean(loss_per_param * f_grad, axis=0).reshape((-1,1))
-            loss_          = np.mean(-1 * (np.multiply(f_true, np.log(f_est)) + np.multiply((1 - f_true), np.log(1 - f_est)))) 
+        # gradient of the loss over the whole batch, with finite-difference Taylor coefficient derivatives,
+        # see differentiation.KolmogorovObjective
+        objective_       = KolmogorovObjective(x_, f_true, self.Orders_in, self.Orders_out, self.init_scale, loss_type=loss_type)
+        loss_, loss_grad = objective_.loss_and_grad(theta)
+        loss_grad        = loss_grad.reshape((-1,1))
             
         #loss_c     = roc_auc_score(y_true, f_est)
         #print("AUC", loss_c)
@@ -497,60 +564,43 @@ class Symbolic_Metamodel:
     
     def evaluate(self, x_in):
 
-        y_est, _  = eval_Kolmogorov_gradient_only(self.init_scale,
-                                                  self.poly.transform(x_in), 
-                                                  self.thetas_opt,
-                                                  self.Orders_in,
-                                                  self.Orders_out,
-                                                  h=0.01)
+        objective_ = KolmogorovObjective(self.poly.transform(x_in), None, self.Orders_in, self.Orders_out, self.init_scale)
+        y_est      = objective_.predict(self.thetas_opt)
+        
         return y_est
     
     def get_gradient(self, x_in):
         
-        grad_ = []
+        return self.get_instancewise_scores(x_in.reshape((1,-1))).reshape((-1,1))
+        
+    def get_instancewise_scores(self, x_in):
+        
         h     = 0.01
-        x_in  = x_in.reshape((1,-1))
         
         if self.exact_grad:
             
-            gradients_ = []
-            
-            for var in vars_:
+            # gradients of the symbolic metamodel, derived once and evaluated for all rows at once
+            if self.input_gradients is None:
                 
-                gradients_.append(diff(sym_meta_mod, var))
-
-                for k in range(x_test.shape[0]):
-                    
-                    grad_.append([gradients_[v].subs(vars_[0], x_test[k,0]).subs(vars_[1], x_test[k,1]).subs(vars_[2], x_test[k,2]).subs(vars_[3], x_test[k,3]).subs(vars_[4], x_test[k,4]).subs(vars_[5], x_test[k,5]).subs(vars_[6], x_test[k,6]).subs(vars_[7], x_test[k,7]).subs(vars_[8], x_test[k,8]).subs(vars_[9], x_test[k,9]) for v in range(len(gradients_))])
+                self.input_gradients = compile_input_gradients(self.metamodel, self.dims_)
             
-        else:
+            return np.abs(self.input_gradients(x_in))
             
-            for u in range(x_in.shape[1]):
+        # finite differences of the black-box model, all rows and features in one predict_proba call
+        n, d   = x_in.shape
+        x_in_h = np.tile(x_in, [d, 1]).reshape((d, n, d))
         
-                x_in_h       = deepcopy(x_in)
-
-                if self.feature_types is not None:
+        for u in range(d):
+            
+            if self.feature_types is not None:
                 
-                    x_in_h[0, u] = ((self.feature_types[u]=='c')*1) * (x_in_h[0, u] + h) + ((self.feature_types[u]=='b')*1) * ((x_in_h[0, u]==0)*1)     
-
-                else:
-
-                    x_in_h[0, u] = x_in_h[0, u] + h
-                    
-        
-                grad_.append(np.abs(self.exact_pred_expr.predict_proba(x_in_h)[:,1] - self.exact_pred_expr.predict_proba(x_in)[:,1])/h)
-        
-    
-        return np.array(grad_)
-        
-    def get_instancewise_scores(self, x_in):
-        
-        scores = []
-        
-        for v in range(x_in.shape[0]): 
+                x_in_h[u, :, u] = ((self.feature_types[u]=='c')*1) * (x_in_h[u, :, u] + h) + ((self.feature_types[u]=='b')*1) * ((x_in_h[u, :, u]==0)*1)
             
-            scores.append(self.get_gradient(x_in[v, :]))
+            else:
+                
+                x_in_h[u, :, u] = x_in_h[u, :, u] + h
         
+        f_h    = self.exact_pred_expr.predict_proba(x_in_h.reshape((-1, d)))[:,1].reshape((d, n))
+        f_0    = self.exact_pred_expr.predict_proba(x_in)[:,1].reshape((1, n))
         
-        return scores
-
+        return (np.abs(f_h - f_0)/h).T
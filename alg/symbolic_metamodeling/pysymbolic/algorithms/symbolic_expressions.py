@@ -21,6 +21,7 @@ if not sys.warnoptions:
 
 from pysymbolic.models.special_functions import MeijerG
 from pysymbolic.utilities.performance import compute_Rsquared
+from pysymbolic.algorithms.expression_evaluation import ExpressionEvaluator
 
 #from sympy.printing.theanocode import theano_function
 from sympy.utilities.autowrap import ufuncify
@@ -96,7 +97,7 @@ def get_symbolic_model(f, npoints, xrange):
     return symbol_exprs[best_model], R2_perf    
 
 
-def symbolic_regressor(f, npoints, xrange):
+def symbolic_regressor(f, npoints, xrange, n_candidates=1):
 
     X  = np.linspace(xrange[0], xrange[1], npoints).reshape((-1,1))
     y  = f(X)
@@ -110,7 +111,15 @@ def symbolic_regressor(f, npoints, xrange):
 
     est_gp.fit(X, y)
 
-    sym_expr = str(est_gp._program)
+    # the best program, or the n_candidates fittest programs of the last generation
+    if n_candidates == 1:
+        
+        programs = [est_gp._program]
+        
+    else:
+        
+        programs = sorted([program for program in est_gp._programs[-1] if program is not None], 
+                          key=lambda program: program.fitness_, reverse=est_gp._metric.greater_is_better)[:n_candidates]
 
     converter = {
         'sub': lambda x, y : x - y,
@@ -121,14 +130,18 @@ def symbolic_regressor(f, npoints, xrange):
         'pow': lambda x, y : x**y
     }
 
-    x, X0   = symbols('x X0')
-    sym_reg = simplify(sympify(sym_expr, locals=converter))
-    sym_reg = sym_reg.subs(X0,x)
+    x, X0      = symbols('x X0')
+    candidates = [sympify(str(program), locals=converter).subs(X0,x) for program in programs]
 
-    Y_true  = y.reshape((-1,1))
-    Y_est   = np.array([sympify(str(sym_reg)).subs(x,X[k]) for k in range(len(X))]).reshape((-1,1))
+    # all candidates are scored on all points at once, structurally identical ones only once
+    evaluator  = ExpressionEvaluator([x])
+    scores_    = evaluator.score(candidates, X, y)
+    sym_reg    = simplify(candidates[int(np.argmax(scores_))])
 
-    R2_perf = compute_Rsquared(Y_true, Y_est)
+    Y_true     = y.reshape((-1,1))
+    Y_est      = evaluator.evaluate(sym_reg, X).reshape((-1,1))
+
+    R2_perf    = compute_Rsquared(Y_true, Y_est)
 
     return sym_reg, R2_perf
 
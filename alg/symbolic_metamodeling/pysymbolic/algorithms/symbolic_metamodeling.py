@@ -12,6 +12,9 @@ import scipy as sc
 from scipy.special import digamma, gamma
 import itertools
 import copy
+import hashlib
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 
 from mpmath import *
 from sympy import *
@@ -51,13 +54,64 @@ def is_ipython():
         return False
 
 
+def basis_derivatives(a, b, z, order=3):
+    
+    """
+    Returns the derivatives d^j/dz^j, j = 0,...,order, of the basis function G^{1,2}_{2,2}(a, a; a, b | z) using its
+    closed form z^a 2F1(1, 1; a - b + 1; -z) / Gamma(a - b + 1). The arguments are numpy arrays broadcast against each other.
+    """
+    
+    gamma_ = a - b + 1
+    z      = np.asarray(z, dtype=complex)
+    derivs = []
+    
+    for j in range(order + 1):
+        
+        d_j = 0
+        
+        # Leibniz rule: the k-th derivative of 2F1(1, 1; g; -z) is (-1)^k (k!)^2 / (g)_k 2F1(1 + k, 1 + k; g + k; -z)
+        for k in range(j + 1):
+            
+            d_j = d_j + sc.special.binom(j, k) * sc.special.poch(a - j + k + 1, j - k) * (z ** (a - j + k)) * \
+                  ((-1) ** k) * (sc.special.factorial(k) ** 2) * sc.special.rgamma(gamma_ + k) * \
+                  sc.special.hyp2f1(1 + k, 1 + k, gamma_ + k, -z)
+        
+        derivs.append(d_j)
+        
+    return derivs
+
+
+def basis_taylor_coefficients(a, b, c, midpoint=0.5, approximation_order=3):
+    
+    """
+    Returns the coefficients t_0,...,t_K of the Taylor polynomial sum_j t_j (x - midpoint)^j of G^{1,2}_{2,2}(a, a; a, b | c * x),
+    i.e. the polynomial built by MeijerG.approx_expression for the metamodel basis, as an array of shape (K + 1, ...) for arrays of 
+    parameters a, b and c.
+    """
+    
+    derivs = basis_derivatives(a, b, c * midpoint, order=approximation_order)
+    coeffs = [(c ** j) * derivs[j] / sc.special.factorial(j) for j in range(approximation_order + 1)]
+    
+    return np.real(np.array(coeffs))
+
+
+def evaluate_taylor(coeffs, x, midpoint=0.5):
+    
+    return sum([coeffs[j] * ((x - midpoint) ** j) for j in range(len(coeffs))])
+
+
 def basis(a, b, c, x, hyper_order=[1, 2, 2, 2]):
     
     epsilon = 0.001
     
-    func_   = MeijerG(theta=[a, a, a, b, c], order=hyper_order, approximation_order=3)
+    if list(hyper_order) != [1, 2, 2, 2]:
+        
+        func_   = MeijerG(theta=[a, a, a, b, c], order=hyper_order, approximation_order=3)
+    
+        return func_.evaluate(x + epsilon)
     
-    return func_.evaluate(x + epsilon)
+    # compiled evaluation of MeijerG(...).evaluate, a, b and c can be arrays (one entry per column of x)
+    return evaluate_taylor(basis_taylor_coefficients(a, b, c), x + epsilon)
 
 def basis_expression(a, b, c, hyper_order=[1, 2, 2, 2]):
     
@@ -101,20 +155,21 @@ def basis_grad(a, b, c, x, hyper_order=[1, 2, 2, 2]):
 
 
 
-def tune_single_dim(lr, n_iter, x, y, verbosity=False):
+def tune_single_dim(lr, n_iter, x, y, verbosity=False, init=(2, 1, 1), seed=None):
     
     epsilon   = 0.001
     x         = x + epsilon
     
-    a         = 2
-    b         = 1
-    c         = 1
+    a         = init[0]
+    b         = init[1]
+    c         = init[2]
     
     batch_size  = np.min((x.shape[0], 500)) 
+    rng         = np.random.RandomState(seed)
     
     for u in range(n_iter):
         
-        batch_index = np.random.choice(list(range(x.shape[0])), size=batch_size)
+        batch_index = rng.choice(x.shape[0], size=batch_size)
         
         new_grads   = basis_grad(a, b, c, x[batch_index])
         func_true   = basis(a, b, c, x[batch_index])
@@ -136,12 +191,95 @@ def tune_single_dim(lr, n_iter, x, y, verbosity=False):
     return a, b, c 
 
 
+# Fitted univariate terms, shared by all metamodels in the process: _univariate_cache maps (feature hash, target hash, 
+# lr, n_iter, random_state, init) to the fitted (a, b, c). It keeps the _UNIVARIATE_CACHE_SIZE most recently used fits.
+_univariate_cache      = OrderedDict()
+_UNIVARIATE_CACHE_SIZE = 4096
+
+
+def data_hash(x):
+    
+    return hashlib.sha1(np.ascontiguousarray(x, dtype=np.float64).tobytes()).hexdigest()
+
+
+def _cache_univariate(key, abc):
+    
+    _univariate_cache[key] = abc
+    _univariate_cache.move_to_end(key)
+    
+    while len(_univariate_cache) > _UNIVARIATE_CACHE_SIZE:
+        
+        _univariate_cache.popitem(last=False)
+
+
+def _tune_single_dim_task(args):
+    
+    lr, n_iter, x, y, init, seed = args
+    
+    return tune_single_dim(lr=lr, n_iter=n_iter, x=x, y=y, init=init, seed=seed)
+
+
+def tune_features(X, y, lr=0.1, n_iter=500, n_jobs=1, random_state=0, init=None, progress=tqdm):
+    
+    """
+    Fits the univariate basis function of every column of X to y with tune_single_dim. The fits run in n_jobs 
+    processes; each column is seeded from its data hash and random_state, so the result does not depend on the 
+    column order or on n_jobs. init is an optional array of shape (X.shape[1], 3) with the starting (a, b, c) of 
+    each column, e.g. the parameters of an earlier fit to warm start from; by default every column starts from 
+    (2, 1, 1). Columns already fitted to the same target from the same start are taken from the cache.
+    
+    Returns an array of shape (X.shape[1], 3) with the parameters (a, b, c) of each column.
+    """
+    
+    y_key  = data_hash(y)
+    params = np.zeros((X.shape[1], 3))
+    tasks  = []
+    
+    for u in range(X.shape[1]):
+        
+        init_ = (2, 1, 1) if init is None else tuple([float(v) for v in init[u]])
+        x_key = data_hash(X[:, u])
+        key   = (x_key, y_key, lr, n_iter, random_state, init_)
+        
+        if key in _univariate_cache:
+            
+            _univariate_cache.move_to_end(key)
+            params[u, :] = _univariate_cache[key]
+        
+        else:
+            
+            seed = (int(x_key[:8], 16) + random_state) % (2 ** 32)
+            
+            tasks.append((u, key, (lr, n_iter, X[:, u], y, init_, seed)))
+    
+    if n_jobs == 1:
+        
+        results = map(_tune_single_dim_task, [task[2] for task in tasks])
+        
+        for (u, key, _), abc in zip(tasks, progress(results, total=len(tasks))):
+            
+            params[u, :] = abc
+            _cache_univariate(key, abc)
+    
+    else:
+        
+        with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+            
+            results = pool.map(_tune_single_dim_task, [task[2] for task in tasks])
+            
+            for (u, key, _), abc in zip(tasks, progress(results, total=len(tasks))):
+                
+                params[u, :] = abc
+                _cache_univariate(key, abc)
+    
+    return params
+
+
 def compose_features(params, X):
     
-    X_out = [basis(a=float(params[k, 0]), b=float(params[k, 1]), c=float(params[k, 2]), 
-                   x=X[:, k], hyper_order=[1, 2, 2, 2]) for k in range(X.shape[1])] 
+    X_out = basis(a=params[:, 0], b=params[:, 1], c=params[:, 2], x=X, hyper_order=[1, 2, 2, 2])
     
-    return np.array(X_out).T
+    return X_out
     
 
 class symbolic_metamodel:
@@ -172,6 +310,8 @@ class symbolic_metamodel:
         c_init                = 1.491820813243337
         
         self.params           = np.tile(np.array([a_init, b_init, c_init]), [self.num_basis, 1])
+        self._expressions     = None
+        self._tuned_params    = None
         
         if get_ipython().__class__.__name__ == 'ZMQInteractiveShell':
             
@@ -194,21 +334,16 @@ class symbolic_metamodel:
     
     def get_gradients(self, Y_true, Y_metamodel, batch_index=None):
         
-        param_grads = self.params * 0
         epsilon     = 0.001 
         
-        for k in range(self.params.shape[0]):
-            
-            a                 = float(self.params[k, 0])
-            b                 = float(self.params[k, 1])
-            c                 = float(self.params[k, 2])
-            
-            if batch_index is None:
-                grads_vals    = basis_grad(a, b, c, self.X_new[:, k] +  epsilon)
-            else:
-                grads_vals    = basis_grad(a, b, c, self.X_new[batch_index, k] +  epsilon)
-            
-            param_grads[k, :] = np.array(self.loss_grads(Y_true, Y_metamodel, grads_vals))
+        if batch_index is None:
+            X_batch = self.X_new
+        else:
+            X_batch = self.X_new[batch_index, :]
+        
+        # all basis functions at once: each gradient is an array of shape (batch, num_basis)
+        grads_vals  = basis_grad(self.params[:, 0], self.params[:, 1], self.params[:, 2], X_batch + epsilon)
+        param_grads = np.array(self.loss_grads(Y_true.reshape((-1, 1)), Y_metamodel.reshape((-1, 1)), grads_vals)).T
         
         return param_grads
         
@@ -219,26 +354,49 @@ class symbolic_metamodel:
     
     def loss_grads(self, Y_true, Y_metamodel, param_grads_x):
         
-        loss_grad_a = np.mean(2 * (Y_true - Y_metamodel) * param_grads_x[0])
-        loss_grad_b = np.mean(2 * (Y_true - Y_metamodel) * param_grads_x[1])
-        loss_grad_c = np.mean(2 * (Y_true - Y_metamodel) * param_grads_x[2])
+        loss_grad_a = np.mean(2 * (Y_true - Y_metamodel) * param_grads_x[0], axis=0)
+        loss_grad_b = np.mean(2 * (Y_true - Y_metamodel) * param_grads_x[1], axis=0)
+        loss_grad_c = np.mean(2 * (Y_true - Y_metamodel) * param_grads_x[2], axis=0)
         
         return loss_grad_a, loss_grad_b, loss_grad_c 
     
     def loss_grad_coeff(self, Y_true, Y_metamodel, param_grads_x):
         
-        loss_grad_ = np.mean(2 * (Y_true - Y_metamodel) * param_grads_x)
+        loss_grad_ = np.mean(2 * (Y_true - Y_metamodel) * param_grads_x, axis=0)
         
         return loss_grad_
         
     
-    def fit(self, num_iter=10, batch_size=100, learning_rate=.01):
+    def _init_from(self, other):
         
-        print("---- Tuning the basis functions ----")
+        # starting (a, b, c) of every column of X: the fitted term of the column of other with the same data, if any
+        if other._tuned_params is None:
+            
+            raise ValueError("init_from must be a fitted symbolic_metamodel")
         
-        for u in self.tqdm_mode(range(self.X.shape[1])):
+        fitted = {data_hash(other.X[:, u]): other._tuned_params[u] for u in range(other.X.shape[1])}
+        
+        return np.array([fitted.get(data_hash(self.X[:, u]), (2, 1, 1)) for u in range(self.X.shape[1])], dtype=float)
+    
+    def fit(self, num_iter=10, batch_size=100, learning_rate=.01, n_jobs=1, random_state=0, warm_start=False, 
+            init_from=None):
+        
+        # with warm_start, the basis functions are tuned from the parameters of this metamodel's previous fit; with 
+        # init_from, from the terms that another fitted metamodel (e.g. of another black box) found on the same columns
+        if init_from is not None:
             
-            self.params[u, :] = tune_single_dim(lr=0.1, n_iter=500, x=self.X_new[:, u], y=self.Y_r)
+            init = self._init_from(init_from)
+            
+        else:
+            
+            init = self._tuned_params if warm_start else None
+        
+        print("---- Tuning the basis functions ----")
+        
+        self._tuned_params = tune_features(self.X_new[:, :self.X.shape[1]], self.Y_r, lr=0.1, n_iter=500, 
+                                           n_jobs=n_jobs, random_state=random_state, init=init, 
+                                           progress=self.tqdm_mode)
+        self.params[:self.X.shape[1], :] = self._tuned_params
             
         self.set_equation(reset_init_model=True)
 
@@ -257,12 +415,33 @@ class symbolic_metamodel:
             param_grads  = self.get_gradients(self.Y_r[batch_index], curr_func, batch_index)
             self.params  = self.params - learning_rate * param_grads
             
-            coef_grads            = [self.loss_grad_coeff(self.Y_r[batch_index], curr_func, self.X_init[batch_index, k]) for k in range(self.X_init.shape[1])]
+            coef_grads            = self.loss_grad_coeff(self.Y_r[batch_index].reshape((-1, 1)), curr_func.reshape((-1, 1)), self.X_init[batch_index, :])
             self.init_model.coef_ = self.init_model.coef_ - learning_rate * np.array(coef_grads)
              
             self.set_equation()  
+        
+        # the symbolic expressions are only built when exact_expression or approx_expression are requested
+        self._expressions = None
+    
+    @property
+    def exact_expression(self):
+        
+        return self._get_expressions()[0]
+    
+    @property
+    def approx_expression(self):
+        
+        return self._get_expressions()[1]
+    
+    def _get_expressions(self):
+        
+        state = (self.params.tobytes(), np.asarray(self.init_model.coef_).tobytes())
+        
+        if self._expressions is None or self._expressions[0] != state:
             
-            self.exact_expression, self.approx_expression = self.symbolic_expression()
+            self._expressions = (state, self.symbolic_expression())
+        
+        return self._expressions[1]
             
     def evaluate(self, X):
         
@@ -299,15 +478,20 @@ class symbolic_metamodel:
         sym_exact   = 0
         sym_approx  = 0
         x           = symbols('x')
+        
+        # the approximate expression uses the same Taylor coefficients as the compiled evaluation
+        coeffs      = basis_taylor_coefficients(self.params[:, 0], self.params[:, 1], self.params[:, 2])
 
         for v in range(self.num_basis):
     
             f_curr      = basis_expression(a=float(self.params[v,0]), 
                                            b=float(self.params[v,1]), 
                                            c=float(self.params[v,2]))
+            
+            f_approx    = expand(sum([float(coeffs[j, v]) * ((x - 0.5) ** j) for j in range(coeffs.shape[0])]))
         
             sym_exact  += sympify(str(self.init_model.coef_[v] * re(f_curr.expression()))).subs(x, dims_[v])
-            sym_approx += sympify(str(self.init_model.coef_[v] * re(f_curr.approx_expression()))).subs(x, dims_[v])    
+            sym_approx += (float(self.init_model.coef_[v]) * f_approx).subs(x, dims_[v])    
         
         return 1/(1 + exp(-1*sym_exact)), 1/(1 + exp(-1*sym_approx))   
     
@@ -338,11 +522,26 @@ class symbolic_metamodel:
     
     
     def get_instancewise_scores(self, X_in):
+        
+        # absolute gradients of approx_expression w.r.t. each input, evaluated for all rows at once
+        X_basis  = self.feature_expander.fit_transform(X_in)
+        coeffs   = basis_taylor_coefficients(self.params[:, 0], self.params[:, 1], self.params[:, 2])
+        d_coeffs = coeffs[1:] * np.arange(1, coeffs.shape[0]).reshape((-1, 1))
+        
+        Y_r      = np.dot(evaluate_taylor(coeffs, X_basis), self.init_model.coef_)
+        Y        = 1 / (1 + np.exp(-1 * Y_r))
+        d_basis  = evaluate_taylor(d_coeffs, X_basis) * self.init_model.coef_
+        
+        powers   = self.feature_expander.powers_
+        gards_   = np.zeros(X_in.shape)
+        
+        for k in range(X_in.shape[1]):
+            
+            # derivative of the features prod_l X_l^p_l w.r.t. X_k
+            powers_k     = powers - np.eye(X_in.shape[1], dtype=int)[k] * (powers[:, k:k + 1] > 0)
+            d_features   = powers[:, k] * np.prod(X_in[:, np.newaxis, :] ** powers_k[np.newaxis, :, :], axis=2)
+            gards_[:, k] = Y * (1 - Y) * np.sum(d_basis * d_features, axis=1)
     
-        gr_exp, diff_dims, evaluator = self.get_gradient_expression()
-    
-        gards_ = [self._gradient(gr_exp, diff_dims, evaluator, X_in[k, :]) for k in range(X_in.shape[0])]
-    
-        return gards_
+        return np.abs(gards_)
     
         
@@ -0,0 +1,102 @@
+# Copyright (c) 2019, Ahmed M. Alaa
+# Licensed under the BSD 3-clause license (see LICENSE.txt)
+
+"""
+Benchmark of candidate expression scoring on the synthetic datasets: point-by-point sympy substitution vs. the
+point-batched ExpressionEvaluator. Run from the repository root with
+
+    python -m pysymbolic.benchmarks.expression_benchmark
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import time
+import numpy as np
+
+from sympy import symbols, sin, exp, Abs
+
+from pysymbolic.benchmarks.synthetic_datasets import generate_data
+from pysymbolic.algorithms.expression_evaluation import ExpressionEvaluator
+from pysymbolic.utilities.performance import compute_Rsquared
+
+
+X_ = symbols('X0:10')
+
+# logits log(p_0 / p_1) of the synthetic labels
+true_logits = {'XOR': X_[0] * X_[1],
+               'orange_skin': X_[0]**2 + X_[1]**2 + X_[2]**2 + X_[3]**2 - 4.0,
+               'nonlinear_additive': -100 * sin(0.2 * X_[0]) + Abs(X_[1]) + X_[2] + exp(-X_[3]) - 2.4}
+
+
+def candidate_expressions(datatype, n_candidates=50, seed=0):
+
+    """
+    The true logit perturbed by random terms in the first four inputs. Terms such as X_i * X_j and X_j * X_i
+    are structurally identical, so the candidate list contains duplicates, as a symbolic regression population would.
+    """
+
+    rng        = np.random.RandomState(seed)
+    unary      = [lambda e: e, sin, exp, lambda e: e**2, Abs]
+    candidates = [true_logits[datatype]]
+
+    while len(candidates) < n_candidates:
+
+        i, j   = rng.choice(4, size=2)
+        term   = [X_[i] * X_[j], X_[j] * X_[i], X_[i] + X_[j]][rng.randint(3)]
+        sign   = 1 if rng.rand() < 0.5 else -1
+
+        candidates.append(true_logits[datatype] + sign * unary[rng.randint(len(unary))](term))
+
+    return candidates
+
+
+def subs_scores(candidates, X, y):
+
+    scores_ = []
+
+    for expr in candidates:
+
+        Y_est = np.array([float(expr.subs(dict(zip(X_, X[k, :])))) for k in range(X.shape[0])])
+
+        scores_.append(compute_Rsquared(y, Y_est))
+
+    return np.array(scores_)
+
+
+def run_benchmark(datatypes=('XOR', 'orange_skin', 'nonlinear_additive'), n=1000, n_subs=100, n_candidates=50):
+
+    """
+    Scores n_candidates expressions per dataset. Substitution is timed on the first n_subs points only, the
+    compiled evaluator on the same points (for the speedup) and on all n points.
+    """
+
+    print("%-20s %10s %12s %12s %10s %14s" % ("dataset", "distinct", "subs (s)", "batched (s)", "speedup", "batched n (s)"))
+
+    for datatype in datatypes:
+
+        X, y, _    = generate_data(n=n, datatype=datatype, seed=0)
+        y          = np.log(y[:, 0] / y[:, 1])
+        candidates = candidate_expressions(datatype, n_candidates)
+
+        start_time = time.time()
+        R2_subs    = subs_scores(candidates, X[:n_subs], y[:n_subs])
+        time_subs  = time.time() - start_time
+
+        start_time = time.time()
+        R2_batched = ExpressionEvaluator(X_).score(candidates, X[:n_subs], y[:n_subs])
+        time_small = time.time() - start_time
+
+        start_time = time.time()
+        evaluator  = ExpressionEvaluator(X_)
+        evaluator.score(candidates, X, y)
+        time_full  = time.time() - start_time
+
+        assert np.allclose(R2_subs, R2_batched)
+
+        print("%-20s %5d/%-4d %12.3f %12.4f %9.1fx %14.4f" % (datatype, len(evaluator.unique(candidates)[0]), len(candidates),
+                                                                time_subs, time_small, time_subs / time_small, time_full))
+
+
+if __name__ == '__main__':
+
+    run_benchmark()
@@ -9,6 +9,7 @@ import pandas as pd
 import scipy as sc
 from scipy.special import digamma, gamma
 import itertools
+import functools
 import copy
 
 from mpmath import *
@@ -22,6 +23,215 @@ if not sys.warnoptions:
     warnings.simplefilter("ignore")
 
 
+# Vectorised evaluation backend
+# -----------------------------
+# Meijer G-functions are evaluated over whole arrays at float64 precision through the hypergeometric closed forms 
+# given by Slater's theorem [5]. Compiled kernels are cached by parameter signature. Points (or parameter signatures) 
+# outside the supported families, or where float64 evaluation is unreliable, fall back to mpmath.
+#
+# [5] DLMF, Section 16.17 (Slater's theorem) and 16.19 (derivatives). https://dlmf.nist.gov/16.17
+
+def _is_nonpositive_integer(v, tol=1e-10):
+    
+    return (v < tol) and (abs(v - np.round(v)) < tol)
+
+
+def _hypergeometric_series(a, b, z, max_terms=500, tol=1e-16, max_cancellation=1e6):
+    
+    """
+    Generalized hypergeometric series pFq(a; b; z) for a float64 array z. Points where the series does not 
+    converge, or where cancellation between the terms costs more than log10(max_cancellation) digits, are NaN.
+    """
+    
+    if len(a) > len(b) + 1:
+        
+        return np.full(z.shape, np.nan)
+    
+    if len(a) == len(b) + 1:
+        
+        z = np.where(np.abs(z) < 1, z, np.nan)
+    
+    term  = np.ones(z.shape)
+    total = np.ones(z.shape)
+    peak  = np.ones(z.shape)
+    
+    for k in range(max_terms):
+        
+        term  = term * np.prod([a_ + k for a_ in a]) / np.prod([b_ + k for b_ in b]) * z / (k + 1)
+        total = total + term
+        peak  = np.maximum(peak, np.abs(term))
+        
+        if not np.any(np.abs(term) > tol * np.abs(total)):
+            
+            break
+    
+    reliable = (np.abs(term) <= tol * np.abs(total)) & (peak <= max_cancellation * np.abs(total))
+    
+    return np.where(reliable, total, np.nan)
+
+
+def hypergeometric_pfq(a, b, z):
+    
+    """
+    Evaluates pFq(a; b; z) for a float64 array z, using the scipy implementations of 0F1, 1F1 and 2F1 and a 
+    vectorised power series otherwise. Returns NaN where the float64 value is not available.
+    """
+    
+    z = np.asarray(z, dtype=float)
+    
+    if len(a) == 0 and len(b) == 0:
+        
+        return np.exp(z)
+    
+    elif len(a) == 1 and len(b) == 0:
+        
+        return np.where(z < 1, np.abs(1 - z) ** (-a[0]), np.nan)
+    
+    elif len(a) == 0 and len(b) == 1:
+        
+        return sc.special.hyp0f1(b[0], z)
+    
+    elif len(a) == 1 and len(b) == 1:
+        
+        return sc.special.hyp1f1(a[0], b[0], z)
+    
+    elif len(a) == 2 and len(b) == 1:
+        
+        # 2F1 is continued analytically everywhere except on the branch cut [1, inf)
+        return np.where(z < 1, sc.special.hyp2f1(a[0], a[1], b[0], np.where(z < 1, z, 0)), np.nan)
+    
+    return _hypergeometric_series(a, b, z)
+
+
+def _slater_expansion(a_n, a_rest, b_m, b_rest):
+    
+    """
+    Returns the terms (b_k, constant, numerator parameters, denominator parameters) of Slater's expansion 
+    G^{m,n}_{p,q}(z) = sum_k constant_k * z^b_k * pF_{q-1}(numerator_k; denominator_k; (-1)^(p-m-n) z), or None 
+    when the expansion is not available for these parameters (m = 0, coinciding poles or Gamma function poles). 
+    """
+    
+    a_all = list(a_n) + list(a_rest)
+    b_all = list(b_m) + list(b_rest)
+    
+    if len(b_m) == 0:
+        
+        return None
+    
+    terms = []
+    
+    for k, b_k in enumerate(b_m):
+        
+        num_gamma = [b_l - b_k for l, b_l in enumerate(b_m) if l != k] + [1 + b_k - a_ for a_ in a_n]
+        den_gamma = [1 + b_k - b_ for b_ in b_rest] + [a_ - b_k for a_ in a_rest]
+        hyp_num   = [1 + b_k - a_ for a_ in a_all]
+        hyp_den   = [1 + b_k - b_l for l, b_l in enumerate(b_all) if l != k]
+        
+        if any([_is_nonpositive_integer(v) for v in num_gamma + hyp_den]):
+            
+            return None
+        
+        constant  = np.prod([sc.special.gamma(v) for v in num_gamma]) * np.prod([sc.special.rgamma(v) for v in den_gamma])
+        
+        terms.append((b_k, constant, hyp_num, hyp_den))
+    
+    return terms
+
+
+def _slater_sum(terms, sign, z):
+    
+    return sum([constant * (z ** b_k) * hypergeometric_pfq(hyp_num, hyp_den, sign * z) 
+                for b_k, constant, hyp_num, hyp_den in terms])
+
+
+def meijerg_signature(a_p, b_q):
+    
+    """
+    Hashable parameter signature ((a_1..a_n), (a_n+1..a_p), (b_1..b_m), (b_m+1..b_q)) of a Meijer G-function.
+    """
+    
+    return tuple([tuple([float(v) for v in group]) for group in [a_p[0], a_p[1], b_q[0], b_q[1]]])
+
+
+@functools.lru_cache(maxsize=1024)
+def meijerg_kernel(signature):
+    
+    """
+    Returns a vectorised function z -> Re G^{m,n}_{p,q}(a_p; b_q | z) for a parameter signature (see meijerg_signature). 
+    
+    For z > 0 the function is evaluated from Slater's expansion in z when p <= q, or in 1/z (via the inversion formula 
+    G(a_p; b_q | z) = G(1 - b_q; 1 - a_p | 1/z)) when p >= q. The remaining points are evaluated with mpmath. 
+    """
+    
+    a_n, a_rest, b_m, b_rest = signature
+    
+    m, n     = len(b_m), len(a_n)
+    p, q     = n + len(a_rest), m + len(b_rest)
+    
+    direct   = _slater_expansion(a_n, a_rest, b_m, b_rest) if p <= q else None
+    inverted = _slater_expansion([1 - v for v in b_m], [1 - v for v in b_rest], 
+                                 [1 - v for v in a_n], [1 - v for v in a_rest]) if p >= q else None
+    
+    a_p_     = [list(a_n), list(a_rest)]
+    b_q_     = [list(b_m), list(b_rest)]
+    
+    def kernel(z):
+        
+        z        = np.asarray(z, dtype=float)
+        out      = np.full(z.shape, np.nan)
+        positive = z > 0
+        
+        with np.errstate(all='ignore'):
+            
+            if direct is not None:
+            
+                out[positive] = _slater_sum(direct, (-1) ** (p - m - n), z[positive])
+            
+            if inverted is not None:
+            
+                todo      = positive & ~np.isfinite(out)
+                out[todo] = _slater_sum(inverted, (-1) ** (q - m - n), 1 / z[todo])
+        
+        for idx in np.flatnonzero(~np.isfinite(out)):
+            
+            out.flat[idx] = float(mp.re(mp.meijerg(a_p_, b_q_, z.flat[idx])))
+        
+        return out
+    
+    return kernel
+
+
+@functools.lru_cache(maxsize=1024)
+def meijerg_taylor_coefficients(signature, const, midpoint, approximation_order):
+    
+    """
+    Returns the Taylor coefficients t_0,...,t_K (in increasing order) of x -> G(a_p; b_q | const * x) around the midpoint. 
+    The derivatives are Meijer G-functions themselves: z^k d^k/dz^k G(a_p; b_q | z) = G(0, a_p; b_q, k | z), so that 
+    t_k = G(0, a_p; b_q, k | const * midpoint) / (k! midpoint^k). 
+    """
+    
+    a_n, a_rest, b_m, b_rest = signature
+    
+    z      = np.array([const * midpoint])
+    coeffs = [meijerg_kernel(signature)(z)[0]]
+    
+    for k in range(1, approximation_order + 1):
+        
+        signature_k = ((0.0,) + a_n, a_rest, b_m, b_rest + (float(k),))
+        
+        coeffs.append(meijerg_kernel(signature_k)(z)[0] / (sc.special.factorial(k) * midpoint ** k))
+    
+    return np.array(coeffs)
+
+
+@functools.lru_cache(maxsize=1024)
+def _hyperexpand_meijerg(a_p, b_q, const):
+    
+    x = Symbol('x', real=True) 
+    
+    return hyperexpand(meijerg([list(a_p[0]), list(a_p[1])], [list(b_q[0]), list(b_q[1])], const * x))
+
+
 class MeijerG:
     
     """
@@ -76,8 +286,8 @@ class MeijerG:
         """
         Sets the poles and zeros of the Meijer G-function based on the input parameters
         """
-        a_p_ = self.theta[0 : self.order[2]]
-        b_q_ = self.theta[self.order[2] : ][ : self.order[3]]
+        a_p_ = list(self.theta[0 : self.order[2]])
+        b_q_ = list(self.theta[self.order[2] : ][ : self.order[3]])
 
         self.a_p     = [a_p_[:self.order[1]], a_p_[self.order[1]:]]
         self.b_q     = [b_q_[:self.order[0]], b_q_[self.order[0]:]]
@@ -88,8 +298,8 @@ class MeijerG:
         """
         Returns a symbolic expression for the Meijer G-function encapsulated in the class.
         """
-        x         = Symbol('x', real=True) 
-        self.expr = hyperexpand(meijerg(self.a_p, self.b_q, self._const * x))  
+        signature = meijerg_signature(self.a_p, self.b_q)
+        self.expr = _hyperexpand_meijerg(signature[:2], signature[2:], float(self._const))  
     
         return self.expr 
     
@@ -104,6 +314,16 @@ class MeijerG:
 
         return mp.meijerg(a_p_, b_q_, self._const * x)
     
+    def taylor_coefficients(self, midpoint=0.5):
+        
+        """
+        Returns the coefficients of the Taylor series approximation around the midpoint in increasing order, 
+        computed by the vectorised backend (the same values as mpmath.taylor(self.math_expr, midpoint, order))
+        """
+        
+        return meijerg_taylor_coefficients(meijerg_signature(self.a_p, self.b_q), float(self._const), 
+                                           float(midpoint), self.approximation_order)
+    
     def approx_expression(self, midpoint=0.5):
         
         """
@@ -111,7 +331,7 @@ class MeijerG:
         """
         x                 = Symbol('x', real=True)
         
-        self.Taylor_poly_ = taylor(self.math_expr, midpoint, self.approximation_order)
+        self.Taylor_poly_ = list(self.taylor_coefficients(midpoint))
         self.coeffp       = self.Taylor_poly_[::-1]
         
         self.approx_expr  = 0
@@ -130,20 +350,18 @@ class MeijerG:
         """
         Evaluates the Meijer G function for the input vector X
         """
-        x     = Symbol('x', real=True) 
+        X     = np.asarray(X, dtype=float)
         
         if self.evaluation_mode=='eval':
             
-            Y = np.array(list(map(lambda z: float(meijerg(self.a_p, self.b_q, self._const * z).evalf()), list(X))))
+            kernel_ = meijerg_kernel(meijerg_signature(self.a_p, self.b_q))
+            Y       = kernel_(self._const * X)
         
         elif self.evaluation_mode in ['numpy','cython','theano']:
             
-            evaluators_ = {'numpy': lambdify([x], self.approx_expression(), modules=['math']),
-                           'cython': lambdify([x], self.approx_expression(), modules=['math']), #ufuncify([x], self.approx_expression()),
-                           'theano': lambdify([x], self.approx_expression(), modules=['math'])} #theano_function([x], [self.approx_expression()])}
-            
-            evaluater_  = evaluators_[self.evaluation_mode]
-            Y           = np.array([evaluater_(X[k]) for k in range(len(X))])
+            # the Taylor series approximation of approx_expression, evaluated over the whole array
+            midpoint = 0.5
+            Y        = np.polyval(self.taylor_coefficients(midpoint)[::-1], X - midpoint)
             
         return np.real(Y)
     
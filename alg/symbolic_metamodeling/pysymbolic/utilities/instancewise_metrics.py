@@ -29,19 +29,16 @@ def create_rank(scores, k):
     Compute rank of each feature based on weight.
     
     """
-    scores = abs(scores)
+    scores = abs(np.asarray(scores))
     n, d = scores.shape
-    ranks = []
-    for i, score in enumerate(scores):
-        # Random permutation to avoid bias due to equal weights.
-        idx = np.random.permutation(d) 
-        permutated_weights = score[idx]  
-        permutated_rank=(-permutated_weights).argsort().argsort()+1
-        rank = permutated_rank[np.argsort(idx)]
-
-        ranks.append(rank)
-
-    return np.array(ranks)
+    # Random permutation of every row to avoid bias due to equal weights, all rows at once.
+    idx = np.argsort(np.random.rand(n, d), axis = 1)
+    permutated_weights = np.take_along_axis(scores, idx, axis = 1)
+    permutated_rank = (-permutated_weights).argsort(axis = 1).argsort(axis = 1) + 1
+    ranks = np.empty_like(permutated_rank)
+    np.put_along_axis(ranks, idx, permutated_rank, axis = 1)
+
+    return ranks
 
 def compute_median_rank(scores, k, datatype_val = None):
     ranks = create_rank(scores, k)
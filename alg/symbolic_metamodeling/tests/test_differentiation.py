@@ -0,0 +1,59 @@
+import os
+import sys
+
+import numpy as np
+import sympy as sp
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from pysymbolic.algorithms.differentiation import KolmogorovObjective, finite_difference_taylor_jacobian  # noqa: E402
+
+# G^{1,0}_{0,1}(-; b | c x) = (c x)^b exp(-c x), theta = [b, c]
+ORDER = [1, 0, 0, 1]
+x, b, c = sp.symbols('x b c', positive=True)
+G_EXPR = (c * x) ** b * sp.exp(-c * x)
+
+
+def symbolic_taylor(approximation_order, midpoint):
+    return [sp.diff(G_EXPR, x, k).subs(x, midpoint) / sp.factorial(k) for k in range(approximation_order + 1)]
+
+
+def test_taylor_jacobian_matches_symbolic_gradient() -> None:
+    theta, order, midpoint = [0.7, 1.3], 6, 0.5
+    coeffs, jac = finite_difference_taylor_jacobian(theta, ORDER, order, midpoint)
+
+    values = {b: theta[0], c: theta[1]}
+    taylor = symbolic_taylor(order, midpoint)
+    expected = np.array([[float(sp.diff(t_k, p).subs(values)) for p in (b, c)] for t_k in taylor])
+
+    np.testing.assert_allclose(coeffs, [float(t_k.subs(values)) for t_k in taylor], rtol=1e-10, atol=1e-12)
+    np.testing.assert_allclose(jac, expected, rtol=1e-6, atol=1e-7)
+
+
+def test_loss_gradient_matches_symbolic_gradient() -> None:
+    rng = np.random.RandomState(0)
+    X = rng.uniform(0, 1, size=(20, 2))
+    f_true = rng.uniform(0, 1, size=20)
+    order, midpoint, scale = 4, 0.5, 0.8
+    theta = np.array([0.7, 1.3, 1.1, 0.9, 1., 1.])
+
+    objective = KolmogorovObjective(X, f_true, [ORDER, ORDER], [ORDER], np.array([scale]),
+                                    approximation_order=order, midpoint=midpoint)
+    loss, grad = objective.loss_and_grad(theta)
+
+    # the same loss built symbolically from the Taylor polynomials of both inner functions
+    params = sp.symbols('b0 c0 b1 c1')
+    taylor = symbolic_taylor(order, midpoint)
+    inner = [[t_k.subs({b: params[2 * v], c: params[2 * v + 1]}) for t_k in taylor] for v in range(2)]
+    loss_expr = 0
+    for i in range(len(f_true)):
+        g_sum = sum([t_k * (X[i, v] - midpoint) ** k for v in range(2) for k, t_k in enumerate(inner[v])])
+        loss_expr = loss_expr + (f_true[i] - scale / (scale + sp.exp(-g_sum))) ** 2 / len(f_true)
+
+    values = dict(zip(params, theta[:4]))
+    expected = [float(sp.diff(loss_expr, p).subs(values)) for p in params]
+
+    np.testing.assert_allclose(loss, float(loss_expr.subs(values)), rtol=1e-10)
+    np.testing.assert_allclose(grad[:4], expected, rtol=1e-6, atol=1e-8)
+    # the outer function does not enter the metamodel
+    np.testing.assert_array_equal(grad[4:], 0)
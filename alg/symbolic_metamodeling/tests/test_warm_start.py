@@ -0,0 +1,60 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+pytest.importorskip('xgboost')
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from sklearn.linear_model import LinearRegression  # noqa: E402
+
+import pysymbolic.algorithms.symbolic_metamodeling as symbolic_metamodeling  # noqa: E402
+
+
+def metamodel(X, y):
+    return symbolic_metamodeling.symbolic_metamodel(LinearRegression().fit(X, y), X, mode="regression")
+
+
+def test_fit_init_from_reuses_terms_of_another_black_box(monkeypatch) -> None:
+    rng = np.random.RandomState(0)
+    X = rng.uniform(0, 1, size=(100, 2))
+    first = metamodel(X, .1 * X[:, 0] + .2 * X[:, 1])
+    first.fit(num_iter=1, batch_size=10)
+
+    inits = []
+    tune_features = symbolic_metamodeling.tune_features
+
+    def recording_tune_features(*args, **kwargs):
+        inits.append(kwargs['init'])
+        return tune_features(*args, **kwargs)
+
+    monkeypatch.setattr(symbolic_metamodeling, 'tune_features', recording_tune_features)
+
+    # another black box on the same columns starts from the terms of the first
+    second = metamodel(X, .3 * X[:, 0] - .1 * X[:, 1])
+    second.fit(num_iter=1, batch_size=10, init_from=first)
+    np.testing.assert_array_equal(inits[-1], first._tuned_params)
+    assert not np.array_equal(second._tuned_params, first._tuned_params)
+
+    # terms are matched by column data, and the first metamodel can in turn start from the second
+    reordered = metamodel(X[:, ::-1], .5 - .2 * X[:, 1])
+    reordered.fit(num_iter=1, batch_size=10, init_from=second)
+    np.testing.assert_array_equal(inits[-1], second._tuned_params[::-1])
+
+    first.fit(num_iter=1, batch_size=10, init_from=second)
+    np.testing.assert_array_equal(inits[-1], second._tuned_params)
+
+
+def test_fit_init_from_unmatched_columns_start_from_default() -> None:
+    rng = np.random.RandomState(1)
+    X = rng.uniform(0, 1, size=(100, 2))
+    first = metamodel(X, .1 * X[:, 0] + .2 * X[:, 1])
+    first.fit(num_iter=1, batch_size=10)
+
+    other = metamodel(np.c_[X[:, 0], rng.uniform(0, 1, size=100)], .3 * X[:, 0])
+    np.testing.assert_array_equal(other._init_from(first), [first._tuned_params[0], [2, 1, 1]])
+
+    with pytest.raises(ValueError):
+        other._init_from(metamodel(X, .3 * X[:, 0]))
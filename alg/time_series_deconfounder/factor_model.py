@@ -13,11 +13,11 @@ logging.getLogger().setLevel(logging.INFO)
 import numpy as np
 from tqdm import tqdm
 import tensorflow as tf
-from tensorflow.contrib.rnn import LSTMCell, DropoutWrapper
+from tensorflow.contrib.rnn import LSTMCell
 from tensorflow.python.ops import rnn
 
-from utils.predictive_checks_utils import compute_test_statistic_all_timesteps
-from utils.rnn_utils import AutoregressiveLSTMCell, compute_sequence_length
+from utils.predictive_checks_utils import compute_test_statistic_all_samples
+from utils.rnn_utils import AutoregressiveLSTMCell, SampleDropoutWrapper, compute_sequence_length
 
 class FactorModel:
     def __init__(self, params, hyperparams):
@@ -43,16 +43,19 @@ class FactorModel:
         self.current_covariates = tf.placeholder(tf.float32, [None, self.max_sequence_length, self.num_covariates])
         self.target_treatments = tf.placeholder(tf.float32, [None, self.max_sequence_length, self.num_treatments])
 
+        # The network is applied to num_posterior_samples copies of the batch, each with its own dropout mask, so that
+        # one pass draws that many samples from the posterior. Training and the loss use a single copy.
+        self.num_posterior_samples = tf.placeholder_with_default(1, shape=[])
+
     def build_confounders(self, trainable_state=True):
         previous_covariates_and_treatments = tf.concat([self.previous_covariates, self.previous_treatments],
                                                        axis=-1)
         self.rnn_input = tf.concat([self.trainable_init_input, previous_covariates_and_treatments], axis=1)
         self.sequence_length = compute_sequence_length(self.rnn_input)
 
-        rnn_cell = DropoutWrapper(LSTMCell(self.rnn_hidden_units, state_is_tuple=False),
-                                  output_keep_prob=self.rnn_keep_prob,
-                                  state_keep_prob=self.rnn_keep_prob, variational_recurrent=True,
-                                  dtype=tf.float32)
+        rnn_cell = SampleDropoutWrapper(LSTMCell(self.rnn_hidden_units, state_is_tuple=False),
+                                        keep_prob=self.rnn_keep_prob, num_samples=self.num_posterior_samples,
+                                        batch_size=self.batch_size)
 
         autoregressive_cell = AutoregressiveLSTMCell(rnn_cell, self.num_confounders)
 
@@ -65,16 +68,17 @@ class FactorModel:
 
         rnn_output, _ = rnn.dynamic_rnn(
             autoregressive_cell,
-            self.rnn_input,
-            initial_state=init_state,
+            tf.tile(self.rnn_input, tf.stack([self.num_posterior_samples, 1, 1])),
+            initial_state=tf.tile(init_state, tf.stack([self.num_posterior_samples, 1])),
             dtype=tf.float32,
-            sequence_length=self.sequence_length)
+            sequence_length=tf.tile(self.sequence_length, tf.stack([self.num_posterior_samples])))
 
         # Flatten to apply same weights to all time steps.
         rnn_output = tf.reshape(rnn_output, [-1, self.num_confounders])
 
         hidden_confounders = rnn_output
-        covariates = tf.reshape(self.current_covariates, [-1, self.num_covariates])
+        covariates = tf.reshape(tf.tile(self.current_covariates, tf.stack([self.num_posterior_samples, 1, 1])),
+                                [-1, self.num_covariates])
         self.multitask_input = tf.concat([covariates, hidden_confounders], axis=-1)
 
         self.hidden_confounders = tf.reshape(hidden_confounders,
@@ -133,29 +137,30 @@ class FactorModel:
 
         return validation_loss
 
-    def compute_test_statistic(self, num_samples, target_treatments, feed_dict, predicted_mask):
-        test_statistic = np.zeros(shape=(self.max_sequence_length,))
-
-        for sample_idx in range(num_samples):
-            [treatment_probability] = self.sess.run(
-                [self.treatment_prob_predictions], feed_dict=feed_dict)
-
-            treatment_probability = np.reshape(treatment_probability, newshape=(
-                self.batch_size, self.max_sequence_length, self.num_treatments))
+    def sample_posterior(self, fetches, feed_dict, num_samples):
+        """
+        Runs fetches on num_samples posterior samples of the batch in one pass. Per-timestep outputs are returned with
+        shape (num_samples, batch_size, max_sequence_length, -1).
+        """
+        feed_dict = dict(feed_dict)
+        feed_dict[self.num_posterior_samples] = num_samples
 
-            test_statistic_sequence = compute_test_statistic_all_timesteps(target_treatments,
-                                                                           treatment_probability,
-                                                                           self.max_sequence_length, predicted_mask)
-            test_statistic += test_statistic_sequence
+        return [np.reshape(output, newshape=(num_samples, self.batch_size, self.max_sequence_length, -1))
+                for output in self.sess.run(fetches, feed_dict=feed_dict)]
 
-        test_statistic = test_statistic / num_samples
+    def compute_test_statistic(self, num_samples, target_treatments, feed_dict, predicted_mask):
+        [treatment_probability] = self.sample_posterior([self.treatment_prob_predictions], feed_dict, num_samples)
 
-        return test_statistic
+        test_statistic = compute_test_statistic_all_samples(target_treatments, treatment_probability, predicted_mask)
 
-    def eval_predictive_checks(self, dataset):
-        num_replications = 50
-        num_samples = 50
+        return np.mean(test_statistic, axis=0)
 
+    def eval_predictive_checks(self, dataset, num_replications=50, num_samples=50, chunk_size=10):
+        """
+        Posterior predictive checks. For every batch, the replicas and the samples for the test statistic of the target
+        treatments are drawn in one pass, then the samples for the test statistics of the replicas are drawn for
+        chunk_size replicas at a time, so that at most chunk_size * num_samples copies of a batch are in memory.
+        """
         p_values_over_time = np.zeros(shape=(self.max_sequence_length,))
 
         steps = 0
@@ -165,25 +170,29 @@ class FactorModel:
             feed_dict = self.build_feed_dictionary(batch_previous_covariates, batch_previous_treatments,
                                                    batch_current_covariates, batch_target_treatments)
 
-            mask = tf.sign(tf.reduce_max(tf.abs(self.rnn_input), axis=2))
-            [seq_lenghts, predicted_mask] = self.sess.run([self.sequence_length, mask], feed_dict=feed_dict)
+            predicted_mask = self.sess.run(self.mask, feed_dict=feed_dict)
             steps = steps + 1
 
+            treatment_replicas, treatment_probability = self.sample_posterior(
+                [self.treatment_realizations, self.treatment_prob_predictions], feed_dict,
+                num_replications + num_samples)
+
+            """ Compute test statistic for target """
+            test_statistic_target = np.mean(compute_test_statistic_all_samples(
+                batch_target_treatments, treatment_probability[num_replications:], predicted_mask), axis=0)
+
             """ Compute test statistics for replicas """
             test_statistic_replicas = np.zeros(shape=(num_replications, self.max_sequence_length))
-            for replication_idx in range(num_replications):
-                [treatment_replica, treatment_prob_pred] = self.sess.run(
-                    [self.treatment_realizations, self.treatment_prob_predictions], feed_dict=feed_dict)
+            for start in range(0, num_replications, chunk_size):
+                chunk = treatment_replicas[start:start + chunk_size]
 
-                treatment_replica = np.reshape(treatment_replica, newshape=(
-                    self.batch_size, self.max_sequence_length, self.num_treatments))
+                [treatment_probability] = self.sample_posterior([self.treatment_prob_predictions], feed_dict,
+                                                                len(chunk) * num_samples)
+                treatment_probability = np.reshape(treatment_probability, newshape=(
+                    len(chunk), num_samples, self.batch_size, self.max_sequence_length, self.num_treatments))
 
-                test_statistic_replicas[replication_idx] = self.compute_test_statistic(num_samples, treatment_replica,
-                                                                                       feed_dict, predicted_mask)
-
-            """ Compute test statistic for target """
-            test_statistic_target = self.compute_test_statistic(num_samples, batch_target_treatments, feed_dict,
-                                                                predicted_mask)
+                test_statistic_replicas[start:start + len(chunk)] = np.mean(compute_test_statistic_all_samples(
+                    chunk[:, np.newaxis], treatment_probability, predicted_mask), axis=1)
 
             probability = np.mean(np.less(test_statistic_replicas, test_statistic_target).astype(np.int32), axis=0)
             p_values_over_time += probability
@@ -191,7 +200,13 @@ class FactorModel:
         p_values_over_time = p_values_over_time / steps
         return p_values_over_time
 
-    def train(self, dataset_train, dataset_val, verbose=False):
+    def train(self, dataset_train, dataset_val, verbose=False, tf_device='gpu', early_stopping=None, eval_freq=10,
+              num_threads=None):
+        """
+        early_stopping(epoch, validation_loss) is called every eval_freq epochs and stops the training if it returns
+        True, in which case self.pruned is set. num_threads limits the intra-op and inter-op thread pools of the
+        session (by default tensorflow uses all cores).
+        """
         self.treatment_prob_predictions = self.build_network()
         self.treatment_realizations = tf.distributions.Bernoulli(probs=self.treatment_prob_predictions).sample()
 
@@ -199,17 +214,20 @@ class FactorModel:
         optimizer = self.get_optimizer()
 
         # Setup tensorflow
-        tf_device = 'gpu'
         if tf_device == "cpu":
             tf_config = tf.ConfigProto(log_device_placement=False, device_count={'GPU': 0})
         else:
             tf_config = tf.ConfigProto(log_device_placement=False, device_count={'GPU': 1})
             tf_config.gpu_options.allow_growth = True
+        if num_threads is not None:
+            tf_config.intra_op_parallelism_threads = num_threads
+            tf_config.inter_op_parallelism_threads = num_threads
 
         self.sess = tf.Session(config=tf_config)
         self.sess.run(tf.global_variables_initializer())
         self.sess.run(tf.local_variables_initializer())
 
+        self.pruned = False
         for epoch in tqdm(range(self.num_epochs)):
             for (batch_previous_covariates, batch_previous_treatments, batch_current_covariates,
                  batch_target_treatments) in self.gen_epoch(dataset_train):
@@ -228,6 +246,11 @@ class FactorModel:
                     logging.info(
                         "Epoch {} out of {}: Summary| Validation loss = {}".format(epoch, self.num_epochs, validation_loss))
 
+            if early_stopping is not None and (epoch + 1) % eval_freq == 0:
+                if early_stopping(epoch, self.eval_network(dataset_val)):
+                    self.pruned = True
+                    break
+
     def build_feed_dictionary(self, batch_previous_covariates, batch_previous_treatments,
                               batch_current_covariates, batch_target_treatments):
         feed_dict = {self.previous_covariates: batch_previous_covariates,
@@ -269,15 +292,8 @@ class FactorModel:
              batch_target_treatments) in self.gen_epoch(dataset):
             feed_dict = self.build_feed_dictionary(batch_previous_covariates, batch_previous_treatments,
                                                    batch_current_covariates, batch_target_treatments)
-            total_predicted_hidden_confounders = np.zeros(
-                shape=(self.batch_size, self.max_sequence_length, self.num_confounders))
-
-            for sample in range(num_samples):
-                predicted_hidden_confounders, predicted_treatment_probs = self.sess.run(
-                    [self.hidden_confounders, self.treatment_prob_predictions], feed_dict=feed_dict)
-
-                total_predicted_hidden_confounders += predicted_hidden_confounders
-            total_predicted_hidden_confounders /= num_samples
+            [predicted_hidden_confounders] = self.sample_posterior([self.hidden_confounders], feed_dict, num_samples)
+            total_predicted_hidden_confounders = np.mean(predicted_hidden_confounders, axis=0)
 
             if (batch_id == num_batches - 1):
                 batch_samples = range(dataset_size - self.batch_size, dataset_size)
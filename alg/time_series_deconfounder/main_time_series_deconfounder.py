@@ -26,6 +26,7 @@ def init_arg():
     parser.add_argument("--results_dir", default='results')
     parser.add_argument("--exp_name", default='test_tsd_gamma_0.6')
     parser.add_argument("--b_hyperparm_tuning", default=False)
+    parser.add_argument("--num_workers", default=None, type=int)
     return parser.parse_args()
 
 
@@ -52,4 +53,5 @@ if __name__ == '__main__':
                                   exp_name=args.exp_name,
                                   dataset_with_confounders_filename=dataset_with_confounders_filename,
                                   factor_model_hyperparams_file=factor_model_hyperparams_file,
-                                  b_hyperparm_tuning=args.b_hyperparm_tuning)
+                                  b_hyperparm_tuning=args.b_hyperparm_tuning,
+                                  num_workers=args.num_workers)
@@ -18,6 +18,7 @@ import numpy as np
 import logging
 import os
 import pickle
+from collections import OrderedDict
 
 ROOT_FOLDER = rmsn.configs.ROOT_FOLDER
 
@@ -401,6 +402,12 @@ def convert_to_tf_dataset(dataset_map):
     return tf_dataset
 
 
+# Processed datasets, keyed by the raw arrays they were built from and the processing flags. Raw arrays are not
+# modified in place by the scripts, a dataset that changes gets new arrays (e.g. training data merged with validation)
+_processed_data_cache = OrderedDict()
+_PROCESSED_DATA_CACHE_SIZE = 8
+
+
 def get_processed_data(raw_sim_data,
                        b_predict_actions,
                        b_use_actions_only,
@@ -417,35 +424,54 @@ def get_processed_data(raw_sim_data,
     :param b_predict_censoring: flag to package data to predict censoring locations
     :return: processed data to train specific network
     """
-    horizon = 1
-    offset = 1
+    # Processed datasets are shared by the propensity networks, encoder and decoder stages, see _processed_data_cache
+    b_use_confounders = b_use_predicted_confounders and not (b_predict_actions and b_use_actions_only)
+    confounders_key = 'confounders' if b_use_oracle_confounders else 'predicted_confounders'
+    keys = ['treatments', 'covariates', 'outcomes', 'sequence_length'] + ([confounders_key] if b_use_confounders else [])
+
+    raw_arrays = tuple(raw_sim_data[key] for key in keys)
+    cache_key = tuple(id(values) for values in raw_arrays) + (b_predict_actions, b_use_actions_only, b_use_confounders)
+    if cache_key not in _processed_data_cache:
+        if b_use_confounders and b_predict_actions:
+            print ("Using predicted confounders")
+
+        processed = _process_data(raw_sim_data['treatments'],
+                                  raw_sim_data['covariates'],
+                                  raw_sim_data[confounders_key] if b_use_confounders else None,
+                                  raw_sim_data['outcomes'],
+                                  raw_sim_data['sequence_length'],
+                                  b_predict_actions,
+                                  b_use_actions_only)
+
+        # the raw arrays are kept alive with the entry, so that their ids are not reused by other arrays
+        _processed_data_cache[cache_key] = (raw_arrays, processed)
+        while len(_processed_data_cache) > _PROCESSED_DATA_CACHE_SIZE:
+            _processed_data_cache.popitem(last=False)
+    else:
+        _processed_data_cache.move_to_end(cache_key)
+
+    # Callers add entries such as propensity weights, so each gets its own dictionary over the shared arrays
+    return dict(_processed_data_cache[cache_key][1])
 
-    # Continuous values
 
-    # Binary application
-    treatments = raw_sim_data['treatments']
-    covariates = raw_sim_data['covariates']
-    predicted_confounders = raw_sim_data['predicted_confounders']
-    dataset_outputs = raw_sim_data['outcomes']
-    sequence_lengths = raw_sim_data['sequence_length']
+def _process_data(treatments, covariates, predicted_confounders, dataset_outputs, sequence_lengths,
+                  b_predict_actions, b_use_actions_only):
 
-    if b_use_oracle_confounders:
-        predicted_confounders = raw_sim_data['confounders']
+    horizon = 1
+    offset = 1
 
     num_treatments = treatments.shape[-1]
 
     # Parcelling INPUTS
     if b_predict_actions:
         if b_use_actions_only:
-            inputs = treatments
-            inputs = inputs[:, :-offset, :]
+            inputs = treatments[:, :-offset, :]
 
             actions = inputs.copy()
 
         else:
             # Uses current covariate, to remove confounding effects between action and current value
-            if (b_use_predicted_confounders):
-                print ("Using predicted confounders")
+            if predicted_confounders is not None:
                 inputs = np.concatenate([covariates[:, 1:, ], predicted_confounders[:, 1:, ], treatments[:, :-1, ]],
                                         axis=2)
             else:
@@ -453,54 +479,45 @@ def get_processed_data(raw_sim_data,
 
             actions = inputs[:, :, -num_treatments:].copy()
 
-
     else:
-        if (b_use_predicted_confounders):
-            inputs = np.concatenate([covariates, predicted_confounders, treatments], axis=2)
+        if predicted_confounders is not None:
+            inputs = np.concatenate([covariates[:, 1:], predicted_confounders[:, 1:], treatments[:, 1:]], axis=2)
         else:
-            inputs = np.concatenate([covariates, treatments], axis=2)
-        inputs = inputs[:, 1:, :]
+            inputs = np.concatenate([covariates[:, 1:], treatments[:, 1:]], axis=2)
 
         actions = inputs[:, :, -num_treatments:].copy()
 
-
     # Parcelling OUTPUTS
     if b_predict_actions:
-        outputs = treatments
-        outputs = outputs[:, 1:, :]
-
+        outputs = treatments[:, 1:, :]
     else:
         outputs = dataset_outputs[:, 1:, :]
 
-
     # Set array alignment
-    sequence_lengths = np.array([i - 1 for i in sequence_lengths]) # everything shortens by 1
+    sequence_lengths = np.asarray(sequence_lengths) - 1  # everything shortens by 1
 
     # Remove any trajectories that are too short
-    inputs = inputs[sequence_lengths > 0, :, :]
-    outputs = outputs[sequence_lengths > 0, :, :]
-    sequence_lengths = sequence_lengths[sequence_lengths > 0]
-    actions = actions[sequence_lengths > 0, :, :]
+    keep = sequence_lengths > 0
+    inputs = inputs[keep, :, :]
+    outputs = outputs[keep, :, :]
+    actions = actions[keep, :, :]
+    sequence_lengths = sequence_lengths[keep]
 
     # Add active entires
-    active_entries = np.zeros(outputs.shape)
-
-    for i in range(sequence_lengths.shape[0]):
-        sequence_length = int(sequence_lengths[i])
-
-        if not b_predict_actions:
-            for k in range(horizon):
-                #include the censoring point too, but ignore future shifts that don't exist
-                active_entries[i, :sequence_length-k, k] = 1
-        else:
-            active_entries[i, :sequence_length, :] = 1
+    timesteps = np.arange(outputs.shape[1])[np.newaxis, :, np.newaxis]
+    if not b_predict_actions:
+        # include the censoring point too, but ignore future shifts that don't exist
+        shifts = np.arange(outputs.shape[2])[np.newaxis, np.newaxis, :]
+        active_entries = (timesteps < sequence_lengths[:, np.newaxis, np.newaxis] - shifts) & (shifts < horizon)
+    else:
+        active_entries = np.broadcast_to(timesteps < sequence_lengths[:, np.newaxis, np.newaxis], outputs.shape)
 
     return {'outputs': outputs,  # already scaled
             'scaled_inputs': inputs,
             'scaled_outputs': outputs,
             'actions': actions,
             'sequence_lengths': sequence_lengths,
-            'active_entries': active_entries
+            'active_entries': active_entries.astype(np.float64)
             }
 
 
@@ -10,6 +10,7 @@ Code Author: Ioana Bica (ioana.bica95@gmail.com)
 from scipy.special import expit
 
 import numpy as np
+import os
 
 
 class AutoregressiveSimulation:
@@ -209,56 +210,142 @@ class AutoregressiveSimulation:
         return dataset
 
 
-    def generate_dataset(self, num_patients, max_timesteps, binary_outcome=False):
-            dataset = dict()
-
-            dataset['previous_covariates'] = []
-            dataset['previous_treatments'] = []
-            dataset['covariates'] = []
-            dataset['confounders'] = []
-            dataset['treatments'] = []
-            dataset['sequence_length'] = []
-            dataset['outcomes'] = []
-
-            for patient in range(num_patients):
-                timesteps = np.random.randint(int(max_timesteps)-10, int(max_timesteps), 1)[0]
-                covariates_history, confounders_history, treatments_history = self.generate_data_single_patient(
-                    timesteps + 1)
-
-                previous_covariates = np.vstack((np.array(covariates_history[1:timesteps - 1]),
-                                                 np.zeros(shape=(max_timesteps-timesteps, self.num_covariates))))
-                previous_treatments = np.vstack((np.array(np.array(treatments_history[1:timesteps - 1])),
-                                                 np.zeros(shape=(max_timesteps-timesteps, self.num_treatments))))
-
-                covariates = np.vstack((np.array(covariates_history[1:timesteps]),
-                                        np.zeros(shape=(max_timesteps - timesteps, self.num_covariates))))
-
-                confounders = np.vstack((np.array(confounders_history[1:timesteps]),
-                                        np.zeros(shape=(max_timesteps - timesteps, self.num_confounders))))
-
-                treatments = np.vstack((np.array(treatments_history[1:timesteps]),
-                                        np.zeros(shape=(max_timesteps-timesteps, self.num_treatments))))
-
-
-                outcomes = self.gamma_y * np.mean(np.array(confounders_history[2:timesteps + 1]), axis=-1) + \
-                           (1-self.gamma_y) * np.mean(np.array(covariates_history[2:timesteps + 1]), axis=-1)
-
-                outcomes = outcomes[:, np.newaxis]
-                outcomes = np.vstack((np.array(outcomes),
-                                        np.zeros(shape=(max_timesteps-timesteps, 1))))
-
-                dataset['previous_covariates'].append(np.array(previous_covariates))
-                dataset['previous_treatments'].append(np.array(previous_treatments))
-                dataset['covariates'].append(np.array(covariates))
-                dataset['confounders'].append(np.array(confounders))
-                dataset['treatments'].append(np.array(treatments))
-                dataset['sequence_length'].append(np.array(timesteps))
-                dataset['outcomes'].append(np.array(outcomes))
+    def draw_patient_noise(self, max_timesteps):
+        # Same RandomState calls, in the same order, as generate_dataset and generate_data_single_patient. Consecutive
+        # normal draws with equal parameters are merged, and every binomial(1, p) is replaced by the uniform it consumes.
+        timesteps = np.random.randint(int(max_timesteps) - 10, int(max_timesteps), 1)[0]
+        initial_state = np.random.normal(0, 2, size=(self.num_covariates + self.num_confounders))
+
+        state_noise = np.zeros(shape=(timesteps + 1, self.num_covariates + self.num_confounders))
+        treatment_uniforms = np.zeros(shape=(timesteps + 1, self.num_treatments))
+        for t in range(timesteps + 1):
+            state_noise[t] = np.random.normal(0, 0.01, size=(self.num_covariates + self.num_confounders))
+            treatment_uniforms[t] = np.random.random_sample(self.num_treatments)
+
+        return timesteps, initial_state, state_noise, treatment_uniforms
+
+    def sample_treatments(self, treatment_probability, treatment_uniforms):
+        # binomial(1, p) draws U and returns 1 if U > q^1 for p <= 0.5, or 1 - (U > p^1) otherwise
+        q = np.where(treatment_probability <= 0.5, 1 - treatment_probability, treatment_probability)
+        qn = np.exp(np.log(q))
+        return np.where(treatment_probability <= 0.5, treatment_uniforms > qn, treatment_uniforms <= qn).astype(float)
+
+    def generate_histories(self, noise):
+        """
+        Advances all patients together. noise is the list of draw_patient_noise outputs; returns the covariates,
+        confounders and treatments histories with shape (num_patients, max history length, dim), the history of
+        patient i being valid for its first timesteps_i + 2 entries.
+        """
+        num_patients = len(noise)
+        timesteps = np.array([patient_noise[0] for patient_noise in noise])
+        history_length = np.max(timesteps) + 2
+
+        covariates = np.zeros(shape=(num_patients, history_length, self.num_covariates))
+        confounders = np.zeros(shape=(num_patients, history_length, self.num_confounders))
+        treatments = np.zeros(shape=(num_patients, history_length, self.num_treatments))
+
+        state_noise = np.zeros(shape=(num_patients, history_length - 1, self.num_covariates + self.num_confounders))
+        treatment_uniforms = np.zeros(shape=(num_patients, history_length - 1, self.num_treatments))
+        for patient, (patient_timesteps, initial_state, patient_state_noise, patient_uniforms) in enumerate(noise):
+            covariates[patient, 0] = initial_state[:self.num_covariates]
+            confounders[patient, 0] = initial_state[self.num_covariates:]
+            state_noise[patient, :patient_timesteps + 1] = patient_state_noise
+            treatment_uniforms[patient, :patient_timesteps + 1] = patient_uniforms
+
+        covariates_treatments = np.array([np.diag(c) for c in self.covariates_coefficients['treatments']])
+        covariates_covariates = np.array([np.diag(c) for c in self.covariates_coefficients['covariates']])
+        confounders_treatments = np.array(self.confounders_coefficients['treatments'])
+        confounders_confounders = np.array([np.diag(c) for c in self.confounders_coefficients['confounders']])
+
+        for t in range(history_length - 1):
+            p = min(self.p, t + 1)
+
+            covariates_treatments_sum = np.zeros(shape=(num_patients, self.num_covariates))
+            covariates_sum = np.zeros(shape=(num_patients, self.num_covariates))
+            confounders_treatments_sum = np.zeros(shape=(num_patients, self.num_confounders))
+            confounders_sum = np.zeros(shape=(num_patients, self.num_confounders))
+            for index in range(p):
+                covariates_treatments_sum += covariates_treatments[index] * treatments[:, t - index]
+                covariates_sum += covariates_covariates[index] * covariates[:, t - index]
+
+                past_treatments = treatments[:, t - index]
+                treatments_dot = past_treatments[:, 0] * confounders_treatments[index, 0]
+                for treatment in range(1, self.num_treatments):
+                    treatments_dot = treatments_dot + past_treatments[:, treatment] * confounders_treatments[index, treatment]
+                confounders_treatments_sum += treatments_dot[:, np.newaxis]
+                confounders_sum += confounders_confounders[index] * confounders[:, t - index]
+
+            covariates[:, t + 1] = np.clip(covariates_treatments_sum + covariates_sum +
+                                           state_noise[:, t, :self.num_covariates], -1, 1)
+            confounders[:, t + 1] = np.clip(confounders_treatments_sum + confounders_sum +
+                                            state_noise[:, t, self.num_covariates:], -1, 1)
+
+            p = min(self.p, t + 2)
+            average_covariates = np.zeros(shape=(num_patients, self.num_covariates))
+            average_confounders = np.zeros(shape=(num_patients, self.num_confounders))
+            for index in range(p):
+                average_covariates = average_covariates + covariates[:, t + 1 - index]
+                average_confounders = average_confounders + confounders[:, t + 1 - index]
+
+            # the treatment coefficients only weigh the own covariate and the first confounder
+            all_variables = np.concatenate((average_covariates, average_confounders), axis=-1)
+            treatment_probability = np.zeros(shape=(num_patients, self.num_treatments))
+            for treatment in range(self.num_treatments):
+                coefficients = self.treatment_coefficients[treatment]
+                nonzero = np.flatnonzero(coefficients)
+                aux_normal = all_variables[:, nonzero[0]] * coefficients[nonzero[0]]
+                for variable in nonzero[1:]:
+                    aux_normal = aux_normal + all_variables[:, variable] * coefficients[variable]
+                treatment_probability[:, treatment] = expit(30 * aux_normal)
+
+            treatments[:, t + 1] = self.sample_treatments(treatment_probability, treatment_uniforms[:, t])
+
+        return timesteps, covariates, confounders, treatments
 
+    def generate_dataset(self, num_patients, max_timesteps, binary_outcome=False):
+        noise = [self.draw_patient_noise(max_timesteps) for _ in range(num_patients)]
+        timesteps, covariates_history, confounders_history, treatments_history = self.generate_histories(noise)
 
-            for key in dataset.keys():
-                dataset[key] = np.array(dataset[key])
+        # histories start at timestep 1, history i is kept for its first timesteps_i - 1 steps and padded with zeros
+        def pad(history, length):
+            valid = np.arange(max_timesteps - 1)[np.newaxis, :] < length[:, np.newaxis]
+            history = history[:, 1:max_timesteps]
+            history = np.concatenate(
+                [history, np.zeros(shape=(num_patients, max_timesteps - 1 - history.shape[1], history.shape[2]))], axis=1)
+            return np.where(valid[:, :, np.newaxis], history, 0)
 
-            return dataset
+        dataset = dict()
+        dataset['previous_covariates'] = pad(covariates_history, timesteps - 2)[:, :max_timesteps - 2]
+        dataset['previous_treatments'] = pad(treatments_history, timesteps - 2)[:, :max_timesteps - 2]
+        dataset['covariates'] = pad(covariates_history, timesteps - 1)
+        dataset['confounders'] = pad(confounders_history, timesteps - 1)
+        dataset['treatments'] = pad(treatments_history, timesteps - 1)
+        dataset['sequence_length'] = timesteps
+
+        outcomes = self.gamma_y * np.mean(confounders_history[:, 2:], axis=-1) + \
+                   (1 - self.gamma_y) * np.mean(covariates_history[:, 2:], axis=-1)
+        dataset['outcomes'] = pad(np.concatenate([np.zeros_like(outcomes[:, :1]), outcomes], axis=1)[:, :, np.newaxis],
+                                  timesteps - 1)
 
+        return dataset
 
+    def generate_dataset_to_file(self, dataset_dir, num_patients, max_timesteps, chunk_size=1000):
+        """
+        Generates the dataset chunk_size patients at a time into one .npy file per key in dataset_dir, opened later
+        with np.load(..., mmap_mode='r'). The patients are the same as with generate_dataset.
+        """
+        if not os.path.exists(dataset_dir):
+            os.makedirs(dataset_dir)
+
+        files = dict()
+        for start in range(0, num_patients, chunk_size):
+            chunk = self.generate_dataset(min(chunk_size, num_patients - start), max_timesteps)
+            for key, values in chunk.items():
+                if key not in files:
+                    files[key] = np.lib.format.open_memmap(os.path.join(dataset_dir, key + '.npy'), mode='w+',
+                                                           dtype=values.dtype,
+                                                           shape=(num_patients,) + values.shape[1:])
+                files[key][start:start + len(values)] = values
+
+        for values in files.values():
+            values.flush()
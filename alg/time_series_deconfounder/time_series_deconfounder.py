@@ -6,22 +6,144 @@ International Conference on Machine Learning (ICML) 2020
 Last Updated Date: July 20th 2020
 Code Author: Ioana Bica (ioana.bica95@gmail.com)
 '''
+import hashlib
 import logging
+import multiprocessing
 import numpy as np
 import os
 import shutil
 
 from sklearn.model_selection import ShuffleSplit
 
-from utils.evaluation_utils import write_results_to_file
+from utils.evaluation_utils import write_results_to_file, append_results_to_file, read_appended_results_from_file
 from factor_model import FactorModel
 from rmsn.script_rnn_fit import rnn_fit
 from rmsn.script_rnn_test import rnn_test
 from rmsn.script_propensity_generation import propensity_generation
 
 
+def share_dataset(dataset):
+    shared_dataset = dict()
+    for key, array in dataset.items():
+        array = np.ascontiguousarray(array)
+        raw = multiprocessing.RawArray(np.ctypeslib.as_ctypes_type(array.dtype), array.size)
+        np.frombuffer(raw, dtype=array.dtype).reshape(array.shape)[...] = array
+        shared_dataset[key] = (raw, array.dtype.str, array.shape)
+
+    return shared_dataset
+
+
+def load_shared_dataset(shared_dataset):
+    return {key: np.frombuffer(raw, dtype=np.dtype(dtype)).reshape(shape)
+            for key, (raw, dtype, shape) in shared_dataset.items()}
+
+
+search_worker = dict()
+
+
+def init_search_worker(shared_dataset_train, shared_dataset_val, shared_validation_losses, lock, num_simulations):
+    # The datasets and the validation losses of all trials at every checkpoint live in shared memory
+    search_worker['dataset_train'] = load_shared_dataset(shared_dataset_train)
+    search_worker['dataset_val'] = load_shared_dataset(shared_dataset_val)
+    search_worker['validation_losses'] = np.frombuffer(shared_validation_losses).reshape(num_simulations, -1)
+    search_worker['lock'] = lock
+
+
+def run_search_trial(trial):
+    search, simulation, params, hyperparams, eval_freq, num_warmup_checkpoints, num_startup_trials = trial
+    validation_losses = search_worker['validation_losses']
+    validation_curve = []
+
+    def median_stopping(epoch, validation_loss):
+        # Stop if the validation loss is worse than the median of the other trials at the same checkpoint
+        checkpoint = (epoch + 1) // eval_freq - 1
+        validation_curve.append(validation_loss)
+        with search_worker['lock']:
+            validation_losses[simulation, checkpoint] = validation_loss
+            others = np.delete(validation_losses[:, checkpoint], simulation)
+            others = others[~np.isnan(others)]
+        return (checkpoint >= num_warmup_checkpoints and len(others) >= num_startup_trials and
+                validation_loss > np.median(others))
+
+    model = FactorModel(params, hyperparams)
+    # One thread per worker, the workers already occupy the cores
+    model.train(search_worker['dataset_train'], search_worker['dataset_val'], tf_device='cpu',
+                early_stopping=median_stopping, eval_freq=eval_freq, num_threads=1)
+    validation_loss = model.eval_network(search_worker['dataset_val'])
+    model.sess.close()
+
+    return {'search': search,
+            'simulation': simulation,
+            'hyperparams': hyperparams,
+            'validation_loss': validation_loss,
+            'validation_curve': validation_curve,
+            'pruned': model.pruned}
+
+
+def search_fingerprint(dataset_train, dataset_val, params, hyperparams_list, *search_settings):
+    # Identifies a search by its data and configuration, so that only trials of the same search are resumed
+    fingerprint = hashlib.sha1()
+    for dataset in (dataset_train, dataset_val):
+        for key in sorted(dataset):
+            array = np.ascontiguousarray(dataset[key])
+            fingerprint.update(repr((key, array.dtype.str, array.shape)).encode())
+            fingerprint.update(array.tobytes())
+    fingerprint.update(repr(sorted(params.items())).encode())
+    fingerprint.update(repr([sorted((key, float(value)) for key, value in hyperparams.items())
+                             for hyperparams in hyperparams_list]).encode())
+    fingerprint.update(repr(search_settings).encode())
+
+    return fingerprint.hexdigest()
+
+
+def factor_model_search(dataset_train, dataset_val, params, hyperparams_list, trials_file, num_workers=None,
+                        eval_freq=10, num_warmup_checkpoints=3, num_startup_trials=5):
+    """
+    Random search over hyperparams_list in num_workers CPU processes, each training with a single thread. Trials
+    that fall behind the median validation loss of the other trials are stopped early. Finished trials are appended
+    to trials_file, and the trials already in it for the same datasets and search configuration are skipped, so an
+    interrupted search resumes where it stopped.
+    """
+    num_simulations = len(hyperparams_list)
+    num_checkpoints = params['num_epochs'] // eval_freq
+    num_workers = num_workers or os.cpu_count()
+
+    search = search_fingerprint(dataset_train, dataset_val, params, hyperparams_list, eval_freq,
+                                num_warmup_checkpoints, num_startup_trials)
+    trials = read_appended_results_from_file(trials_file) if os.path.exists(trials_file) else []
+    trials = [trial for trial in trials if trial.get('search') == search]
+
+    shared_validation_losses = multiprocessing.RawArray('d', num_simulations * num_checkpoints)
+    validation_losses = np.frombuffer(shared_validation_losses).reshape(num_simulations, num_checkpoints)
+    validation_losses[...] = np.nan
+    for trial in trials:
+        validation_losses[trial['simulation'], :len(trial['validation_curve'])] = trial['validation_curve']
+
+    finished = set(trial['simulation'] for trial in trials)
+    pending = [(search, simulation, params, hyperparams, eval_freq, num_warmup_checkpoints, num_startup_trials)
+               for simulation, hyperparams in enumerate(hyperparams_list) if simulation not in finished]
+    if len(finished) > 0:
+        logging.info("Resuming search with {} finished trials".format(len(finished)))
+
+    if len(pending) == 0:
+        return trials
+
+    context = multiprocessing.get_context('spawn')
+    initargs = (share_dataset(dataset_train), share_dataset(dataset_val), shared_validation_losses, context.Lock(),
+                num_simulations)
+    with context.Pool(min(num_workers, len(pending)), initializer=init_search_worker, initargs=initargs) as pool:
+        for trial in pool.imap_unordered(run_search_trial, pending):
+            append_results_to_file(trials_file, trial)
+            trials.append(trial)
+            logging.info("Simulation {} out of {} {} | Validation loss: {} | Hyperparams: {}".format(
+                trial['simulation'] + 1, num_simulations, 'pruned' if trial['pruned'] else 'finished',
+                trial['validation_loss'], trial['hyperparams']))
+
+    return trials
+
+
 def train_factor_model(dataset_train, dataset_val, dataset, num_confounders, hyperparams_file,
-                       b_hyperparameter_optimisation):
+                       b_hyperparameter_optimisation, num_workers=None):
     _, length, num_covariates = dataset_train['covariates'].shape
     num_treatments = dataset_train['treatments'].shape[-1]
 
@@ -31,33 +153,35 @@ def train_factor_model(dataset_train, dataset_val, dataset, num_confounders, hyp
               'max_sequence_length': length,
               'num_epochs': 100}
 
-    hyperparams = dict()
     num_simulations = 50
-    best_validation_loss = 100
     if b_hyperparameter_optimisation:
         logging.info("Performing hyperparameter optimization")
+        hyperparams_list = []
         for simulation in range(num_simulations):
-            logging.info("Simulation {} out of {}".format(simulation + 1, num_simulations))
-
+            hyperparams = dict()
             hyperparams['rnn_hidden_units'] = np.random.choice([32, 64, 128, 256])
             hyperparams['fc_hidden_units'] = np.random.choice([32, 64, 128])
             hyperparams['learning_rate'] = np.random.choice([0.01, 0.001, 0.0001])
             hyperparams['batch_size'] = np.random.choice([64, 128, 256])
             hyperparams['rnn_keep_prob'] = np.random.choice([0.5, 0.6, 0.7, 0.8, 0.9])
+            hyperparams_list.append(hyperparams)
 
-            logging.info("Current hyperparams used for training \n {}".format(hyperparams))
-            model = FactorModel(params, hyperparams)
-            model.train(dataset_train, dataset_val)
-            validation_loss = model.eval_network(dataset_val)
+        trials_file = os.path.splitext(hyperparams_file)[0] + '_trials.txt'
+        trials = factor_model_search(dataset_train, dataset_val, params, hyperparams_list, trials_file,
+                                     num_workers=num_workers)
 
-            if (validation_loss < best_validation_loss):
-                logging.info(
-                    "Updating best validation loss | Previous best validation loss: {} | Current best validation loss: {}".format(
-                        best_validation_loss, validation_loss))
-                best_validation_loss = validation_loss
-                best_hyperparams = hyperparams.copy()
+        candidates = [trial for trial in trials if not trial['pruned']]
+        if len(candidates) == 0:
+            # Pruned trials stopped early, but they are the only ones left to choose from
+            logging.warning("All {} trials were pruned, selecting among the pruned trials".format(len(trials)))
+            candidates = trials
+        best_trial = min(sorted(candidates, key=lambda trial: trial['simulation']),
+                         key=lambda trial: trial['validation_loss'])
+        best_validation_loss = best_trial['validation_loss']
+        best_hyperparams = best_trial['hyperparams'].copy()
 
-            logging.info("Best hyperparams: \n {}".format(best_hyperparams))
+        logging.info("Best validation loss: {} | Best hyperparams: \n {}".format(best_validation_loss,
+                                                                                 best_hyperparams))
 
         write_results_to_file(hyperparams_file, best_hyperparams)
 
@@ -138,7 +262,7 @@ def train_rmsn(dataset_map, model_name, b_use_predicted_confounders):
 
 
 def test_time_series_deconfounder(dataset, num_substitute_confounders, exp_name, dataset_with_confounders_filename,
-                                  factor_model_hyperparams_file, b_hyperparm_tuning=False):
+                                  factor_model_hyperparams_file, b_hyperparm_tuning=False, num_workers=None):
     logging.basicConfig(format='%(levelname)s:%(message)s', level=logging.INFO)
 
     shuffle_split = ShuffleSplit(n_splits=1, test_size=0.1, random_state=10)
@@ -155,7 +279,8 @@ def test_time_series_deconfounder(dataset, num_substitute_confounders, exp_name,
                                                dataset,
                                                num_confounders=num_substitute_confounders,
                                                b_hyperparameter_optimisation=b_hyperparm_tuning,
-                                               hyperparams_file=factor_model_hyperparams_file)
+                                               hyperparams_file=factor_model_hyperparams_file,
+                                               num_workers=num_workers)
 
     dataset['predicted_confounders'] = predicted_confounders
     write_results_to_file(dataset_with_confounders_filename, dataset)
@@ -9,5 +9,15 @@ def append_results_to_file(filename, data):
     with open(filename, 'a+b') as handle:
         pickle.dump(data, handle, protocol=2)
 
+def read_appended_results_from_file(filename):
+    results = []
+    with open(filename, 'rb') as handle:
+        while True:
+            try:
+                results.append(pickle.load(handle))
+            except EOFError:
+                break
+    return results
+
 
 
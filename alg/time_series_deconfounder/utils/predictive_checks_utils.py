@@ -28,6 +28,23 @@ def compute_test_statistic_all_timesteps(treatment_replica, treatment_probabilit
 
 
 
+def compute_test_statistic_all_samples(treatment_replica, treatment_probability, predicted_mask):
+    """
+    Vectorised compute_test_statistic_all_timesteps for any number of leading sample dimensions: treatment_probability
+    has shape (..., batch_size, max_sequence_length, num_treatments), treatment_replica is broadcast against it and
+    predicted_mask has shape (batch_size, max_sequence_length). Returns the test statistics (..., max_sequence_length).
+    """
+    treatment_probability = np.where(treatment_replica == 0, 1 - treatment_probability, treatment_probability)
+    treatment_log_probability = np.sum(np.log(treatment_probability + 1e-5), axis=-1)
+    treatment_log_probability = np.sum(treatment_log_probability * predicted_mask, axis=-2)
+
+    mask_sum = np.sum(predicted_mask, axis=0)
+    test_statistic = treatment_log_probability / np.where(mask_sum == 0, 1, mask_sum)
+
+    return np.where(mask_sum == 0, 0, test_statistic)
+
+
+
 def compute_predictive_checks_eval_metric(p_values_over_time):
     max_timestep = np.max(np.where(p_values_over_time != 0)[0]) + 1
     p_values_over_time = p_values_over_time[:max_timestep]
@@ -32,6 +32,42 @@ class AutoregressiveLSTMCell(tf.contrib.rnn.RNNCell):
         return output, state
 
 
+class SampleDropoutWrapper(tf.contrib.rnn.RNNCell):
+    """
+    Variational dropout on the state and output of a cell, as DropoutWrapper(variational_recurrent=True), but with one
+    dropout mask per posterior sample instead of one per batch: the batch holds num_samples copies of batch_size
+    sequences and the copies of one sample share their mask.
+    """
+    def __init__(self, cell, keep_prob, num_samples, batch_size):
+        super(SampleDropoutWrapper, self).__init__()
+
+        self.cell = cell
+        self.keep_prob = keep_prob
+        self.state_noise = self.sample_noise(num_samples, batch_size, cell.state_size)
+        self.output_noise = self.sample_noise(num_samples, batch_size, cell.output_size)
+
+    @staticmethod
+    def sample_noise(num_samples, batch_size, size):
+        noise = tf.random_uniform(tf.stack([num_samples, 1, size]))
+        return tf.reshape(tf.tile(noise, [1, batch_size, 1]), [-1, size])
+
+    def dropout(self, value, noise):
+        return tf.div(value, self.keep_prob) * tf.floor(self.keep_prob + noise)
+
+    @property
+    def state_size(self):
+        return self.cell.state_size
+
+    @property
+    def output_size(self):
+        return self.cell.output_size
+
+    def call(self, inputs, state):
+        output, state = self.cell(inputs, state)
+
+        return self.dropout(output, self.output_noise), self.dropout(state, self.state_noise)
+
+
 def compute_sequence_length(sequence):
     used = tf.sign(tf.reduce_max(tf.abs(sequence), axis=2))
     length = tf.reduce_sum(used, axis=1)